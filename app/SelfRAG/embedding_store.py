@@ -0,0 +1,156 @@
+# embedding_store.py
+# -------------------------------------------------------------
+# Lưu embeddings CLIP dạng ma trận liên tục (.npy, memory-map được)
+# thay cho list dict trong clip_features.pkl
+# -------------------------------------------------------------
+
+import os
+import json
+import pickle
+import numpy as np
+
+STORE_DIR = 'app/SelfRAG/clip_store'
+LEGACY_PKL = 'app/SelfRAG/clip_features.pkl'
+META_NAME = 'meta.json'
+
+
+def _normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class EmbeddingStore:
+    """
+    Embeddings ảnh + caption của dataset SelfRAG:
+    - image_embeddings / text_embeddings: ma trận (n, dim) đã chuẩn hoá L2, float32 hoặc float16
+    - ids / captions: sidecar nhỏ trong meta.json
+    Load bằng mmap → gần như tức thì, nhiều worker process dùng chung page cache.
+    """
+
+    def __init__(self, ids, captions, image_embeddings, text_embeddings):
+        self.ids = list(ids)
+        self.captions = list(captions)
+        self.image_embeddings = image_embeddings
+        self.text_embeddings = text_embeddings
+        self._positions = {item_id: i for i, item_id in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dim(self):
+        return self.image_embeddings.shape[1] if len(self) else 0
+
+    def index_of(self, item_id):
+        return self._positions[item_id]
+
+    def rows(self):
+        """
+        Duyệt (id, caption, image_emb, text_emb) — dùng khi cần cập nhật từng item.
+        """
+        for i, item_id in enumerate(self.ids):
+            yield item_id, self.captions[i], self.image_embeddings[i], self.text_embeddings[i]
+
+    # ---------- tạo / lưu ----------
+    @classmethod
+    def from_rows(cls, rows, dtype=np.float32):
+        """
+        rows: iterable (id, caption, image_emb, text_emb) → store trong RAM (đã chuẩn hoá).
+        """
+        rows = list(rows)
+        if not rows:
+            return cls([], [], np.zeros((0, 0), dtype=dtype), np.zeros((0, 0), dtype=dtype))
+        ids, captions, image_embs, text_embs = zip(*rows)
+        return cls(
+            ids, captions,
+            np.ascontiguousarray(_normalize(np.stack(image_embs)), dtype=dtype),
+            np.ascontiguousarray(_normalize(np.stack(text_embs)), dtype=dtype),
+        )
+
+    def save(self, store_dir=STORE_DIR):
+        """
+        Ghi file .npy theo version mới rồi mới thay meta.json (atomic) → reader đang mmap
+        bản cũ không bị ảnh hưởng. Các version cũ bị xoá sau khi chuyển xong.
+        """
+        os.makedirs(store_dir, exist_ok=True)
+        old_meta = _read_meta(store_dir)
+        version = (old_meta or {}).get("version", 0) + 1
+
+        files = {}
+        for name, matrix in (("image", self.image_embeddings), ("text", self.text_embeddings)):
+            filename = f"{name}_embeddings.v{version}.npy"
+            with open(os.path.join(store_dir, filename), 'wb') as f:
+                np.save(f, np.ascontiguousarray(matrix))
+            files[name] = filename
+
+        meta = {
+            "version": version,
+            "count": len(self),
+            "dim": self.dim,
+            "dtype": str(self.image_embeddings.dtype),
+            "normalized": True,
+            "files": files,
+            "ids": self.ids,
+            "captions": self.captions,
+        }
+        tmp_path = os.path.join(store_dir, META_NAME + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(store_dir, META_NAME))
+
+        # Dọn các version cũ
+        for filename in os.listdir(store_dir):
+            if filename.endswith('.npy') and filename not in files.values():
+                os.remove(os.path.join(store_dir, filename))
+
+    @classmethod
+    def load(cls, store_dir=STORE_DIR, mmap=True):
+        """
+        Load store; mmap=True → np.load(mmap_mode='r'), không copy dữ liệu vào RAM.
+        """
+        meta = _read_meta(store_dir)
+        if meta is None:
+            raise FileNotFoundError(f"Không tìm thấy embedding store tại {store_dir}")
+        mode = 'r' if mmap else None
+        image_embs = np.load(os.path.join(store_dir, meta["files"]["image"]), mmap_mode=mode)
+        text_embs = np.load(os.path.join(store_dir, meta["files"]["text"]), mmap_mode=mode)
+        return cls(meta["ids"], meta["captions"], image_embs, text_embs)
+
+
+def _read_meta(store_dir):
+    path = os.path.join(store_dir, META_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# -------------------------------------------------------------
+# 🔁 Converter từ clip_features.pkl
+# -------------------------------------------------------------
+def read_legacy_pickle(pkl_path=LEGACY_PKL):
+    """
+    Đọc list dict cũ → iterable (id, caption, image_emb, text_emb).
+    """
+    with open(pkl_path, 'rb') as f:
+        data = pickle.load(f)
+    return [(row["id"], row["caption"], row["image_embedding"], row["text_embedding"]) for row in data]
+
+
+def convert_pickle(pkl_path=LEGACY_PKL, store_dir=STORE_DIR, dtype=np.float32):
+    store = EmbeddingStore.from_rows(read_legacy_pickle(pkl_path), dtype=dtype)
+    store.save(store_dir)
+    return store
+
+
+if __name__ == "__main__":
+    import sys
+
+    # python -m app.SelfRAG.embedding_store [clip_features.pkl] [clip_store/] [--float16]
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    dtype = np.float16 if '--float16' in sys.argv else np.float32
+    pkl_path = args[0] if len(args) > 0 else LEGACY_PKL
+    store_dir = args[1] if len(args) > 1 else STORE_DIR
+    store = convert_pickle(pkl_path, store_dir, dtype)
+    print(f"✅ Đã chuyển {len(store)} item ({np.dtype(dtype).name}) từ {pkl_path} sang {store_dir}")
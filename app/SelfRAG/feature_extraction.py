@@ -4,34 +4,61 @@
 # -------------------------------------------------------------
 
 from PIL import Image
-from sentence_transformers import SentenceTransformer
-import torch
 import os
-import pickle
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
 from tqdm import tqdm
 import numpy as np
 
+from app.SelfRAG.embedding_store import EmbeddingStore, STORE_DIR, LEGACY_PKL, read_legacy_pickle
+from app.utils.lazy import LazySingleton
+
+# -------------------------------------------------------------
+# ⚙️ Cấu hình pipeline
+# -------------------------------------------------------------
+BATCH_SIZE = int(os.getenv("CLIP_BATCH_SIZE", 32))
+DECODE_WORKERS = int(os.getenv("CLIP_DECODE_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+PREFETCH_BATCHES = int(os.getenv("CLIP_PREFETCH_BATCHES", 2))
+DECODE_MAX_SIDE = 448  # CLIP chỉ dùng 224x224 → thu nhỏ ngay trong worker cho nhẹ khi pickle
+MANIFEST_NAME = "clip_manifest.json"
+STORE_DTYPE = np.float16 if os.getenv("CLIP_STORE_DTYPE", "float32") == "float16" else np.float32
+
 # -------------------------------------------------------------
 # ⚙️ Khởi tạo model CLIP
 # -------------------------------------------------------------
-device = "cuda" if torch.cuda.is_available() else "cpu"
-model = SentenceTransformer('clip-ViT-B-32', device=device)
-print(f"🔥 Model đang chạy trên: {device.upper()}")
+# torch / sentence_transformers chỉ import khi load model lần đầu (không load lúc import):
+# worker decode ảnh chạy bằng process riêng, với spawn (Windows/macOS) chúng import lại module này.
+def _create_model(workers=0):
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    if device == "cpu":
+        # Chia core: worker decode ảnh + thread tính toán của torch không giành CPU của nhau
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) - workers))
+    model = SentenceTransformer('clip-ViT-B-32', device=device)
+    print(f"🔥 Model đang chạy trên: {device.upper()}")
+    return model
+
+
+# Load lỗi (vd. không tải được model) → không thử lại ở mỗi request
+clip_model = LazySingleton("clip", _create_model, cache_errors=True)
+
+
+def load_model(workers=DECODE_WORKERS):
+    return clip_model.get(workers)
 
 # -------------------------------------------------------------
-# 🧠 Hàm chính
+# 🗂️ Manifest: folder id → mtime/size/hash
 # -------------------------------------------------------------
-def extract_features(dataset_path='app/SelfRAG/dataset', 
-                     output_path='app/SelfRAG/clip_features.pkl'):
+def _scan_dataset(dataset_path):
     """
-    1️⃣ Duyệt tất cả ảnh trong dataset/
-    2️⃣ Đọc caption tương ứng
-    3️⃣ Dùng CLIP encode cả ảnh và caption
-    4️⃣ Lưu vector embeddings vào file .pkl
+    Liệt kê các item hợp lệ (có image.jpg + caption.txt) và fingerprint nhanh (mtime, size).
     """
-    data = []
-
-    for folder in tqdm(os.listdir(dataset_path), desc="Extracting features"):
+    items = {}
+    for folder in sorted(os.listdir(dataset_path)):
         folder_path = os.path.join(dataset_path, folder)
         if not os.path.isdir(folder_path):
             continue
@@ -43,34 +70,159 @@ def extract_features(dataset_path='app/SelfRAG/dataset',
             print(f"[⚠️] Thiếu file trong {folder_path}, bỏ qua.")
             continue
 
-        # Đọc caption
-        with open(caption_path, 'r', encoding='utf-8') as f:
-            caption = f.read().strip()
+        image_stat, caption_stat = os.stat(image_path), os.stat(caption_path)
+        items[folder] = {
+            "image_path": image_path,
+            "caption_path": caption_path,
+            "mtime": max(image_stat.st_mtime_ns, caption_stat.st_mtime_ns),
+            "size": image_stat.st_size + caption_stat.st_size,
+        }
+    return items
 
-        # Mở ảnh (chuyển về RGB để tránh lỗi)
-        try:
-            image = Image.open(image_path).convert('RGB')
-        except Exception as e:
-            print(f"[❌] Không đọc được ảnh {image_path}: {e}")
+
+def _content_hash(item):
+    digest = hashlib.sha256()
+    for path in (item["image_path"], item["caption_path"]):
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def _plan_updates(items, manifest, known_ids):
+    """
+    Chỉ chọn item mới hoặc đã đổi nội dung. mtime/size khác nhưng hash giống → chỉ cập nhật manifest.
+    """
+    todo = []
+    for folder, item in items.items():
+        old = manifest.get(folder)
+        if folder in known_ids and old and old["mtime"] == item["mtime"] and old["size"] == item["size"]:
             continue
+        item["hash"] = _content_hash(item)
+        if folder in known_ids and old and old.get("hash") == item["hash"]:
+            manifest[folder] = {k: item[k] for k in ("mtime", "size", "hash")}
+            continue
+        todo.append(folder)
+    return todo
+
+# -------------------------------------------------------------
+# 🚚 Pipeline decode ảnh song song (kiểu DataLoader)
+# -------------------------------------------------------------
+def _load_item(folder, image_path, caption_path):
+    """
+    Chạy trong worker process: đọc caption + decode ảnh (RGB, thu nhỏ).
+    """
+    with open(caption_path, 'r', encoding='utf-8') as f:
+        caption = f.read().strip()
+    try:
+        image = Image.open(image_path)
+        image.draft('RGB', (DECODE_MAX_SIDE, DECODE_MAX_SIDE))  # JPEG: decode thẳng ở độ phân giải nhỏ
+        image = image.convert('RGB')
+        image.thumbnail((DECODE_MAX_SIDE, DECODE_MAX_SIDE))
+    except Exception as e:
+        return folder, caption, None, f"{image_path}: {e}"
+    return folder, caption, image, None
+
+
+def _iter_batches(items, folders, batch_size, workers, prefetch):
+    """
+    Sinh từng batch [(folder, caption, image)], luôn giữ sẵn `prefetch` batch đang decode.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        queue = iter(folders)
+        window = batch_size * (prefetch + 1)
+
+        def _fill():
+            while len(pending) < window:
+                folder = next(queue, None)
+                if folder is None:
+                    return
+                item = items[folder]
+                pending.append(pool.submit(_load_item, folder, item["image_path"], item["caption_path"]))
+
+        _fill()
+        while pending:
+            batch = []
+            while pending and len(batch) < batch_size:
+                folder, caption, image, error = pending.popleft().result()
+                if error:
+                    print(f"[❌] Không đọc được ảnh {error}")
+                else:
+                    batch.append((folder, caption, image))
+            _fill()
+            if batch:
+                yield batch
+
+# -------------------------------------------------------------
+# 🧠 Hàm chính
+# -------------------------------------------------------------
+def _load_existing(output_dir):
+    """
+    Embeddings đã có: đọc từ store, chưa có store thì lấy từ clip_features.pkl cũ.
+    """
+    try:
+        store = EmbeddingStore.load(output_dir, mmap=False)
+        rows = store.rows()
+    except FileNotFoundError:
+        if not os.path.exists(LEGACY_PKL):
+            return {}
+        rows = read_legacy_pickle(LEGACY_PKL)
+    return {row[0]: row for row in rows}
+
+
+def extract_features(dataset_path='app/SelfRAG/dataset',
+                     output_dir=STORE_DIR,
+                     incremental=True,
+                     batch_size=BATCH_SIZE,
+                     workers=DECODE_WORKERS,
+                     dtype=STORE_DTYPE):
+    """
+    1️⃣ Duyệt dataset/, so với manifest → chỉ lấy item mới hoặc đã thay đổi
+    2️⃣ Decode ảnh + đọc caption song song trên worker process
+    3️⃣ Encode ảnh và caption bằng CLIP theo batch
+    4️⃣ Gộp với embeddings cũ, bỏ item đã xoá, lưu embedding store (.npy) + manifest
+    """
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+
+    existing, manifest = {}, {}
+    if incremental:
+        existing = _load_existing(output_dir)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+
+    items = _scan_dataset(dataset_path)
+    todo = _plan_updates(items, manifest, existing.keys())
+    removed = [folder for folder in existing if folder not in items]
+    print(f"📦 {len(items)} item | cần encode: {len(todo)} | đã xoá: {len(removed)}")
+
+    clip = load_model(workers) if todo else None
+    n_batches = (len(todo) + batch_size - 1) // batch_size
+    for batch in tqdm(_iter_batches(items, todo, batch_size, workers, PREFETCH_BATCHES),
+                      total=n_batches, desc="Extracting features"):
+        folders, captions, images = zip(*batch)
+
+        # Encode bằng CLIP (cả batch 1 lần)
+        image_embs = clip.encode(list(images), batch_size=batch_size, convert_to_numpy=True)
+        text_embs = clip.encode(list(captions), batch_size=batch_size, convert_to_numpy=True)
 
-        # Encode bằng CLIP
-        image_emb = model.encode(image, convert_to_tensor=True)
-        text_emb = model.encode(caption, convert_to_tensor=True)
+        for folder, caption, image_emb, text_emb in zip(folders, captions, image_embs, text_embs):
+            existing[folder] = (folder, caption, image_emb, text_emb)
+            manifest[folder] = {k: items[folder][k] for k in ("mtime", "size", "hash")}
 
-        # Lưu vector
-        data.append({
-            "id": folder,
-            "caption": caption,
-            "image_embedding": image_emb.cpu().numpy(),
-            "text_embedding": text_emb.cpu().numpy()
-        })
+    for folder in removed:
+        existing.pop(folder, None)
+        manifest.pop(folder, None)
 
-    # Ghi file
-    with open(output_path, 'wb') as f:
-        pickle.dump(data, f)
+    # Store ghi file version mới rồi mới đổi meta.json → không hỏng bản cũ nếu bị ngắt giữa chừng
+    store = EmbeddingStore.from_rows((existing[folder] for folder in sorted(existing)), dtype=dtype)
+    if todo or removed or not os.path.exists(os.path.join(output_dir, "meta.json")):
+        store.save(output_dir)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
 
-    print(f"\n✅ Đã lưu toàn bộ đặc trưng vào {output_path}")
+    print(f"\n✅ Đã lưu {len(store)} đặc trưng vào {output_dir}")
 
 # -------------------------------------------------------------
 # 🚀 Entry point
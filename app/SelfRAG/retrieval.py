@@ -0,0 +1,228 @@
+# retrieval.py
+# -------------------------------------------------------------
+# Bước 3: Tìm top-k ảnh/caption gần nhất trong embedding store bằng CLIP
+# -------------------------------------------------------------
+
+import os
+import threading
+import numpy as np
+
+from app.SelfRAG.embedding_store import EmbeddingStore, STORE_DIR, META_NAME
+from app.SelfRAG.feature_extraction import clip_model
+
+# -------------------------------------------------------------
+# ⚙️ Cấu hình
+# -------------------------------------------------------------
+RETRIEVAL_ENABLED = os.getenv("RETRIEVAL_ENABLED", "1") == "1"
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 3))
+SCORE_BLOCK_ROWS = int(os.getenv("RETRIEVAL_BLOCK_ROWS", 65536))  # nhân ma trận theo block → RAM tạm có giới hạn
+IVF_MIN_ITEMS = int(os.getenv("RETRIEVAL_IVF_MIN_ITEMS", 50_000))  # store lớn hơn → dùng IVF
+IVF_NPROBE = int(os.getenv("RETRIEVAL_IVF_NPROBE", 8))
+
+
+def _as_queries(vectors):
+    queries = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(queries, axis=1, keepdims=True)
+    return queries / np.maximum(norms, 1e-12)
+
+
+def _score(matrix, queries):
+    """
+    Điểm cosine (q, n) giữa các query và mọi dòng của matrix (đã chuẩn hoá).
+    Duyệt theo block để ma trận mmap/float16 không bị copy nguyên khối lên RAM.
+    """
+    n = matrix.shape[0]
+    scores = np.empty((queries.shape[0], n), dtype=np.float32)
+    for start in range(0, n, SCORE_BLOCK_ROWS):
+        block = np.asarray(matrix[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+        scores[:, start:start + len(block)] = queries @ block.T
+    return scores
+
+
+def top_k(scores, k):
+    """
+    argpartition lấy k điểm cao nhất mỗi dòng (O(n)), rồi chỉ sort k phần tử đó.
+    Trả về (indices, scores) dạng (q, k).
+    """
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.zeros((scores.shape[0], 0), dtype=np.int64), np.zeros((scores.shape[0], 0), dtype=np.float32)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1)
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_scores, order, axis=1)
+
+
+# -------------------------------------------------------------
+# 🗂️ IVF index (k-means spherical) cho corpus lớn
+# -------------------------------------------------------------
+class IVFIndex:
+    """
+    Chia corpus thành n_lists cụm; query chỉ so với các dòng thuộc nprobe cụm gần nhất,
+    điểm cuối cùng vẫn là dot product chính xác trên các ứng viên đó.
+    """
+
+    def __init__(self, matrix, n_lists=None, n_iter=10, sample_size=100_000, seed=0):
+        self.matrix = matrix
+        n = matrix.shape[0]
+        self.n_lists = n_lists or max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(seed)
+
+        # Train k-means trên mẫu
+        sample_idx = np.sort(rng.choice(n, size=min(n, sample_size), replace=False))
+        sample = np.asarray(matrix[sample_idx], dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), size=self.n_lists, replace=False)]
+        for _ in range(n_iter):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            empty = np.bincount(assign, minlength=self.n_lists) == 0
+            sums[empty] = centroids[empty]
+            centroids = _as_queries(sums)
+        self.centroids = centroids
+
+        # Gán toàn bộ corpus → danh sách vị trí theo cụm (sắp liền nhau)
+        assign = np.concatenate([
+            np.argmax(_score(matrix[start:start + SCORE_BLOCK_ROWS], centroids), axis=0)
+            for start in range(0, n, SCORE_BLOCK_ROWS)
+        ])
+        self.order = np.argsort(assign, kind="stable")
+        self.offsets = np.searchsorted(assign[self.order], np.arange(self.n_lists + 1))
+
+    def search(self, queries, k, nprobe=IVF_NPROBE):
+        nprobe = min(nprobe, self.n_lists)
+        probes = top_k(queries @ self.centroids.T, nprobe)[0]
+        all_idx = np.full((len(queries), k), -1, dtype=np.int64)
+        all_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for i, (query, lists) in enumerate(zip(queries, probes)):
+            candidates = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in lists])
+            if not len(candidates):
+                continue
+            candidates.sort()  # đọc mmap theo thứ tự tăng dần
+            idx, scores = top_k(_score(self.matrix[candidates], query[None, :]), k)
+            all_idx[i, :idx.shape[1]] = candidates[idx[0]]
+            all_scores[i, :idx.shape[1]] = scores[0]
+        return all_idx, all_scores
+
+
+# -------------------------------------------------------------
+# 🔎 Retriever
+# -------------------------------------------------------------
+class Retriever:
+    """
+    Tìm item gần nhất trong embedding store:
+    - store load bằng mmap, tự load lại khi meta.json đổi (sau khi chạy extract_features)
+    - query text/ảnh được encode bằng cùng model CLIP (load lười, 1 lần)
+    - model hoặc store không có → trả [] thay vì lỗi
+    """
+
+    def __init__(self, store_dir=STORE_DIR, ivf_min_items=IVF_MIN_ITEMS):
+        self.store_dir = store_dir
+        self.ivf_min_items = ivf_min_items
+        self._store = None
+        self._store_mtime = None
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    # ---------- store ----------
+    @property
+    def store(self):
+        meta_path = os.path.join(self.store_dir, META_NAME)
+        try:
+            mtime = os.stat(meta_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if mtime != self._store_mtime:
+            with self._lock:
+                if mtime != self._store_mtime:
+                    self._store = EmbeddingStore.load(self.store_dir, mmap=True)
+                    self._indexes = {}
+                    self._store_mtime = mtime
+        return self._store
+
+    def _index(self, store, target):
+        matrix = store.image_embeddings if target == "image" else store.text_embeddings
+        if len(store) < self.ivf_min_items:
+            return None, matrix
+        index = self._indexes.get(target)
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(target)
+                if index is None:
+                    index = self._indexes[target] = IVFIndex(matrix)
+        return index, matrix
+
+    # ---------- model ----------
+    def _encoder(self):
+        if clip_model.error is not None:
+            return None
+        try:
+            return clip_model.get()
+        except Exception as e:
+            # Không có model (thiếu mạng/thư viện) → tắt retrieval, không thử lại mỗi request
+            print(f"[⚠️] Không load được CLIP, tắt retrieval: {e}")
+            return None
+
+    # ---------- search ----------
+    def search_vectors(self, vectors, k=RETRIEVAL_TOP_K, target="image"):
+        """
+        vectors: (q, dim) embeddings query → list (mỗi query) các {id, caption, score}.
+        target: "image" (so với embeddings ảnh) hoặc "text" (so với caption).
+        """
+        store = self.store
+        queries = _as_queries(vectors)
+        if store is None or not len(store):
+            return [[] for _ in range(len(queries))]
+
+        index, matrix = self._index(store, target)
+        if index is not None:
+            idx, scores = index.search(queries, k)
+        else:
+            idx, scores = top_k(_score(matrix, queries), k)
+
+        return [
+            [{"id": store.ids[i], "caption": store.captions[i], "score": round(float(s), 4)}
+             for i, s in zip(row_idx, row_scores) if i >= 0]
+            for row_idx, row_scores in zip(idx, scores)
+        ]
+
+    def _ready_encoder(self):
+        """
+        Model CLIP nếu retrieval dùng được (bật, store có dữ liệu, model load được), ngược lại None.
+        """
+        store = self.store
+        if not RETRIEVAL_ENABLED or store is None or not len(store):
+            return None
+        return self._encoder()
+
+    def _search_inputs(self, inputs, k, target):
+        model = self._ready_encoder() if inputs else None
+        if model is None:
+            return [[] for _ in inputs]
+        vectors = model.encode(list(inputs), convert_to_numpy=True)
+        return self.search_vectors(vectors, k, target)
+
+    def search_texts(self, texts, k=RETRIEVAL_TOP_K, target="image"):
+        """
+        Batch câu hỏi text → ảnh gần nhất (CLIP text ↔ image).
+        """
+        return self._search_inputs(texts, k, target)
+
+    def search_images(self, images, k=RETRIEVAL_TOP_K, target="image"):
+        """
+        Batch ảnh (PIL.Image hoặc đường dẫn) → ảnh gần nhất.
+        """
+        if self._ready_encoder() is None:
+            return [[] for _ in images]
+        from PIL import Image
+        loaded = [Image.open(img).convert("RGB") if isinstance(img, str) else img for img in images]
+        return self._search_inputs(loaded, k, target)
+
+    def search_text(self, text, k=RETRIEVAL_TOP_K):
+        return self.search_texts([text], k)[0]
+
+    def search_image(self, image, k=RETRIEVAL_TOP_K):
+        return self.search_images([image], k)[0]
+
+
+retriever = Retriever()
@@ -1,12 +1,46 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from app.routes import chat, upload_image, upload_csv, memory_viewer
+from app.utils.executor import Overloaded, shutdown_pools, io_pool, cpu_pool, chat_pool
+from app.utils import lazy
+from app.utils.llm_client import get_llm
+from app.utils.ocr import ocr_pool
+from app.utils.uploads import UploadLimitMiddleware, UploadTooLarge, upload_stats
+from app.utils.metrics import MetricsMiddleware, register_collector, render_metrics
+from app.utils.response_cache import response_cache
+from app.utils.dataset_cache import dataset_cache
+from app.utils.csv_profile import profile_memo
+from app.utils.csv_loader import schema_cache
+from app.utils.image_cache import image_cache
+from app.utils.charts import chart_store
+from app.utils.audit_log import audit_writer
+from app.SelfRAG.retrieval import RETRIEVAL_ENABLED
 from fastapi.staticfiles import StaticFiles
 import os
 # Thư mục chứa ảnh upload
 UPLOAD_DIR = os.path.join(os.getcwd(), "app/data/uploads")
 
 
-app = FastAPI(title="AI Chat Backend 🚀")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load trước model/thư viện nặng trên thread nền → server nhận request ngay
+    if lazy.WARMUP_ON_STARTUP:
+        lazy.warmup([name for name in lazy.status() if name != "clip" or RETRIEVAL_ENABLED])
+    # Thread ghi audit (mở file, import log cũ) chạy trước request đầu tiên, không nằm trên event loop
+    audit_writer.start()
+    yield
+    # Tắt worker pool + đóng kết nối tới LLM khi server dừng
+    shutdown_pools()
+    ocr_pool.shutdown()
+    await get_llm().aclose()
+
+
+app = FastAPI(title="AI Chat Backend 🚀", lifespan=lifespan)
+# Chặn upload vượt giới hạn theo route trước khi parse multipart
+app.add_middleware(UploadLimitMiddleware)
+# Middleware thêm sau cùng chạy ngoài cùng → đo cả thời gian bị UploadLimitMiddleware chặn
+app.add_middleware(MetricsMiddleware)
 # Mount static file server
 app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
 # Gắn các route con
@@ -15,6 +49,41 @@ app.include_router(upload_image.router)
 app.include_router(upload_csv.router)
 app.include_router(memory_viewer.router, prefix="/memory", tags=["Memory"])
 
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    # Backpressure: pool đầy → báo client thử lại thay vì xếp hàng vô hạn
+    return JSONResponse(status_code=503, content={"error": str(exc)}, headers={"Retry-After": "1"})
+
+@app.exception_handler(UploadTooLarge)
+async def upload_too_large_handler(request: Request, exc: UploadTooLarge):
+    return JSONResponse(status_code=exc.status_code, content={"error": exc.detail}, headers={"Connection": "close"})
+
 @app.get("/")
 def root():
     return {"message": "AI Chat backend is running 🚀"}
+
+@app.get("/pools/")
+def pool_stats():
+    return {"io": io_pool.stats(), "cpu": cpu_pool.stats(), "ocr": ocr_pool.stats(), "chat": chat_pool.stats()}
+
+@app.get("/upload_stats/")
+def upload_stats_view():
+    return upload_stats.stats()
+
+@app.get("/models/")
+def model_status():
+    return lazy.status()
+
+# Số liệu cache / pool / upload được đọc lúc scrape, không đếm trùng ở middleware
+register_collector("app_cache", lambda: {
+    "response": response_cache.stats(), "dataset": dataset_cache.stats(), "profile": profile_memo.stats(),
+    "schema": schema_cache.stats(), "image": image_cache.stats(), "chart": chart_store.stats(),
+}, label="cache")
+register_collector("app_pool", pool_stats, label="pool")
+register_collector("app_upload", upload_stats.stats)
+register_collector("app_audit", audit_writer.stats)
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    # Định dạng text exposition của Prometheus
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -1,8 +1,15 @@
+import json
 from fastapi import APIRouter, UploadFile, File
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from app.utils.llm_client import query_LLM
+from app.utils.llm_client import get_llm, LLMError
+from app.utils.response_cache import response_cache, RESPONSE_CACHE_ENABLED
 from app.utils.csv_utils import save_memory, process_csv
+from app.utils.conversation import build_context
 from app.utils.pii_utils import mask_pii, mask_csv_pii
+from app.utils.executor import run_io, run_chat_io, Overloaded
+from app.utils.metrics import timed
+from app.SelfRAG.retrieval import retriever
 import pandas as pd
 
 router = APIRouter()
@@ -11,6 +18,59 @@ class ChatRequest(BaseModel):
     message: str = ""
     csv_url: str | None = None
     csv_file: UploadFile | None = None
+    stream: bool = False  # True → trả token dạng SSE (text/event-stream)
+    session_id: str | None = None  # lịch sử + context riêng cho từng session
+    similar: bool = False  # True → kèm ảnh tương tự trong dataset SelfRAG (encode CLIP, chậm hơn)
+
+
+def _sse(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _cached_reply(masked_user_msg, history):
+    """
+    Tra response cache: tier exact ngay trong event loop, tier semantic (encode CLIP) qua thread pool.
+    Session đã có lịch sử → câu trả lời phụ thuộc context, không dùng cache.
+    """
+    if not RESPONSE_CACHE_ENABLED or history:
+        return None
+    cached = response_cache.get(masked_user_msg)
+    if cached is None and response_cache.semantic:
+        cached = await run_io(response_cache.get_similar, masked_user_msg)
+    return cached
+
+
+async def _similar(masked_user_msg, requested):
+    """
+    Ảnh tương tự chỉ khi client yêu cầu → encode CLIP không nằm trên đường chat mặc định.
+    """
+    return await run_io(retriever.search_text, masked_user_msg) if requested else []
+
+
+async def _stream_reply(masked_user_msg, session_id, history, similar=False):
+    """
+    Gửi từng token ngay khi LLM trả về; cuối cùng gửi event "done" kèm câu trả lời đầy đủ.
+    """
+    bot_reply = await _cached_reply(masked_user_msg, history)
+    if bot_reply is not None:
+        yield _sse({"token": bot_reply})
+    else:
+        tokens = []
+        try:
+            with timed("llm"):
+                async for token in get_llm().stream(masked_user_msg, history):
+                    tokens.append(token)
+                    yield _sse({"token": token})
+        except LLMError as e:
+            yield _sse({"error": str(e)}, event="error")
+            return
+        bot_reply = "".join(tokens)
+        if RESPONSE_CACHE_ENABLED and not history:
+            response_cache.put(masked_user_msg, bot_reply)
+    await run_chat_io(save_memory, masked_user_msg, bot_reply, session_id)
+    similar = await _similar(masked_user_msg, similar)
+    yield _sse({"reply": bot_reply, "type": "text", "similar": similar}, event="done")
 
 @router.post("/")
 async def chat_endpoint(req: ChatRequest):
@@ -32,12 +92,37 @@ async def chat_endpoint(req: ChatRequest):
             if isinstance(csv_reply, pd.DataFrame):
                 csv_reply = mask_csv_pii(csv_reply)
 
-            save_memory(masked_user_msg, csv_reply)
+            await run_chat_io(save_memory, masked_user_msg, csv_reply, req.session_id)
             return {"reply": csv_reply, "type": "csv"}
+        except Overloaded:
+            raise
         except Exception as e:
             return {"error": str(e)}
 
-    # Chat bình thường
-    bot_reply = query_LLM(masked_user_msg)
-    save_memory(masked_user_msg, bot_reply)
-    return {"reply": bot_reply, "type": "text"}
+    # Chat bình thường (có session_id → kèm lịch sử của session trong budget token)
+    history = await run_chat_io(build_context, req.session_id, masked_user_msg) if req.session_id else []
+    if req.stream:
+        return StreamingResponse(_stream_reply(masked_user_msg, req.session_id, history, req.similar),
+                                 media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    bot_reply = await _cached_reply(masked_user_msg, history)
+    if bot_reply is None:
+        try:
+            with timed("llm"):
+                bot_reply = await get_llm().complete(masked_user_msg, history)
+        except LLMError as e:
+            return {"error": str(e)}
+        if RESPONSE_CACHE_ENABLED and not history:
+            response_cache.put(masked_user_msg, bot_reply)
+    await run_chat_io(save_memory, masked_user_msg, bot_reply, req.session_id)
+    # Ảnh tương tự trong dataset SelfRAG (rỗng nếu không yêu cầu / chưa có store/model)
+    similar = await _similar(masked_user_msg, req.similar)
+    return {"reply": bot_reply, "type": "text", "similar": similar}
+
+
+@router.get("/cache/stats/")
+def cache_stats():
+    """
+    Hit/miss của response cache (exact + semantic) và dung lượng đang dùng
+    """
+    return response_cache.stats()
@@ -1,20 +1,73 @@
-from fastapi import APIRouter
-from pathlib import Path
-import json
+from datetime import datetime
+from itertools import islice
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+from app.utils.memory_store import get_store
+from app.utils.audit_log import query_audit
 
 router = APIRouter()
 
-MEMORY_PATH = Path("app/data/memory.json")
+NDJSON_CHUNK_BYTES = 64 * 1024
+
+
+def _ndjson_chunks(lines):
+    """
+    Gom các dòng NDJSON thành chunk ~64KB để giảm số lần gửi, RAM luôn phẳng.
+    """
+    buffer, size = [], 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= NDJSON_CHUNK_BYTES:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
 
 @router.get("/history/")
-def get_memory_history():
+def get_memory_history(
+    limit: int | None = Query(None, ge=1, le=10000),
+    cursor: int | None = Query(None, ge=0, description="id của record cuối cùng ở trang trước"),
+    since: datetime | None = Query(None, description="ISO datetime hoặc epoch seconds"),
+    until: datetime | None = Query(None),
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+):
+    """
+    📜 Trả về lịch sử hội thoại, phân trang theo cursor / khoảng thời gian.
+    - format=json: {"history": [...], "next_cursor": id | null} (mặc định 100 record/trang)
+    - format=ndjson: stream từng record 1 dòng, không giới hạn nếu không truyền limit
+    """
+    store = get_store()
+    since_ts = since.timestamp() if since else None
+    until_ts = until.timestamp() if until else None
+
+    if format == "ndjson":
+        lines = store.iter_raw(cursor=cursor, since=since_ts, until=until_ts)
+        if limit is not None:
+            lines = islice(lines, limit)
+        return StreamingResponse(_ndjson_chunks(lines), media_type="application/x-ndjson")
+
+    records, next_cursor = store.query(cursor=cursor, limit=limit or 100, since=since_ts, until=until_ts)
+    return {"history": records, "next_cursor": next_cursor}
+
+
+@router.get("/audit/")
+def get_audit_log(
+    action: str | None = Query(None, description="mask_text | mask_csv | mask_image"),
+    pii_type: str | None = Query(None, description="phone | email | name"),
+    since: datetime | None = Query(None),
+    until: datetime | None = Query(None),
+    limit: int = Query(100, ge=1, le=10000),
+):
     """
-    📜 Trả về toàn bộ lịch sử hội thoại trong memory.json
+    🔒 Tra cứu PII audit log theo action / loại PII / khoảng thời gian
     """
-    if not MEMORY_PATH.exists():
-        return {"history": []}
-    
-    with open(MEMORY_PATH, "r", encoding="utf-8") as f:
-        memory = json.load(f)
-    
-    return memory
+    entries = query_audit(
+        action=action,
+        pii_type=pii_type,
+        since=since.timestamp() if since else None,
+        until=until.timestamp() if until else None,
+        limit=limit,
+    )
+    return {"audit": list(entries)}
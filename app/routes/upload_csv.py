@@ -1,7 +1,14 @@
 # app/routes/upload_csv.py
 from fastapi import APIRouter, UploadFile, Form
+from fastapi.responses import FileResponse, JSONResponse
+import os
 from app.utils.csv_utils import process_csv, save_memory
 from app.utils.pii_utils import mask_pii, mask_csv_pii
+from app.utils.dataset_cache import dataset_cache
+from app.utils.csv_profile import profile_memo
+from app.utils.csv_loader import schema_cache
+from app.utils.charts import chart_store, render_histogram_png
+from app.utils.executor import run_io, run_cpu, run_chat_io, Overloaded
 import pandas as pd
 
 router = APIRouter(prefix="/csv", tags=["CSV"])
@@ -10,29 +17,76 @@ router = APIRouter(prefix="/csv", tags=["CSV"])
 async def upload_csv(
     file: UploadFile = None,
     url: str = Form(None),
-    question: str = Form("Tóm tắt dataset")
+    question: str = Form("Tóm tắt dataset"),
+    stream: bool | None = Form(None),
+    session_id: str | None = Form(None)
 ):
     """
     API nhận file CSV hoặc URL + câu hỏi (form-data)
-    Tích hợp PII masking
+    Tích hợp PII masking. stream=true → đọc theo chunk (file rất lớn)
     """
     try:
         # Mask PII trong câu hỏi user
         masked_question = mask_pii(question)
 
         # Xử lý CSV + trả về answer (có thể DataFrame hoặc text)
-        answer = await process_csv(file=file, url=url, question=masked_question)
+        answer = await process_csv(file=file, url=url, question=masked_question, stream=stream)
 
         # Nếu trả về DataFrame → mask PII trong CSV
         if isinstance(answer, pd.DataFrame):
             answer = mask_csv_pii(answer)
 
+        # Histogram → tách bin JSON ra field riêng (frontend tự vẽ, PNG lấy qua /csv/chart/)
+        chart = None
+        if isinstance(answer, dict) and "chart" in answer:
+            chart, answer = answer["chart"], answer["reply"]
+
         # Lưu lịch sử (user question → answer đã mask)
         try:
-            save_memory(masked_question, answer)
+            await run_chat_io(save_memory, masked_question, answer, session_id)
         except Exception:
             pass  # don't fail endpoint if logging fails
 
-        return {"reply": answer}
+        response = {"reply": answer, "upload_bytes": file.size if file else None}
+        if chart is not None:
+            response["chart"] = chart
+        return response
+    except Overloaded:
+        raise
     except Exception as e:
         return {"error": str(e)}
+
+
+@router.get("/cache/stats/")
+def cache_stats():
+    """
+    Bộ đếm hit/miss và dung lượng của dataset cache (+ memo thống kê, cache schema CSV)
+    """
+    return {**dataset_cache.stats(), "profiles": profile_memo.stats(), "schemas": schema_cache.stats(),
+            "charts": chart_store.stats()}
+
+
+@router.get("/chart/{chart_id}.png")
+async def chart_png(chart_id: str):
+    """
+    PNG của 1 histogram đã tính: render lần đầu trên cpu_pool (Agg), các lần sau trả file có sẵn.
+    """
+    chart = chart_store.get(chart_id)
+    if chart is None:
+        return JSONResponse(status_code=404, content={"error": "Không tìm thấy biểu đồ"})
+    path = chart_store.png_path(chart_id)
+    if not os.path.exists(path):
+        png = await run_cpu(render_histogram_png, chart)
+        await run_io(chart_store.save_png, chart_id, png)
+    return FileResponse(path, media_type="image/png")
+
+
+@router.get("/chart/{chart_id}")
+def chart_bins(chart_id: str):
+    """
+    Bin JSON của 1 histogram (edges + counts) để client tự vẽ.
+    """
+    chart = chart_store.get(chart_id)
+    if chart is None:
+        return JSONResponse(status_code=404, content={"error": "Không tìm thấy biểu đồ"})
+    return chart
@@ -1,35 +1,90 @@
 from fastapi import APIRouter, UploadFile, File, Form
-import os, shutil
+import os
 from uuid import uuid4
-from app.utils.image_utils import process_image
+from app.utils.image_utils import process_image, image_reply
+from app.utils.image_cache import image_cache
+from app.utils.uploads import save_upload
 from app.utils.csv_utils import save_memory
+from app.utils.executor import run_io, run_chat_io, Overloaded
+from app.SelfRAG.retrieval import retriever
 
 router = APIRouter(prefix="/image", tags=["Image"])
 
 UPLOAD_DIR = "app/data/uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
 @router.post("/upload_image/")
-async def upload_image(file: UploadFile = File(...), question: str = Form("What’s in this photo?")):
+async def upload_image(file: UploadFile = File(...), question: str = Form("What’s in this photo?"),
+                       session_id: str | None = Form(None), similar: bool = Form(False)):
     """
     Upload ảnh → OCR + mask PII → trả về câu trả lời liên kết ảnh.
+    Ảnh đã từng upload (trùng hoặc gần trùng) → dùng lại ảnh mask cũ, không OCR lại.
     """
+    tmp_path = None
     try:
-        ext = os.path.splitext(file.filename)[1]
-        unique_filename = f"{uuid4().hex}{ext}"
-        file_path = os.path.join(UPLOAD_DIR, unique_filename)
+        ext = os.path.splitext(file.filename)[1] or ".jpg"
+        tmp_path = os.path.join(UPLOAD_DIR, f".upload-{uuid4().hex}{ext}")
+        # Ghi ra đĩa + sha256 trong 1 lượt; ảnh nhỏ được decode luôn từ RAM
+        upload = await run_io(save_upload, file.file, tmp_path, decode_image=True)
+        sha256 = upload["sha256"]
+
+        # Cache hit có thể ghi lại index → chạy trên pool, không chặn event loop
+        entry = await run_io(image_cache.get, sha256)
+        signature = None
+        if entry is None:
+            entry, signature = await run_io(image_cache.find_similar, tmp_path, upload["image"])
 
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        if entry is not None:
+            _remove(tmp_path)
+            result = {"reply": image_reply(question), "masked_image_path": entry["masked_path"],
+                      "detected": entry["detected"], "timings": {}}
+        else:
+            # 1 bản duy nhất cho mỗi ảnh: tên file theo sha256
+            file_path = image_cache.path_for(sha256, ext)
+            os.replace(tmp_path, file_path)
+            tmp_path = file_path
+            result = await process_image(file_path, question, upload["image"])
+            if signature is not None:
+                await run_io(image_cache.add, sha256, file_path, result["masked_image_path"],
+                             result["detected"], signature)
+        tmp_path = None
 
-        result = await process_image(file_path, question)
-        save_memory(question, result["reply"])
+        await run_chat_io(save_memory, question, result["reply"], session_id)
+        # Chỉ tìm khi client yêu cầu (similar=true); tìm bằng ảnh đã mask → không đưa PII vào encoder
+        similar_images = await run_io(retriever.search_image, result["masked_image_path"]) if similar else []
 
         return {
             "message": "Image uploaded and analyzed successfully",
             "reply": result["reply"],
-            "masked_image_path": result["masked_image_path"]
+            "masked_image_path": result["masked_image_path"],
+            "detected": result["detected"],
+            "cached": entry is not None,
+            "upload_bytes": upload["bytes"],
+            "timings": result["timings"],
+            "similar": similar_images
         }
 
+    except Overloaded:
+        raise
     except Exception as e:
         return {"error": str(e)}
+    finally:
+        # Lỗi giữa chừng → không để lại file rác trong uploads
+        if tmp_path is not None:
+            _remove(tmp_path)
+
+
+@router.get("/cache/stats/")
+async def image_cache_stats():
+    """
+    Thống kê cache ảnh upload (hit trùng tuyệt đối / gần trùng, dung lượng, số ảnh bị xoá).
+    """
+    return image_cache.stats()
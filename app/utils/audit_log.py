@@ -0,0 +1,288 @@
+import os
+import re
+import gzip
+import json
+import time
+import queue
+import atexit
+import shutil
+import threading
+from pathlib import Path
+from datetime import datetime
+from app.utils.metrics import timed
+
+# ⚙️ Cấu hình audit log (JSON Lines, ghi nền theo batch)
+AUDIT_DIR = Path("data")
+AUDIT_LOG = AUDIT_DIR / "pii_audit.jsonl"
+LEGACY_AUDIT_LOG = AUDIT_DIR / "pii_audit.json"
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", 256))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", 0.5))
+AUDIT_FSYNC_INTERVAL = float(os.getenv("AUDIT_FSYNC_INTERVAL", 2.0))
+AUDIT_MAX_BYTES = int(os.getenv("AUDIT_MAX_BYTES", 10 * 1024 * 1024))
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", 10_000))
+AUDIT_FLUSH_TIMEOUT = float(os.getenv("AUDIT_FLUSH_TIMEOUT", 5))
+TIME_FORMAT = "%H:%M %d/%m/%y"
+ROTATED_TIME_FORMAT = "%Y%m%dT%H%M%S"
+ROTATED_RE = re.compile(r"pii_audit\.(\d{8}T\d{6})_(\d{8}T\d{6})(?:_\d+)?\.jsonl\.gz$")
+
+
+def make_entry(action, details, ts=None, time_str=None):
+    ts = time.time() if ts is None else ts
+    return {
+        "ts": ts,
+        "time": time_str or datetime.fromtimestamp(ts).strftime(TIME_FORMAT),
+        "action": action,
+        "details": details,
+    }
+
+
+# ====================================================
+# ✍️ WRITER NỀN
+# ====================================================
+class AuditWriter:
+    """
+    Ghi audit log dạng JSON Lines bằng 1 thread nền (start() trong lifespan của app):
+    - request chỉ đẩy entry vào queue (không đọc/ghi file, không bao giờ chặn event loop);
+      queue đầy → bỏ entry + đếm vào dropped (xem stats())
+    - mở file + import pii_audit.json cũ chạy trên chính thread nền
+    - gom batch, flush mỗi AUDIT_FLUSH_INTERVAL giây, fsync mỗi AUDIT_FSYNC_INTERVAL giây
+    - file vượt AUDIT_MAX_BYTES → đổi tên theo khoảng thời gian + nén gzip
+    """
+
+    _STOP = object()
+
+    def __init__(self, path=AUDIT_LOG, max_bytes=AUDIT_MAX_BYTES, queue_size=AUDIT_QUEUE_SIZE):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._file = None
+        self._first_ts = None
+        self._last_ts = None
+        self._last_fsync = time.monotonic()
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+
+    # ---------- phía request ----------
+    def write(self, entry):
+        """
+        Đẩy entry vào queue, không chờ: được gọi cả từ event loop (mask_pii của /chat/).
+        Queue đầy (đĩa chậm / writer kẹt) → bỏ entry và đếm, không chặn request.
+        """
+        self.start()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+                first = self.dropped == 1
+            if first:
+                print(f"[⚠️] Audit queue đầy ({self._queue.maxsize}), bắt đầu bỏ entry — xem dropped ở /metrics")
+
+    def stats(self):
+        with self._lock:
+            dropped = self.dropped
+        return {"written": self.written, "dropped": dropped, "queued": self._queue.qsize(),
+                "rotations": self.rotations}
+
+    def flush(self, timeout=AUDIT_FLUSH_TIMEOUT):
+        """
+        Chờ tới khi mọi entry đã nằm trên đĩa (tối đa timeout giây).
+        Trả về False nếu hết giờ hoặc thread nền đã chết (không chờ mãi như queue.join()).
+        """
+        thread = self._thread
+        if thread is None:
+            return True
+        deadline = time.monotonic() + timeout
+        done = self._queue.all_tasks_done
+        with done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if not thread.is_alive() or remaining <= 0:
+                    return False
+                done.wait(min(remaining, 0.1))
+        return True
+
+    def close(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+        self._thread = None
+
+    # ---------- thread nền ----------
+    def start(self):
+        """
+        Khởi động thread nền (chỉ tạo thread, không đụng file) — gọi sẵn trong lifespan của app;
+        write() tự gọi khi dùng ngoài app (script, test).
+        """
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.close)
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if not self.path.exists() and LEGACY_AUDIT_LOG.exists() and self.path == AUDIT_LOG:
+            _import_legacy(LEGACY_AUDIT_LOG, self.path)
+        self._first_ts, self._last_ts = _file_time_range(self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _run(self):
+        try:
+            self._open()
+        except OSError as e:
+            print(f"[⚠️] Không mở được audit log {self.path}: {e}")
+            return
+        stop = False
+        while not stop:
+            try:
+                batch = [self._queue.get(timeout=AUDIT_FLUSH_INTERVAL)]
+            except queue.Empty:
+                self._maybe_fsync()
+                continue
+            while len(batch) < AUDIT_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            entries = [e for e in batch if e is not self._STOP]
+            stop = len(entries) != len(batch)
+            if entries:
+                with timed("audit_write"):
+                    self._write_batch(entries)
+            for _ in batch:
+                self._queue.task_done()
+
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    def _write_batch(self, entries):
+        self._file.write("".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries))
+        self._file.flush()
+        if self._first_ts is None:
+            self._first_ts = entries[0]["ts"]
+        self._last_ts = entries[-1]["ts"]
+        self.written += len(entries)
+        self._maybe_fsync()
+        if self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _maybe_fsync(self):
+        if self._file is not None and time.monotonic() - self._last_fsync >= AUDIT_FSYNC_INTERVAL:
+            os.fsync(self._file.fileno())
+            self._last_fsync = time.monotonic()
+
+    def _rotate(self):
+        """
+        pii_audit.jsonl → pii_audit.<từ>_<đến>.jsonl.gz, rồi mở file mới.
+        """
+        os.fsync(self._file.fileno())
+        self._file.close()
+        start = datetime.fromtimestamp(self._first_ts).strftime(ROTATED_TIME_FORMAT)
+        end = datetime.fromtimestamp(self._last_ts).strftime(ROTATED_TIME_FORMAT)
+        target = self.path.with_name(f"pii_audit.{start}_{end}.jsonl.gz")
+        n = 1
+        while target.exists():
+            target = self.path.with_name(f"pii_audit.{start}_{end}_{n}.jsonl.gz")
+            n += 1
+        with open(self.path, "rb") as src, gzip.open(target, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        self.path.unlink()
+        self.rotations += 1
+        self._first_ts = self._last_ts = None
+        self._file = open(self.path, "a", encoding="utf-8")
+
+
+def _file_time_range(path):
+    """
+    ts của dòng đầu và dòng cuối trong file JSONL (chỉ đọc đầu + đuôi file).
+    """
+    if not path.exists() or path.stat().st_size == 0:
+        return None, None
+    with open(path, "rb") as f:
+        first = f.readline()
+        f.seek(max(0, path.stat().st_size - 64 * 1024))
+        tail = f.read().splitlines()
+    try:
+        return json.loads(first)["ts"], json.loads(tail[-1])["ts"]
+    except (ValueError, KeyError, IndexError):
+        return None, None
+
+
+def _import_legacy(legacy_path, target_path):
+    """
+    Chuyển pii_audit.json (mảng JSON) cũ sang JSON Lines (chạy 1 lần).
+    """
+    try:
+        with open(legacy_path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return
+    last_ts = 0.0
+    with open(target_path, "w", encoding="utf-8") as out:
+        for item in entries if isinstance(entries, list) else []:
+            try:
+                last_ts = max(last_ts, datetime.strptime(item.get("time", ""), TIME_FORMAT).timestamp())
+            except ValueError:
+                pass
+            entry = make_entry(item.get("action"), item.get("details"), ts=last_ts, time_str=item.get("time"))
+            out.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+audit_writer = AuditWriter()
+
+
+# ====================================================
+# 🔎 TRUY VẤN AUDIT LOG
+# ====================================================
+def query_audit(action=None, pii_type=None, since=None, until=None, limit=None):
+    """
+    Duyệt audit log theo thứ tự thời gian, lọc theo action / loại PII / khoảng thời gian
+    (epoch seconds). File đã rotate nằm ngoài khoảng thời gian bị bỏ qua theo tên file,
+    các file còn lại được đọc từng dòng (không load cả file).
+    """
+    audit_writer.flush()
+    since_key = datetime.fromtimestamp(since).strftime(ROTATED_TIME_FORMAT) if since else None
+    until_key = datetime.fromtimestamp(until).strftime(ROTATED_TIME_FORMAT) if until else None
+
+    files = []
+    for path in sorted(AUDIT_DIR.glob("pii_audit.*.jsonl.gz")):
+        m = ROTATED_RE.match(path.name)
+        if not m:
+            continue
+        start, end = m.groups()
+        if (since_key and end < since_key) or (until_key and start > until_key):
+            continue
+        files.append(path)
+    if AUDIT_LOG.exists():
+        files.append(AUDIT_LOG)
+
+    action_token = f'"action": "{action}"' if action else None
+    count = 0
+    for path in files:
+        opener = gzip.open if path.suffix == ".gz" else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                # Lọc thô trên chuỗi trước khi parse JSON
+                if action_token and action_token not in line:
+                    continue
+                if pii_type and f'"{pii_type}"' not in line:
+                    continue
+                entry = json.loads(line)
+                if since is not None and entry["ts"] < since:
+                    continue
+                if until is not None and entry["ts"] > until:
+                    continue
+                if pii_type and pii_type not in (entry.get("details") or []):
+                    continue
+                yield entry
+                count += 1
+                if limit is not None and count >= limit:
+                    return
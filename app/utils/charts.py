@@ -0,0 +1,176 @@
+import os
+import io
+import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from app.utils.lazy import LazySingleton
+
+# ⚙️ Cấu hình biểu đồ
+CHART_DIR = os.getenv("CHART_DIR", "app/data/charts")
+CHART_BINS = int(os.getenv("CHART_BINS", 10))
+CHART_MAX_BINS = int(os.getenv("CHART_MAX_BINS", 200))
+CHART_MEMO_SIZE = int(os.getenv("CHART_MEMO_SIZE", 256))
+CHART_DPI = int(os.getenv("CHART_DPI", 100))
+os.makedirs(CHART_DIR, exist_ok=True)
+
+
+def _load_agg():
+    # API hướng đối tượng: mỗi lần vẽ 1 Figure riêng, không đụng state toàn cục của pyplot
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    return Figure, FigureCanvasAgg
+
+
+# matplotlib chỉ import khi render PNG lần đầu
+agg = LazySingleton("matplotlib", _load_agg)
+
+
+def chart_id(dataset_key, column, bins, filters=None, data=None, source="exact"):
+    """
+    Id biểu đồ theo dataset + cột + số bin (+ filter) + nguồn bin. Không có dataset key → theo chính dữ liệu bin.
+    source: "exact" (numpy.histogram trên giá trị thô) | "stream" (bin xấp xỉ của chế độ streaming)
+    → cùng 1 file CSV hỏi ở 2 chế độ ra 2 id, bin xấp xỉ không ghi đè bin chính xác.
+    """
+    parts = [str(dataset_key), str(column), str(bins), json.dumps(filters or [], sort_keys=True, default=str), source]
+    if dataset_key is None and data is not None:
+        parts.append(hashlib.sha1(data).hexdigest())
+    return "hist-" + hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()[:24]
+
+
+def _paths(cid):
+    return os.path.join(CHART_DIR, f"{cid}.json"), os.path.join(CHART_DIR, f"{cid}.png")
+
+
+# ====================================================
+# 📊 TÍNH BIN (numpy.histogram) + CACHE
+# ====================================================
+class ChartStore:
+    """
+    Bin histogram lưu dạng JSON nhỏ trên đĩa (CHART_DIR/<id>.json) + LRU trong RAM.
+    PNG chỉ được render khi có client yêu cầu, rồi lưu cạnh file JSON.
+    """
+
+    def __init__(self, max_entries=CHART_MEMO_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._memo = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.renders = 0
+
+    def get(self, cid):
+        if not re.fullmatch(r"hist-[0-9a-f]{24}", cid):
+            return None
+        with self._lock:
+            chart = self._memo.get(cid)
+            if chart is not None:
+                self._memo.move_to_end(cid)
+                return chart
+        json_path, _ = _paths(cid)
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                chart = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._remember(cid, chart)
+        return chart
+
+    def _remember(self, cid, chart):
+        with self._lock:
+            self._memo[cid] = chart
+            self._memo.move_to_end(cid)
+            while len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)
+
+    def histogram(self, dataset_key, column, values=None, counts=None, edges=None, bins=CHART_BINS, filters=None):
+        """
+        Bin histogram của 1 cột: từ giá trị thô (numpy.histogram) hoặc bin có sẵn (chế độ streaming).
+        Đã tính với cùng dataset + cột + bins + filter + nguồn bin → lấy lại, không tính lại.
+        """
+        bins = max(1, min(int(bins), CHART_MAX_BINS))
+        source = "exact" if counts is None else "stream"
+        data = None
+        if dataset_key is None and counts is not None:
+            data = np.asarray(counts).tobytes() + np.asarray(edges).tobytes()
+        cid = chart_id(dataset_key, column, bins, filters, data, source)
+        chart = self.get(cid)
+        if chart is not None:
+            with self._lock:
+                self.hits += 1
+            return chart
+
+        with self._lock:
+            self.misses += 1
+        if counts is None:
+            numbers = pd.to_numeric(values, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+            numbers = numbers[np.isfinite(numbers)]
+            counts, edges = np.histogram(numbers, bins=bins) if len(numbers) else (np.zeros(0), np.zeros(1))
+        chart = {
+            "id": cid,
+            "column": str(column),
+            "bins": int(len(counts)),
+            "edges": [float(e) for e in edges],
+            "counts": [int(c) for c in counts],
+            "source": source,
+            "png_url": f"/csv/chart/{cid}.png",
+        }
+        json_path, _ = _paths(cid)
+        tmp_path = json_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(chart, f)
+        os.replace(tmp_path, json_path)
+        self._remember(cid, chart)
+        return chart
+
+    def png_path(self, cid):
+        return _paths(cid)[1]
+
+    def save_png(self, cid, png):
+        png_path = self.png_path(cid)
+        tmp_path = png_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(png)
+        os.replace(tmp_path, png_path)
+        with self._lock:
+            self.renders += 1
+        return png_path
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "memo_entries": len(self._memo),
+                "renders": self.renders,
+            }
+
+
+chart_store = ChartStore()
+
+
+# ====================================================
+# 🖼️ RENDER PNG (Agg, chạy trên cpu_pool)
+# ====================================================
+def render_histogram_png(chart):
+    """
+    Bin đã tính → PNG bytes. Hàm thuần (không state chung) → chạy được trong worker process.
+    """
+    Figure, FigureCanvasAgg = agg.get()
+    fig = Figure(figsize=(6.4, 4.8), dpi=CHART_DPI)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    edges = np.asarray(chart["edges"])
+    if len(chart["counts"]):
+        ax.bar(edges[:-1], chart["counts"], width=np.diff(edges), align="edge", edgecolor="white")
+    ax.set_title(f"Histogram của {chart['column']}")
+    ax.set_xlabel(chart["column"])
+    ax.set_ylabel("count")
+    buffer = io.BytesIO()
+    canvas.print_png(buffer)
+    return buffer.getvalue()
@@ -0,0 +1,156 @@
+import os
+import json
+import threading
+from pathlib import Path
+from app.utils.memory_store import get_store, MEMORY_DIR
+
+# ⚙️ Cấu hình context hội thoại theo session
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 3000))
+CONTEXT_MAX_TURNS = int(os.getenv("CONTEXT_MAX_TURNS", 20))
+SUMMARY_MAX_TOKENS = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", 500))
+SUMMARY_LINE_CHARS = 160
+# Tối đa số turn rơi khỏi cửa sổ được đọc để tóm tắt trong 1 lần gọi (session dài lần đầu
+# dựng context không phải đọc cả lịch sử; dòng cũ hơn đằng nào cũng bị cắt khỏi tóm tắt)
+SUMMARY_CATCHUP_TURNS = int(os.getenv("CONTEXT_SUMMARY_CATCHUP_TURNS", 50))
+SUMMARY_PATH = Path(os.getenv("CONTEXT_SUMMARY_PATH", MEMORY_DIR / "summaries.jsonl"))
+
+
+def estimate_tokens(text):
+    """
+    Ước lượng số token (~4 ký tự / token) — đủ để giữ context trong budget, không cần tokenizer.
+    """
+    return len(text) // 4 + 1
+
+
+def _as_text(value):
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+def _summary_line(record):
+    user = " ".join(_as_text(record.get("user")).split())
+    bot = " ".join(_as_text(record.get("bot")).split())
+    half = SUMMARY_LINE_CHARS // 2
+    return f"- User: {user[:half]} | Assistant: {bot[:half]}"
+
+
+# ====================================================
+# 📝 TÓM TẮT CUỘN THEO SESSION
+# ====================================================
+class SummaryStore:
+    """
+    Tóm tắt các turn đã rời khỏi cửa sổ context, mỗi session 1 bản {"upto": id, "lines": [...]}.
+    Mỗi lần cập nhật chỉ gộp thêm các turn mới rơi khỏi cửa sổ (thường 0–1 turn),
+    ghi nối vào summaries.jsonl; file được gộp lại khi load nếu quá dài.
+    Tóm tắt dạng trích (1 dòng ngắn / turn), dòng cũ nhất bị bỏ khi vượt SUMMARY_MAX_TOKENS.
+    """
+
+    def __init__(self, path=SUMMARY_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._summaries = {}
+        self._load()
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        n_lines = 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    continue
+                self._summaries[item["session"]] = {"upto": item["upto"], "lines": item["lines"]}
+                n_lines += 1
+        if n_lines > 4 * max(1, len(self._summaries)):
+            self._compact()
+
+    def _compact(self):
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for session_id, summary in self._summaries.items():
+                f.write(json.dumps({"session": session_id, **summary}, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def get(self, session_id):
+        with self._lock:
+            summary = self._summaries.get(session_id)
+            return dict(summary) if summary else {"upto": 0, "lines": []}
+
+    def advance(self, session_id, records):
+        """
+        Gộp các turn (cũ → mới) vào tóm tắt của session.
+        """
+        if not records:
+            return self.get(session_id)
+        with self._lock:
+            summary = self._summaries.get(session_id) or {"upto": 0, "lines": []}
+            lines = summary["lines"] + [_summary_line(r) for r in records if r["id"] > summary["upto"]]
+            while lines and estimate_tokens("\n".join(lines)) > SUMMARY_MAX_TOKENS:
+                lines.pop(0)
+            summary = {"upto": max(summary["upto"], records[-1]["id"]), "lines": lines}
+            self._summaries[session_id] = summary
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"session": session_id, **summary}, ensure_ascii=False) + "\n")
+            return dict(summary)
+
+
+_summaries = None
+_summaries_lock = threading.Lock()
+
+
+def get_summaries():
+    global _summaries
+    if _summaries is None:
+        with _summaries_lock:
+            if _summaries is None:
+                _summaries = SummaryStore()
+    return _summaries
+
+
+# ====================================================
+# 🧩 DỰNG CONTEXT CHO LLM
+# ====================================================
+def build_context(session_id, message, budget=CONTEXT_TOKEN_BUDGET, max_turns=CONTEXT_MAX_TURNS):
+    """
+    Lịch sử gửi kèm câu hỏi mới của 1 session, dạng messages OpenAI:
+    [tóm tắt các turn cũ (system)] + N turn gần nhất vừa budget (user/assistant).
+    Chỉ đọc đuôi max_turns turn của session qua index + tối đa SUMMARY_CATCHUP_TURNS turn
+    mới rơi khỏi cửa sổ → chi phí O(cửa sổ), không phụ thuộc tổng độ dài lịch sử
+    (turn cũ hơn chưa từng tóm tắt được bỏ qua, watermark "upto" nhảy tới cửa sổ).
+    """
+    store = get_store()
+    summaries = get_summaries()
+    tail = store.session_tail(session_id, max_turns)
+
+    # Chọn turn mới nhất trước cho tới khi hết budget (chừa phần cho câu hỏi + tóm tắt)
+    remaining = budget - estimate_tokens(message) - SUMMARY_MAX_TOKENS
+    window = []
+    for record in reversed(tail):
+        cost = estimate_tokens(_as_text(record["user"])) + estimate_tokens(_as_text(record["bot"]))
+        if cost > remaining:
+            break
+        window.append(record)
+        remaining -= cost
+    window.reverse()
+
+    # Turn nằm giữa phần đã tóm tắt và cửa sổ → gộp vào tóm tắt
+    summary = summaries.get(session_id)
+    first_window_id = window[0]["id"] if window else (tail[-1]["id"] + 1 if tail else None)
+    if first_window_id is not None:
+        dropped = store.session_range(session_id, after_id=summary["upto"], before_id=first_window_id,
+                                      limit=SUMMARY_CATCHUP_TURNS)
+        summary = summaries.advance(session_id, dropped)
+    window = [r for r in window if r["id"] > summary["upto"]]
+
+    messages = []
+    if summary["lines"]:
+        messages.append({"role": "system",
+                         "content": "Summary of earlier conversation:\n" + "\n".join(summary["lines"])})
+    for record in window:
+        messages.append({"role": "user", "content": _as_text(record["user"])})
+        messages.append({"role": "assistant", "content": _as_text(record["bot"])})
+    return messages
@@ -0,0 +1,160 @@
+import os
+import io
+import json
+import hashlib
+import threading
+import importlib.util
+from pathlib import Path
+from collections import OrderedDict
+import pandas as pd
+
+# ⚙️ Cấu hình engine đọc CSV
+CSV_ENGINE = "pyarrow" if importlib.util.find_spec("pyarrow") is not None else "c"
+CSV_CATEGORY_MAX_RATIO = float(os.getenv("CSV_CATEGORY_MAX_RATIO", 0.5))  # unique / số dòng ≤ ratio → category
+CSV_SCHEMA_CACHE_PATH = Path(os.getenv("CSV_SCHEMA_CACHE_PATH", "app/data/cache/csv_schemas.json"))
+CSV_SCHEMA_CACHE_SIZE = int(os.getenv("CSV_SCHEMA_CACHE_SIZE", 256))
+# Kiểu "rộng": cột chuỗi có thể chỉ do 1 file lẫn giá trị bẩn → không ghim vào schema dùng chung
+WIDE_DTYPES = ("string", "object", "category", "large_string")
+
+
+def schema_key(url=None, content=None):
+    """
+    Key schema: theo URL (cùng nguồn, nội dung đổi theo thời gian) hoặc theo dòng header
+    của file upload (các bản export cùng định dạng dùng chung 1 schema).
+    """
+    if url:
+        return "url:" + url
+    header = bytes(content[:65536]).split(b"\n", 1)[0]
+    return "header:" + hashlib.sha1(header).hexdigest()
+
+
+def pinned_dtypes(dtypes):
+    """
+    Phần schema được phép cache: chỉ cột số / bool / thời gian. Cột chuỗi (kể cả category)
+    luôn để parser tự suy luận — 1 file có "abc" trong cột số không được làm mọi file
+    cùng header sau đó đọc cột ấy thành chuỗi.
+    """
+    return {col: dtype for col, dtype in dtypes.items() if not dtype.startswith(WIDE_DTYPES)}
+
+
+# ====================================================
+# 🗂️ CACHE SCHEMA ĐÃ SUY LUẬN
+# ====================================================
+class SchemaCache:
+    """
+    Lưu {cột: dtype} đã suy luận (chỉ cột số / bool / thời gian, xem pinned_dtypes) theo nguồn,
+    LRU, ghi ra JSON. Lần đọc sau truyền thẳng dtype cho parser → bỏ qua suy luận các cột đó.
+    """
+
+    def __init__(self, path=CSV_SCHEMA_CACHE_PATH, max_entries=CSV_SCHEMA_CACHE_SIZE):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._entries.update(json.load(f))
+            except (OSError, ValueError):
+                pass
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def get(self, key):
+        with self._lock:
+            dtypes = self._entries.get(key)
+            if dtypes is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            # File cache cũ có thể còn ghim cột chuỗi/category
+            return pinned_dtypes(dtypes)
+
+    def put(self, key, dtypes):
+        with self._lock:
+            self._entries[key] = pinned_dtypes(dtypes)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save()
+
+    def drop(self, key):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._save()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+schema_cache = SchemaCache()
+
+
+# ====================================================
+# 📥 ĐỌC CSV
+# ====================================================
+def to_categories(df, max_ratio=CSV_CATEGORY_MAX_RATIO):
+    """
+    Cột chuỗi ít giá trị phân biệt → category (RAM nhỏ hơn, mask PII chỉ trên các giá trị phân biệt).
+    """
+    for col in df.select_dtypes(include=["object", "string"]).columns:
+        if len(df) and df[col].nunique(dropna=True) <= max_ratio * len(df):
+            df[col] = df[col].astype("category")
+    return df
+
+
+def _read(content, dtypes=None, usecols=None):
+    if CSV_ENGINE == "pyarrow":
+        # Parse đa luồng, cột giữ dạng Arrow (chuỗi không thành object Python)
+        return pd.read_csv(io.BytesIO(content), engine="pyarrow", dtype_backend="pyarrow",
+                           dtype=dtypes, usecols=usecols)
+    return pd.read_csv(io.BytesIO(content), dtype=dtypes, usecols=usecols)
+
+
+def load_csv(content, url=None, usecols=None):
+    """
+    bytes CSV → DataFrame (chưa mask). Engine pyarrow nếu có; kiểu các cột số được cache
+    theo URL / header nên lần sau đọc với dtype cố định. Cột chuỗi ít giá trị → category.
+    File không khớp schema đã cache → suy luận lại cho riêng file đó; chỉ nguồn URL
+    mới ghi đè schema (cùng 1 nguồn đã đổi định dạng), header dùng chung thì giữ nguyên.
+    """
+    key = schema_key(url, content)
+    dtypes = schema_cache.get(key)
+    if dtypes is not None:
+        if usecols is not None:
+            dtypes = {col: dtype for col, dtype in dtypes.items() if col in usecols}
+        try:
+            return to_categories(_read(content, dtypes, usecols))
+        except (ValueError, TypeError, KeyError):
+            # Thêm/bớt cột hoặc cột số lẫn giá trị lạ → suy luận lại, không ghi đè schema dùng chung
+            if not url:
+                key = None
+
+    try:
+        df = _read(content, usecols=usecols)
+    except ValueError:
+        if CSV_ENGINE != "pyarrow":
+            raise
+        # CSV mà Arrow không parse được (vd. dòng lệch số cột) → engine C
+        df = pd.read_csv(io.BytesIO(content), usecols=usecols)
+        return to_categories(df)
+
+    df = to_categories(df)
+    if usecols is None and key is not None:
+        schema_cache.put(key, {str(col): str(dtype) for col, dtype in df.dtypes.items()})
+    return df
@@ -0,0 +1,93 @@
+import os
+import threading
+from collections import OrderedDict
+from functools import cached_property
+
+# ⚙️ Số dataset giữ profile trong RAM
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", 8))
+
+NUMERIC_DESCRIBE_ROWS = ["count", "mean", "std", "min", "25%", "50%", "75%", "max"]
+
+
+# ====================================================
+# 📊 PROFILE CỦA 1 PHIÊN BẢN DATASET
+# ====================================================
+class DatasetProfile:
+    """
+    Thống kê của 1 DataFrame đã mask, mỗi trường chỉ tính 1 lần khi được hỏi tới.
+    answers: câu trả lời đã render theo loại câu hỏi.
+    """
+
+    def __init__(self, key, df):
+        self.key = key
+        self.df = df
+        self.answers = {}
+
+    @cached_property
+    def shape(self):
+        return self.df.shape
+
+    @cached_property
+    def missing(self):
+        return self.df.isnull().sum()
+
+    @cached_property
+    def numeric_cols(self):
+        return list(self.df.select_dtypes(include=['number']).columns)
+
+    @cached_property
+    def describe_all(self):
+        return self.df.describe(include='all')
+
+    @cached_property
+    def describe_numeric(self):
+        # Đã có describe(include='all') → cắt ra phần cột số, khỏi tính lại
+        if "describe_all" in self.__dict__:
+            return self.describe_all.loc[NUMERIC_DESCRIBE_ROWS, self.numeric_cols].astype(float)
+        return self.df[self.numeric_cols].describe()
+
+
+# ====================================================
+# 🗂️ LRU MEMO THEO DATASET KEY
+# ====================================================
+class ProfileMemo:
+    """
+    LRU giữ profile (DatasetProfile hoặc CSVStreamProfile) theo dataset key.
+    """
+
+    def __init__(self, max_entries=PROFILE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            profile = self._entries.get(key)
+            if profile is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return profile
+
+    def put(self, key, profile):
+        with self._lock:
+            self._entries[key] = profile
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+profile_memo = ProfileMemo()
@@ -0,0 +1,483 @@
+import os
+import re
+import io
+import json
+import difflib
+import operator
+import numpy as np
+import pandas as pd
+
+# ⚙️ Cấu hình query planner
+QUERY_MAX_ROWS = int(os.getenv("CSV_QUERY_MAX_ROWS", 20))  # số dòng tối đa in ra
+QUERY_DEFAULT_TOP_K = int(os.getenv("CSV_QUERY_TOP_K", 5))
+COLUMN_MATCH_CUTOFF = float(os.getenv("CSV_COLUMN_MATCH_CUTOFF", 0.85))  # difflib ratio
+
+OPERATORS = {
+    ">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le,
+    "==": operator.eq, "!=": operator.ne,
+}
+# Từ/cụm từ → toán tử so sánh (dài trước ngắn). Không có "is" trần: "the status is active rows"
+# không phải 1 filter, và "is" hay dính vào tên cột kiểu is_active
+OPERATOR_WORDS = [
+    (">=", ">="), ("<=", "<="), ("!=", "!="), ("==", "=="), ("=", "=="), (">", ">"), ("<", "<"),
+    ("greater than", ">"), ("more than", ">"), ("above", ">"), ("lớn hơn", ">"),
+    ("less than", "<"), ("below", "<"), ("under", "<"), ("nhỏ hơn", "<"),
+    ("is not", "!="), ("khác", "!="), ("equals", "=="), ("equal to", "=="), ("bằng", "=="),
+]
+AGG_WORDS = [
+    ("trung bình", "mean"), ("average", "mean"), ("mean", "mean"), ("avg", "mean"),
+    ("median", "median"), ("trung vị", "median"),
+    ("sum", "sum"), ("total", "sum"), ("tổng", "sum"),
+    ("how many", "count"), ("number of", "count"), ("count", "count"), ("số lượng", "count"), ("đếm", "count"),
+    ("maximum", "max"), ("max", "max"), ("lớn nhất", "max"),
+    ("minimum", "min"), ("min", "min"), ("nhỏ nhất", "min"),
+]
+GROUP_WORDS = r"\b(?:group by|grouped by|by|per|for each|theo|mỗi)\b"
+HIST_WORDS = r"\b(?:histogram|hist|biểu đồ|phân phối|distribution)\b"
+CORR_WORDS = r"\b(?:correlation|correlations|corr|correlate|tương quan)\b"
+TOP_WORDS = r"\b(top|bottom|largest|highest|biggest|smallest|lowest)\b(?:\s+(\d+))?"
+VALUE_PATTERN = r"""\s*(?:'([^']*)'|"([^"]*)"|(-?\d+(?:\.\d+)?)(?![\w.])|([^\s,;?]+))"""
+
+
+# ====================================================
+# 🔤 KHỚP TÊN CỘT TRONG CÂU HỎI
+# ====================================================
+def _column_pattern(col):
+    # "unit_price" khớp "unit price", "unit-price", "Unit_Price"
+    parts = [re.escape(p) for p in re.split(r"[\s_\-]+", str(col).lower().strip()) if p]
+    return r"(?<!\w)" + r"[\s_\-]+".join(parts) + r"(?!\w)" if parts else None
+
+
+def find_columns(q, columns):
+    """
+    Các cột được nhắc tới trong câu hỏi → list (start, end, tên cột) theo vị trí.
+    Khớp nguyên tên trước (tên dài ưu tiên), sau đó khớp gần đúng từng từ còn lại bằng difflib
+    (vd. "prise" → "price").
+    """
+    q = q.lower()
+    taken = np.zeros(len(q) + 1, dtype=bool)
+    mentions = []
+    for col in sorted(columns, key=lambda c: -len(str(c))):
+        pattern = _column_pattern(col)
+        if pattern is None:
+            continue
+        for m in re.finditer(pattern, q):
+            if not taken[m.start():m.end()].any():
+                taken[m.start():m.end()] = True
+                mentions.append((m.start(), m.end(), col))
+
+    names = {str(c).lower(): c for c in columns}
+    for m in re.finditer(r"[^\W\d]\w{2,}", q):
+        if taken[m.start():m.end()].any():
+            continue
+        close = difflib.get_close_matches(m.group(), names, n=1, cutoff=COLUMN_MATCH_CUTOFF)
+        if close:
+            taken[m.start():m.end()] = True
+            mentions.append((m.start(), m.end(), names[close[0]]))
+    return sorted(mentions, key=lambda x: x[0])
+
+
+def _parse_value(m):
+    quoted_1, quoted_2, number, word = m.groups()
+    if number is not None:
+        return float(number)
+    return next(v for v in (quoted_1, quoted_2, word) if v is not None)
+
+
+def _parse_filters(q, mentions):
+    """
+    "<cột> <toán tử> <giá trị>" ngay sau 1 cột → (list filter, set index mention đã dùng).
+    """
+    filters, used = [], set()
+    for idx, (_, end, col) in enumerate(mentions):
+        rest = q[end:]
+        for word, op in OPERATOR_WORDS:
+            m_op = re.match(r"\s*" + re.escape(word) + (r"(?!\w)" if word[0].isalpha() else ""), rest)
+            if not m_op:
+                continue
+            m_val = re.match(VALUE_PATTERN, rest[m_op.end():])
+            if m_val:
+                filters.append({"column": col, "op": op, "value": _parse_value(m_val)})
+                used.add(idx)
+            break
+    return filters, used
+
+
+def _find_agg(q):
+    best = None
+    for word, agg in AGG_WORDS:
+        m = re.search(r"(?<!\w)" + re.escape(word) + r"(?!\w)", q)
+        if m and (best is None or m.start() < best[0]):
+            best = (m.start(), agg)
+    return best[1] if best else None
+
+
+# ====================================================
+# 🧭 LẬP KẾ HOẠCH: CÂU HỎI → PHÉP TOÁN CÓ KIỂU
+# ====================================================
+def plan_query(q, columns, numeric_cols=None):
+    """
+    Phân tích câu hỏi thành 1 phép toán trên dataset, dạng dict:
+    {"op": histogram | corr | groupby | topk | filter, "filters": [...], "columns": cột cần đọc, ...}.
+    Không nhận ra phép toán nào → None (dùng lại các câu trả lời tổng quan).
+    numeric_cols=None → coi mọi cột là số (khi chỉ biết tên cột, chưa biết kiểu).
+    """
+    q = q.lower()
+    columns = list(columns)
+    numeric = set(columns if numeric_cols is None else numeric_cols)
+    mentions = find_columns(q, columns)
+    filters, used = _parse_filters(q, mentions)
+    free = [(start, col) for i, (start, _, col) in enumerate(mentions) if i not in used]
+    free_cols = list(dict.fromkeys(col for _, col in free))
+    free_numeric = [c for c in free_cols if c in numeric]
+    plan = None
+
+    if re.search(HIST_WORDS, q):
+        # Không nêu tên cột → cột số đầu tiên (như trước đây)
+        col = free_numeric[0] if free_numeric else None
+        bins = re.search(r"(\d+)\s*(?:bins?|khoảng)\b", q)
+        plan = {"op": "histogram", "column": col, "bins": int(bins.group(1)) if bins else None,
+                "columns": [col] if col else []}
+
+    elif re.search(CORR_WORDS, q):
+        plan = {"op": "corr", "columns": free_numeric}
+
+    else:
+        group = re.search(GROUP_WORDS, q)
+        group_col = next((col for start, col in free if group and start >= group.end()), None)
+        agg = _find_agg(q)
+        top = re.search(TOP_WORDS, q)
+        if group_col is not None:
+            values = [c for c in free_numeric if c != group_col]
+            agg = agg or ("mean" if values else "count")
+            if agg == "count":
+                values = []
+            plan = {"op": "groupby", "by": group_col, "agg": agg, "values": values,
+                    "columns": [group_col] + values}
+        elif top and free_numeric:
+            n = int(top.group(2)) if top.group(2) else QUERY_DEFAULT_TOP_K
+            ascending = top.group(1) in ("bottom", "smallest", "lowest")
+            col = free_numeric[0]
+            shown = [c for c in free_cols if c != col]
+            plan = {"op": "topk", "column": col, "k": n, "ascending": ascending,
+                    "show": shown, "columns": shown + [col] if shown else None}
+        elif agg == "count" and (free_cols or filters):
+            # "how many rows" / "count" trần → câu trả lời shape; chỉ đếm khi có cột hoặc filter cụ thể
+            plan = {"op": "groupby", "by": None, "agg": agg, "values": free_cols, "columns": free_cols}
+        elif agg and agg != "count" and free_numeric:
+            plan = {"op": "groupby", "by": None, "agg": agg, "values": free_numeric, "columns": free_numeric}
+        elif filters:
+            plan = {"op": "filter", "show": free_cols, "columns": free_cols or None}
+
+    if plan is None:
+        return None
+    plan["filters"] = filters
+    if plan["columns"] is not None:
+        plan["columns"] = list(dict.fromkeys(plan["columns"] + [f["column"] for f in filters]))
+    return plan
+
+
+def plan_key(plan):
+    """
+    Key ổn định của 1 plan → memo câu trả lời theo dataset.
+    """
+    return "query:" + json.dumps(plan, sort_keys=True, ensure_ascii=False, default=str)
+
+
+# ====================================================
+# ⚙️ THỰC THI (VECTOR HOÁ TRÊN PANDAS)
+# ====================================================
+def _filter_mask(series, op, value):
+    if isinstance(value, float):
+        numbers = pd.to_numeric(series, errors="coerce")
+        if numbers.notna().any():
+            return OPERATORS[op](numbers, value).fillna(False).to_numpy(dtype=bool)
+        value = f"{value:g}"
+    text = series.astype("string").str.lower().str.strip()
+    return OPERATORS[op](text, str(value).lower()).fillna(False).to_numpy(dtype=bool)
+
+
+def apply_filters(df, filters):
+    if not filters:
+        return df
+    mask = np.ones(len(df), dtype=bool)
+    for f in filters:
+        mask &= _filter_mask(df[f["column"]], f["op"], f["value"])
+    return df[mask]
+
+
+def describe_filters(filters):
+    def fmt(value):
+        return f"{value:g}" if isinstance(value, float) else repr(value)
+    return " and ".join(f"{f['column']} {f['op']} {fmt(f['value'])}" for f in filters)
+
+
+def _rows(df, columns=None):
+    df = df[columns] if columns else df
+    return df.head(QUERY_MAX_ROWS).to_string()
+
+
+def _where(plan):
+    return f" (where {describe_filters(plan['filters'])})" if plan["filters"] else ""
+
+
+def _numeric(df):
+    return df.apply(pd.to_numeric, errors="coerce").astype("float64")
+
+
+# Định dạng câu trả lời — dùng chung cho đường in-memory và đường đọc theo chunk
+def _filter_answer(plan, n_match, rows):
+    return f"🔎 {n_match} rows match {describe_filters(plan['filters'])}:\n{_rows(rows, plan['show'])}"
+
+
+def _topk_answer(plan, rows):
+    label = "Bottom" if plan["ascending"] else "Top"
+    shown = plan["show"] + [plan["column"]] if plan["show"] else None
+    return f"🏆 {label} {plan['k']} rows by '{plan['column']}'{_where(plan)}:\n{_rows(rows, shown)}"
+
+
+def _corr_answer(plan, corr):
+    if corr.shape[1] < 2:
+        return "Cần ít nhất 2 cột số để tính tương quan."
+    if corr.shape[1] == 2:
+        a, b = corr.columns
+        return f"📈 Correlation between '{a}' and '{b}'{_where(plan)}: {corr.iloc[0, 1]:.4f}"
+    return f"📈 Correlation matrix{_where(plan)}:\n{corr.round(4).to_string()}"
+
+
+def _groupby_answer(plan, result, note=""):
+    agg, where = plan["agg"], _where(plan)
+    if plan["by"] is None:
+        if agg == "count" and plan["values"]:
+            return f"🔢 Non-null count{where}:\n{result.to_string()}"
+        if agg == "count":
+            return f"🔢 Count{where}: {result}"
+        return f"📊 {agg} of {', '.join(map(str, plan['values']))}{where}{note}:\n{result.to_string()}"
+    if isinstance(result, pd.DataFrame) and len(result.columns):
+        result = result.sort_values(result.columns[0], ascending=False)
+    else:
+        result = result.sort_values(ascending=False)
+    more = f"\n… {len(result) - QUERY_MAX_ROWS} more groups" if len(result) > QUERY_MAX_ROWS else ""
+    return f"📊 {agg} by '{plan['by']}'{where}{note}:\n{result.head(QUERY_MAX_ROWS).to_string()}{more}"
+
+
+def run_query(plan, df):
+    """
+    Chạy plan (trừ histogram) trên DataFrame đã mask → câu trả lời dạng text.
+    """
+    df = apply_filters(df, plan["filters"])
+    op = plan["op"]
+
+    if op == "filter":
+        return _filter_answer(plan, len(df), df)
+
+    if op == "topk":
+        values = pd.to_numeric(df[plan["column"]], errors="coerce")
+        order = values.nsmallest(plan["k"]) if plan["ascending"] else values.nlargest(plan["k"])
+        return _topk_answer(plan, df.loc[order.index])
+
+    if op == "corr":
+        numeric = df[plan["columns"]] if plan["columns"] else df.select_dtypes(include=["number"])
+        return _corr_answer(plan, _numeric(numeric).corr())
+
+    if op == "groupby":
+        agg, values = plan["agg"], plan["values"]
+        if plan["by"] is None:
+            if agg == "count":
+                return _groupby_answer(plan, df[values].count() if values else len(df))
+            return _groupby_answer(plan, _numeric(df[values]).agg(agg))
+        if agg == "count" or not values:
+            result = df.groupby(plan["by"], sort=False, observed=True).size().rename("count")
+        else:
+            result = _numeric(df[values]).groupby(df[plan["by"]], sort=False, observed=True).agg(agg)
+        return _groupby_answer(plan, result)
+
+    raise ValueError(f"Unknown query op: {op}")
+
+
+def count_from_profile(plan, n_rows, missing):
+    """
+    Plan count không filter → trả lời thẳng từ số dòng / missing của profile, không đọc lại file.
+    """
+    if plan["values"]:
+        return _groupby_answer(plan, (n_rows - missing[plan["values"]]).astype("int64"))
+    return _groupby_answer(plan, n_rows)
+
+
+# ====================================================
+# 🌊 THỰC THI THEO CHUNK (CHẾ ĐỘ STREAMING)
+# ====================================================
+def _combine(parts, how):
+    # Gộp kết quả groupby của các chunk, giữ thứ tự xuất hiện của nhóm như groupby(sort=False)
+    frame = pd.concat(parts)
+    return getattr(frame.groupby(level=0, sort=False), how)()
+
+
+class _PairwiseCorr:
+    """
+    Tổng cộng dồn cho hệ số tương quan Pearson từng cặp cột (bỏ NaN theo cặp như DataFrame.corr).
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        p = len(self.columns)
+        self.shift = None
+        self.n, self.sx, self.sy, self.sxx, self.syy, self.sxy = (np.zeros((p, p)) for _ in range(6))
+
+    def update(self, frame):
+        x = frame[self.columns].to_numpy(dtype=np.float64)
+        if self.shift is None:
+            # Trừ giá trị đại diện của chunk đầu → tổng bình phương ít mất chính xác
+            self.shift = np.nan_to_num(np.nanmean(x, axis=0)) if len(x) else np.zeros(x.shape[1])
+        x = x - self.shift
+        valid = ~np.isnan(x)
+        x0 = np.where(valid, x, 0.0)
+        both = valid.T.astype(np.float64) @ valid
+        self.n += both
+        self.sx += x0.T @ valid
+        self.sy += valid.T.astype(np.float64) @ x0
+        self.sxx += (x0 ** 2).T @ valid
+        self.syy += valid.T.astype(np.float64) @ (x0 ** 2)
+        self.sxy += x0.T @ x0
+
+    def result(self):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cov = self.n * self.sxy - self.sx * self.sy
+            var = (self.n * self.sxx - self.sx ** 2) * (self.n * self.syy - self.sy ** 2)
+            corr = np.clip(cov / np.sqrt(var), -1.0, 1.0)
+        corr[self.n < 2] = np.nan
+        return pd.DataFrame(corr, index=self.columns, columns=self.columns)
+
+
+def run_query_chunks(plan, chunks):
+    """
+    Như run_query nhưng trên iterator các chunk đã mask: mỗi phép toán giữ accumulator gộp được
+    (đếm, tổng, min/max, top-k hiện tại, tổng cho tương quan) → RAM chỉ phụ thuộc kích thước chunk.
+    median dùng QuantileSketch: chính xác tới CSV_EXACT_QUANTILE_ROWS giá trị, sau đó là ước lượng.
+    """
+    from app.utils import csv_stream
+
+    op, agg = plan["op"], plan.get("agg")
+    filters, values = plan["filters"], plan.get("values") or []
+    n_match, head, best, corr, sketches = 0, [], None, None, {}
+    sizes, sums, counts, extremes, rows, n_rows = [], [], [], [], [], 0
+    non_null = None
+    empty = None
+
+    for chunk in chunks:
+        if empty is None:
+            empty = chunk.iloc[:0]
+        chunk = apply_filters(chunk, filters)
+        n_match += len(chunk)
+
+        if op == "filter":
+            kept = sum(len(part) for part in head)
+            if kept < QUERY_MAX_ROWS:
+                head.append(chunk.head(QUERY_MAX_ROWS - kept))
+
+        elif op == "topk":
+            # Top-k của (top-k hiện tại + chunk mới); index giữ nguyên số dòng trong file
+            candidates = chunk if best is None else pd.concat([best, chunk])
+            scores = pd.Series(pd.to_numeric(candidates[plan["column"]], errors="coerce").to_numpy())
+            order = scores.nsmallest(plan["k"]) if plan["ascending"] else scores.nlargest(plan["k"])
+            best = candidates.iloc[order.index]
+
+        elif op == "corr":
+            if corr is None:
+                columns = plan["columns"] or list(chunk.select_dtypes(include=["number"]).columns)
+                corr = _PairwiseCorr(columns)
+            corr.update(_numeric(chunk[corr.columns]))
+
+        elif op == "groupby" and plan["by"] is None:
+            if agg == "count":
+                if values:
+                    part = chunk[values].count()
+                    non_null = part if non_null is None else non_null + part
+                continue
+            numeric = _numeric(chunk[values])
+            if agg == "median":
+                for col in values:
+                    sketch = sketches.setdefault(col, csv_stream.QuantileSketch())
+                    column = numeric[col].to_numpy()
+                    sketch.update(column[~np.isnan(column)])
+            else:
+                sums.append(numeric.sum().to_frame().T)
+                counts.append(numeric.count().to_frame().T)
+                extremes.append(numeric.agg(["min", "max"]))
+
+        elif op == "groupby":
+            keys = chunk[plan["by"]]
+            if agg == "count" or not values:
+                sizes.append(chunk.groupby(plan["by"], sort=False, observed=True).size())
+                continue
+            grouped = _numeric(chunk[values]).groupby(keys, sort=False, observed=True)
+            if agg == "median":
+                # Median theo nhóm không gộp được → giữ các dòng khớp, tối đa CSV_EXACT_QUANTILE_ROWS
+                n_rows += len(chunk)
+                if n_rows > csv_stream.CSV_EXACT_QUANTILE_ROWS:
+                    return (f"Median theo nhóm ở chế độ streaming chỉ hỗ trợ tối đa {csv_stream.CSV_EXACT_QUANTILE_ROWS} "
+                            "dòng khớp; hãy hỏi mean / sum / min / max.")
+                rows.append(chunk[[plan["by"]] + values])
+            elif agg == "mean":
+                sums.append(grouped.sum())
+                counts.append(grouped.count())
+            else:
+                extremes.append(grouped.agg(agg))
+
+    if empty is None:
+        return "CSV không có dòng dữ liệu nào."
+
+    if op == "filter":
+        return _filter_answer(plan, n_match, pd.concat(head) if head else empty)
+    if op == "topk":
+        return _topk_answer(plan, best if best is not None else empty)
+    if op == "corr":
+        return _corr_answer(plan, corr.result())
+
+    if plan["by"] is None:
+        if agg == "count":
+            return _groupby_answer(plan, non_null.astype("int64") if values else n_match)
+        if agg == "median":
+            result = pd.Series({col: sketches[col].quantile(0.5, -np.inf, np.inf) for col in values}, dtype="float64")
+            approx = any(not sketch.exact for sketch in sketches.values())
+            return _groupby_answer(plan, result, " (approx.)" if approx else "")
+        total = pd.concat(sums).sum()
+        n = pd.concat(counts).sum()
+        if agg == "mean":
+            result = total / n.where(n > 0)
+        elif agg == "sum":
+            result = total
+        else:
+            both = pd.concat(extremes)
+            result = both[both.index == agg].agg(agg)
+        return _groupby_answer(plan, result.astype("float64"))
+
+    if agg == "count" or not values:
+        result = _combine(sizes, "sum").rename("count") if sizes else pd.Series(dtype="int64", name="count")
+    elif agg == "median":
+        rows = pd.concat(rows)
+        result = _numeric(rows[values]).groupby(rows[plan["by"]], sort=False, observed=True).median()
+    elif agg == "mean":
+        result = _combine(sums, "sum") / _combine(counts, "sum")
+    else:
+        result = _combine(extremes, agg)
+    return _groupby_answer(plan, result)
+
+
+# ====================================================
+# 📥 ĐỌC CHỈ CÁC CỘT CẦN (PUSHDOWN)
+# ====================================================
+def read_header(source):
+    """
+    Đọc dòng header của CSV stream → list tên cột (stream dừng ngay sau header).
+    """
+    line = source.readline()
+    return list(pd.read_csv(io.BytesIO(line), nrows=0).columns)
+
+
+def iter_columns(source, names, columns, chunksize):
+    """
+    Đọc phần còn lại của CSV (sau header) theo chunk, chỉ parse các cột cần (usecols).
+    Index của chunk nối tiếp nhau = số dòng trong file (như đọc cả file 1 lần).
+    """
+    return pd.read_csv(source, header=None, names=names, usecols=columns, chunksize=chunksize)
@@ -0,0 +1,302 @@
+import os
+import numpy as np
+import pandas as pd
+from app.utils.pii_utils import PII_PATTERNS, mask_dataframe, log_audit
+from app.utils.metrics import timed
+
+# ⚙️ Cấu hình đọc CSV theo chunk
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", 100_000))
+HISTOGRAM_BINS = 1024  # số bin nội bộ (phải chẵn), rút gọn khi hiển thị
+# Số giá trị tối đa giữ nguyên để tính quantile chính xác; nhiều hơn → ước lượng từ histogram
+CSV_EXACT_QUANTILE_ROWS = int(os.getenv("CSV_EXACT_QUANTILE_ROWS", CSV_CHUNK_ROWS))
+
+
+# ====================================================
+# 🧮 ACCUMULATOR CHO THỐNG KÊ SỐ
+# ====================================================
+class RunningStats:
+    """
+    count / mean / std / min / max cộng dồn qua từng chunk (công thức Chan et al.),
+    merge được với accumulator khác.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values):
+        if len(values) == 0:
+            return
+        other = RunningStats()
+        other.count = len(values)
+        other.mean = float(values.mean())
+        other.m2 = float(((values - other.mean) ** 2).sum())
+        other.min = float(values.min())
+        other.max = float(values.max())
+        self.merge(other)
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / total
+        self.count = total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def std(self):
+        return float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else np.nan
+
+
+class StreamingHistogram:
+    """
+    Histogram với số bin cố định, tự nhân đôi độ rộng bin (gộp từng cặp bin)
+    khi gặp giá trị ngoài khoảng hiện tại. Dùng cho biểu đồ và ước lượng quantile.
+    """
+
+    def __init__(self, bins=HISTOGRAM_BINS):
+        self.bins = bins
+        self.lo = None
+        self.width = None
+        self.counts = np.zeros(bins, dtype=np.int64)
+
+    @property
+    def hi(self):
+        return self.lo + self.bins * self.width
+
+    def _grow(self, vmin, vmax):
+        half = np.zeros(self.bins // 2, dtype=np.int64)
+        while vmin < self.lo or vmax > self.hi:
+            merged = self.counts.reshape(-1, 2).sum(axis=1)
+            if vmin < self.lo:
+                # Mở rộng sang trái: bin cũ dồn vào nửa phải
+                self.lo -= self.bins * self.width
+                self.counts = np.concatenate([half, merged])
+            else:
+                self.counts = np.concatenate([merged, half])
+            self.width *= 2
+
+    def update(self, values, weights=None):
+        if len(values) == 0:
+            return
+        vmin, vmax = float(values.min()), float(values.max())
+        if self.lo is None:
+            self.lo = vmin
+            self.width = (vmax - vmin) / self.bins or 1.0
+        self._grow(vmin, vmax)
+        idx = np.minimum(((values - self.lo) / self.width).astype(np.int64), self.bins - 1)
+        self.counts += np.bincount(idx, weights=weights, minlength=self.bins).astype(np.int64)
+
+    def merge(self, other):
+        if other.lo is None:
+            return
+        # Dồn count của histogram kia vào tâm bin tương ứng (xấp xỉ)
+        centers = other.lo + (np.arange(other.bins) + 0.5) * other.width
+        nonzero = other.counts > 0
+        self.update(centers[nonzero], weights=other.counts[nonzero])
+
+    def to_bins(self, target=10):
+        """
+        Trả về (counts, edges) đã bỏ bin rỗng 2 đầu và gộp còn ~target bin.
+        """
+        if self.lo is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(1)
+        nonzero = np.flatnonzero(self.counts)
+        first, last = nonzero[0], nonzero[-1] + 1
+        counts = self.counts[first:last]
+        group = max(1, int(np.ceil(len(counts) / target)))
+        pad = (-len(counts)) % group
+        counts = np.concatenate([counts, np.zeros(pad, dtype=np.int64)]).reshape(-1, group).sum(axis=1)
+        edges = self.lo + self.width * (first + group * np.arange(len(counts) + 1))
+        return counts, edges
+
+    def quantile(self, q, vmin, vmax):
+        """
+        Ước lượng quantile bằng nội suy tuyến tính trong bin.
+        """
+        total = self.counts.sum()
+        if total == 0:
+            return np.nan
+        cum = np.cumsum(self.counts)
+        target = q * total
+        i = int(np.searchsorted(cum, target))
+        before = cum[i - 1] if i > 0 else 0
+        frac = (target - before) / self.counts[i] if self.counts[i] else 0.0
+        return float(np.clip(self.lo + (i + frac) * self.width, vmin, vmax))
+
+
+class QuantileSketch:
+    """
+    Quantile của 1 cột số đọc theo chunk: giữ nguyên giá trị khi tổng số ≤ exact_limit
+    (kết quả giống pandas, nội suy tuyến tính), vượt ngưỡng → bỏ giá trị, chỉ còn StreamingHistogram.
+    """
+
+    def __init__(self, exact_limit=None):
+        self.exact_limit = CSV_EXACT_QUANTILE_ROWS if exact_limit is None else exact_limit
+        self.hist = StreamingHistogram()
+        self.values = []
+        self.count = 0
+
+    @property
+    def exact(self):
+        return self.values is not None
+
+    def _keep(self, arrays, count):
+        self.count += count
+        if self.values is not None and self.count <= self.exact_limit:
+            self.values.extend(arrays)
+        else:
+            self.values = None
+
+    def update(self, values):
+        self.hist.update(values)
+        self._keep([np.array(values, dtype=np.float64)], len(values))
+
+    def merge(self, other):
+        self.hist.merge(other.hist)
+        if other.values is None:
+            self.values = None
+        self._keep(other.values or [], other.count)
+
+    def quantile(self, q, vmin, vmax):
+        if self.values is None:
+            return self.hist.quantile(q, vmin, vmax)
+        values = np.concatenate(self.values) if self.values else np.zeros(0)
+        return float(np.quantile(values, q)) if len(values) else np.nan
+
+
+# ====================================================
+# 📊 PROFILE CỦA CẢ FILE (CỘNG DỒN THEO CHUNK)
+# ====================================================
+class CSVStreamProfile:
+    """
+    Tổng hợp số dòng/cột, missing value, thống kê số và histogram của 1 CSV
+    mà không cần giữ toàn bộ file trong RAM.
+    """
+
+    def __init__(self):
+        self.n_rows = 0
+        self.columns = None
+        self.numeric_cols = []
+        self.missing_counts = None
+        self.stats = {}
+        self.quantiles = {}
+        self.histograms = {}
+        self.detected_types = set()
+        self.answers = {}
+
+    @property
+    def shape(self):
+        return self.n_rows, len(self.columns or [])
+
+    @property
+    def approximate(self):
+        """
+        True khi ít nhất 1 cột số có quantile là giá trị ước lượng (dữ liệu nhiều hơn CSV_EXACT_QUANTILE_ROWS).
+        """
+        return not all(sketch.exact for sketch in self.quantiles.values())
+
+    def _init_numeric(self):
+        self.stats = {c: RunningStats() for c in self.numeric_cols}
+        self.quantiles = {c: QuantileSketch() for c in self.numeric_cols}
+        # Histogram của mỗi cột nằm trong QuantileSketch, dùng chung cho biểu đồ
+        self.histograms = {c: sketch.hist for c, sketch in self.quantiles.items()}
+
+    def update(self, chunk):
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+            self.missing_counts = pd.Series(0, index=self.columns, dtype=np.int64)
+            # Cột số xác định theo chunk đầu tiên, các chunk sau được ép kiểu tương ứng
+            self.numeric_cols = [c for c in chunk.select_dtypes(include=["number"]).columns
+                                 if chunk[c].dtype != bool]
+            self._init_numeric()
+
+        self.n_rows += len(chunk)
+        self.missing_counts = self.missing_counts.add(chunk.isnull().sum(), fill_value=0).astype(np.int64)
+        for col in self.numeric_cols:
+            values = pd.to_numeric(chunk[col], errors="coerce").to_numpy(dtype=np.float64)
+            values = values[np.isfinite(values)]
+            self.stats[col].update(values)
+            self.quantiles[col].update(values)
+
+    def merge(self, other):
+        """
+        Gộp profile của 1 phần file khác (cùng schema) vào profile này.
+        """
+        if other.columns is None:
+            return
+        if self.columns is None:
+            self.columns = other.columns
+            self.numeric_cols = other.numeric_cols
+            self.missing_counts = other.missing_counts.copy()
+            self._init_numeric()
+        else:
+            self.missing_counts = self.missing_counts.add(other.missing_counts, fill_value=0).astype(np.int64)
+        self.n_rows += other.n_rows
+        for col in self.numeric_cols:
+            self.stats[col].merge(other.stats[col])
+            self.quantiles[col].merge(other.quantiles[col])
+        self.detected_types |= other.detected_types
+
+    def missing(self):
+        return self.missing_counts.copy()
+
+    def describe_numeric(self):
+        """
+        Tương đương df.select_dtypes('number').describe(); quantile chính xác khi cột còn
+        ≤ CSV_EXACT_QUANTILE_ROWS giá trị, ngược lại là ước lượng (xem approximate).
+        """
+        rows = {}
+        for col in self.numeric_cols:
+            st, hist = self.stats[col], self.quantiles[col]
+            rows[col] = {
+                "count": float(st.count),
+                "mean": st.mean if st.count else np.nan,
+                "std": st.std,
+                "min": st.min if st.count else np.nan,
+                "25%": hist.quantile(0.25, st.min, st.max),
+                "50%": hist.quantile(0.50, st.min, st.max),
+                "75%": hist.quantile(0.75, st.min, st.max),
+                "max": st.max if st.count else np.nan,
+            }
+        return pd.DataFrame(rows)
+
+    def describe(self):
+        """
+        Tóm tắt mọi cột: count (non-null) cho tất cả, thêm thống kê cho cột số.
+        """
+        summary = self.describe_numeric().reindex(columns=self.columns)
+        summary.loc["count"] = (self.n_rows - self.missing_counts).astype(float)
+        return summary
+
+
+def masked_chunks(reader, detected=None):
+    """
+    Mask PII từng chunk của 1 reader pd.read_csv(chunksize=...) ngay khi đọc.
+    Đọc hết → ghi đúng 1 dòng audit cho cả file (các type gom vào detected nếu truyền vào).
+    """
+    detected = set() if detected is None else detected
+    for chunk in reader:
+        with timed("csv_mask"):
+            chunk, found = mask_dataframe(chunk)
+        detected |= found
+        yield chunk
+    if detected:
+        log_audit("mask_csv", [key for key in PII_PATTERNS if key in detected])
+
+
+def profile_csv_stream(source, chunksize=CSV_CHUNK_ROWS):
+    """
+    Đọc CSV theo từng chunk, mask PII từng chunk ngay khi đọc, cộng dồn profile.
+    RAM tối đa ~ kích thước 1 chunk. Chỉ ghi 1 dòng audit cho cả file.
+    """
+    profile = CSVStreamProfile()
+    for chunk in masked_chunks(pd.read_csv(source, chunksize=chunksize), profile.detected_types):
+        profile.update(chunk)
+    return profile
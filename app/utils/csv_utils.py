@@ -1,108 +1,351 @@
+import numpy as np
 import pandas as pd
-import io
-import json
 from pathlib import Path
-import matplotlib.pyplot as plt
-import uuid
 import os
-from datetime import datetime
-from app.utils.pii_utils import mask_csv_pii  # 🧩 import mask CSV
 import re
+import hashlib
+import urllib.request
+from app.utils.pii_utils import mask_csv_pii  # 🧩 import mask CSV
+from app.utils.csv_stream import CSV_CHUNK_ROWS, StreamingHistogram, masked_chunks, profile_csv_stream
+from app.utils.dataset_cache import dataset_cache, content_key, url_key
+from app.utils.csv_profile import DatasetProfile, profile_memo
+from app.utils.charts import chart_store, CHART_BINS
+from app.utils.csv_loader import load_csv
+from app.utils.csv_query import (plan_query, plan_key, run_query, run_query_chunks, count_from_profile,
+                                 apply_filters, read_header, iter_columns)
+from app.utils.memory_store import get_store
+from app.utils.executor import run_io
+from app.utils.metrics import timed
 
 # ⚙️ Đường dẫn lưu data
-MEMORY_PATH = Path("app/data/memory.json")
 DATA_DIR = "app/data"
 Path(DATA_DIR).mkdir(parents=True, exist_ok=True)
+CSV_STREAM_THRESHOLD = int(os.getenv("CSV_STREAM_THRESHOLD_BYTES", 100 * 1024 * 1024))
+CSV_URL_TIMEOUT = int(os.getenv("CSV_URL_TIMEOUT", 60))
+
 
 # ====================================================
 # 🧩 HÀM PHÂN TÍCH CSV
 # ====================================================
-async def process_csv(file=None, url=None, question=None):
+def _open_url(url):
     """
-    Đọc CSV, mask PII, và trả kết quả theo câu hỏi người dùng.
+    Mở CSV từ URL (hoặc đường dẫn local) dạng stream → (file-like, kích thước hoặc None).
     """
-    # Đọc file CSV
-    if file:
-        content = await file.read()
-        df = pd.read_csv(io.BytesIO(content))
-        temp_path = os.path.join(DATA_DIR, f"temp_{uuid.uuid4().hex}.csv")
-        df.to_csv(temp_path, index=False)
-        df = mask_csv_pii(temp_path)
+    if "://" not in url:
+        return open(url, "rb"), os.path.getsize(url)
+    resp = urllib.request.urlopen(url, timeout=CSV_URL_TIMEOUT)
+    length = resp.headers.get("Content-Length")
+    return resp, int(length) if length else None
 
-    elif url:
-        df = pd.read_csv(url)
-        temp_path = os.path.join(DATA_DIR, f"temp_{uuid.uuid4().hex}.csv")
-        df.to_csv(temp_path, index=False)
-        df = mask_csv_pii(temp_path)
-    else:
-        raise ValueError("Cần file hoặc URL CSV!")
 
-    # Chuẩn hóa câu hỏi
-    q = question.lower() if question else ""
+SUMMARY_WORDS = r"tóm tắt|\bsummary\b"
+MISSING_WORDS = r"\bmissing\b|\bna\b|\bnan\b|\bnull\b"
+COLUMN_COUNT_WORDS = r"\b(?:how many|number of|count)\b.*\bcolumns?\b|\b(?:bao nhiêu|số) cột\b"
+
+
+def _keyword_intent(q):
+    """
+    Intent theo từ khoá rõ ràng (summary / missing / số cột) → luôn thắng query planner,
+    vd. "summary by city" vẫn là summary, "how many na in email" là bảng missing.
+    """
+    if re.search(SUMMARY_WORDS, q):
+        return "summary"
+    if re.search(MISSING_WORDS, q):
+        # "missing values per column" → bảng missing theo cột; chỉ "most" / "nhiều" mới hỏi cột thiếu nhiều nhất
+        return "most_missing" if re.search(r"\bmost\b|nhiều", q) else "missing"
+    if re.search(COLUMN_COUNT_WORDS, q):
+        return "shape"
+    return None
+
 
-    # Các loại câu hỏi
-    if "tóm tắt" in q or "summary" in q:
-        return str(df.describe(include='all'))
+def _route_question(q):
+    """
+    Phân loại câu hỏi theo từ khoá → loại phân tích cần chạy.
+    """
+    intent = _keyword_intent(q)
+    if intent is not None:
+        return intent
+    if "basic stats" in q or "numeric" in q or "thống kê" in q:
+        return "numeric"
+    if "histogram" in q or "hist" in q or "biểu đồ" in q:
+        return "histogram"
+    return "shape"
 
-    elif ("missing" in q or "na" in q) and ("column" in q or "nhiều" in q or "most" in q):
-        col = df.isnull().sum().idxmax()
-        return f"🧩 The column with the most missing values is: '{col}'."
 
-    elif "missing" in q or "na" in q:
-        missing = df.isnull().sum().sort_values(ascending=False)
-        return f"🔍 Missing value summary:\n{missing.head()}"
+def _histogram_answer(chart):
+    """
+    Câu trả lời histogram: text + bin JSON (frontend tự vẽ) + link PNG render theo yêu cầu.
+    """
+    if not chart["counts"]:
+        return f"Cột '{chart['column']}' không có giá trị số để vẽ biểu đồ!"
+    return {
+        "reply": f"📊 Histogram của '{chart['column']}' ({chart['bins']} bins), PNG: {chart['png_url']}",
+        "chart": chart,
+    }
+
+
+def _memo_answer(profile, intent, render):
+    """
+    Câu trả lời đã render được nhớ theo từng profile → hỏi lại chỉ tốn 1 lần tra dict.
+    """
+    answer = profile.answers.get(intent)
+    if answer is None:
+        answer = profile.answers[intent] = render()
+    return answer
+
+
+def _run_plan(plan, df, key=None):
+    """
+    Chạy plan của query planner trên DataFrame đã mask (histogram → vẽ PNG).
+    """
+    if plan["op"] != "histogram":
+        return run_query(plan, df)
+    numeric_cols = list(df.select_dtypes(include=["number"]).columns)
+    col = plan["column"] or (numeric_cols[0] if numeric_cols else None)
+    if col is None:
+        return "Không có cột số để vẽ biểu đồ!"
+    chart = chart_store.histogram(key, col, values=apply_filters(df, plan["filters"])[col],
+                                  bins=plan["bins"] or CHART_BINS, filters=plan["filters"])
+    return _histogram_answer(chart)
+
+
+def _is_plain_count(plan):
+    return plan["op"] == "groupby" and plan["by"] is None and plan["agg"] == "count" and not plan["filters"]
+
+
+def _timed_chunks(reader):
+    # Thời gian parse từng chunk → stage csv_parse (mask được đo riêng trong masked_chunks)
+    chunks = iter(reader)
+    while True:
+        with timed("csv_parse"):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def _run_plan_chunks(plan, chunks, key=None):
+    """
+    Chạy plan trên các chunk đã mask (chế độ streaming, RAM ~ 1 chunk).
+    Histogram có filter → bin xấp xỉ từ StreamingHistogram như histogram streaming thường.
+    """
+    if plan["op"] != "histogram":
+        return run_query_chunks(plan, chunks)
+    col, bins = plan["column"], plan["bins"] or CHART_BINS
+    hist = StreamingHistogram()
+    for chunk in chunks:
+        values = pd.to_numeric(apply_filters(chunk, plan["filters"])[col], errors="coerce").to_numpy(dtype=float)
+        hist.update(values[np.isfinite(values)])
+    counts, edges = hist.to_bins(target=bins)
+    return _histogram_answer(chart_store.histogram(key, col, counts=counts, edges=edges, bins=bins,
+                                                   filters=plan["filters"]))
+
+
+def _answer_dataframe(profile, q):
+    """
+    Trả lời từ DatasetProfile (DataFrame đầy đủ, thống kê tính lười + memo).
+    """
+    plan = None if _keyword_intent(q) else plan_query(q, profile.df.columns, profile.numeric_cols)
+    if plan is not None:
+        return _memo_answer(profile, plan_key(plan), lambda: _run_plan(plan, profile.df, profile.key))
+
+    intent = _route_question(q)
+
+    if intent == "summary":
+        return _memo_answer(profile, intent, lambda: str(profile.describe_all))
+
+    elif intent == "most_missing":
+        return _memo_answer(profile, intent, lambda: (
+            f"🧩 The column with the most missing values is: '{profile.missing.idxmax()}'."
+        ))
+
+    elif intent == "missing":
+        return _memo_answer(profile, intent, lambda: (
+            f"🔍 Missing value summary:\n{profile.missing.sort_values(ascending=False).head()}"
+        ))
 
     # 2️⃣ Thống kê cơ bản cho cột số
-    elif "basic stats" in q or "numeric" in q or "thống kê" in q:
-        numeric_df = df.select_dtypes(include=['number'])
-        if numeric_df.empty:
+    elif intent == "numeric":
+        if not profile.numeric_cols:
+            return "Không tìm thấy cột số nào trong dataset."
+        return _memo_answer(profile, intent, lambda: (
+            f"📊 Basic statistics for numeric columns:\n{profile.describe_numeric.to_string()}"
+        ))
+
+    elif intent == "histogram":
+        if not profile.numeric_cols:
+            return "Không có cột số để vẽ biểu đồ!"
+        col = profile.numeric_cols[0]
+        return _histogram_answer(chart_store.histogram(profile.key, col, values=profile.df[col]))
+
+    else:
+        n_rows, n_cols = profile.shape
+        return f"Dataset có {n_rows} hàng và {n_cols} cột."
+
+
+def _answer_profile(profile, q, key=None, plan=None):
+    """
+    Trả lời từ CSVStreamProfile (chế độ streaming; quantile là ước lượng khi file lớn hơn 1 chunk).
+    """
+    intent = "histogram" if plan and plan["op"] == "histogram" else _route_question(q)
+    approx = " (streaming, approx. quantiles)" if profile.approximate else ""
+
+    if intent == "summary":
+        return _memo_answer(profile, intent, lambda: (
+            f"📋 Summary{approx}:\n{profile.describe()}" if approx else str(profile.describe())
+        ))
+
+    elif intent == "most_missing":
+        return _memo_answer(profile, intent, lambda: (
+            f"🧩 The column with the most missing values is: '{profile.missing().idxmax()}'."
+        ))
+
+    elif intent == "missing":
+        return _memo_answer(profile, intent, lambda: (
+            f"🔍 Missing value summary:\n{profile.missing().sort_values(ascending=False).head()}"
+        ))
+
+    elif intent == "numeric":
+        if not profile.numeric_cols:
             return "Không tìm thấy cột số nào trong dataset."
-        stats = numeric_df.describe().to_string()
-        return f"📊 Basic statistics for numeric columns:\n{stats}"
-    elif "histogram" in q or "hist" in q or "biểu đồ" in q:
-        numeric_cols = df.select_dtypes(include=['number']).columns
-        if len(numeric_cols) == 0:
+        return _memo_answer(profile, intent, lambda: (
+            f"📊 Basic statistics for numeric columns{approx}:\n"
+            f"{profile.describe_numeric().to_string()}"
+        ))
+
+    elif intent == "histogram":
+        if not profile.numeric_cols:
             return "Không có cột số để vẽ biểu đồ!"
-        col = numeric_cols[0]
-        chart_path = os.path.join(DATA_DIR, f"{uuid.uuid4()}.png")
-        plt.figure()
-        df[col].hist()
-        plt.title(f"Histogram của {col}")
-        plt.savefig(chart_path)
-        plt.close()
-        return f"Đã tạo biểu đồ histogram cho '{col}' tại {chart_path}"
+        col = plan["column"] if plan and plan["column"] in profile.histograms else profile.numeric_cols[0]
+        bins = (plan and plan["bins"]) or CHART_BINS
+        counts, edges = profile.histograms[col].to_bins(target=bins)
+        return _histogram_answer(chart_store.histogram(key, col, counts=counts, edges=edges, bins=bins))
 
     else:
-        return f"Dataset có {df.shape[0]} hàng và {df.shape[1]} cột."
+        n_rows, n_cols = profile.shape
+        return f"Dataset có {n_rows} hàng và {n_cols} cột."
 
-# ====================================================
-# 💾 HÀM LƯU LỊCH SỬ CHAT
-# ====================================================
-def save_memory(user_msg: str, bot_reply: str):
+
+def _hash_file(fobj, block_size=1024 * 1024):
     """
-    Lưu lịch sử chat vào memory.json (format: {"history": [ ... ]})
+    sha256 của file upload (đọc tuần tự từng block, không giữ cả file trong RAM).
     """
-    MEMORY_PATH.parent.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    fobj.seek(0)
+    for block in iter(lambda: fobj.read(block_size), b""):
+        digest.update(block)
+    fobj.seek(0)
+    return "sha256-" + digest.hexdigest()
 
-    if MEMORY_PATH.exists():
-        with open(MEMORY_PATH, "r", encoding="utf-8") as f:
-            try:
-                memory = json.load(f)
-            except json.JSONDecodeError:
-                memory = {"history": []}
+
+def _process_csv_sync(fobj, size, url, q, stream):
+    """
+    Phần nặng của process_csv (đọc, parse, mask, thống kê) — chạy trên io_pool.
+    """
+    if fobj is not None:
+        source = fobj
+    elif url:
+        source, size = _open_url(url)
     else:
-        memory = {"history": []}
+        raise ValueError("Cần file hoặc URL CSV!")
 
-    if not isinstance(memory, dict):
-        memory = {"history": []}
-    if "history" not in memory or not isinstance(memory["history"], list):
-        memory["history"] = []
+    if stream is None:
+        stream = size is not None and size > CSV_STREAM_THRESHOLD
 
-    memory["history"].append({
-        "user": user_msg,
-        "bot": bot_reply,
-        "time": datetime.now().strftime("%H:%M %d/%m/%y")
-    })
+    try:
+        if stream:
+            if fobj is not None:
+                key = _hash_file(source)
+            else:
+                key = url_key(url, getattr(source, "headers", None))
+            memo_key = f"stream-{key}" if key else None
+            profile = profile_memo.get(memo_key) if memo_key else None
 
-    with open(MEMORY_PATH, "w", encoding="utf-8") as f:
-        json.dump(memory, f, indent=2, ensure_ascii=False)
+            # Query planner: chỉ parse các cột câu hỏi cần tới (usecols), từng chunk một
+            names = read_header(source)
+            plan = None if _keyword_intent(q) else plan_query(q, names, profile.numeric_cols if profile else None)
+            if plan is not None and (plan["op"] != "histogram" or (plan["column"] and plan["filters"])):
+                if profile is not None and _is_plain_count(plan):
+                    return count_from_profile(plan, profile.n_rows, profile.missing())
+                chunks = masked_chunks(_timed_chunks(iter_columns(source, names, plan["columns"], CSV_CHUNK_ROWS)))
+                return _run_plan_chunks(plan, chunks, key)
+
+            if profile is None:
+                if fobj is not None:
+                    source.seek(0)
+                else:
+                    # Header đã bị đọc khỏi stream URL → mở lại
+                    source.close()
+                    source, _ = _open_url(url)
+                profile = profile_csv_stream(source)
+                if memo_key:
+                    profile_memo.put(memo_key, profile)
+            return _answer_profile(profile, q, key, plan)
+
+        # Key cache: hash nội dung (upload) hoặc URL + ETag/Last-Modified
+        content = None
+        if fobj is not None:
+            source.seek(0)
+            content = source.read()
+            key = content_key(content)
+        else:
+            key = url_key(url, getattr(source, "headers", None))
+            if key is None:
+                content = source.read()
+                key = content_key(content)
+
+        profile = profile_memo.get(key)
+        if profile is None:
+            # Dataset đã cache dạng Parquet → lập plan theo schema, chỉ đọc các cột cần
+            schema = dataset_cache.schema(key)
+            plan = plan_query(q, *schema) if schema and not _keyword_intent(q) else None
+            if plan is not None and plan["columns"]:
+                df = dataset_cache.get(key, columns=plan["columns"])
+                if df is not None:
+                    return _run_plan(plan, df, key)
+
+            df = dataset_cache.get(key)
+            if df is None:
+                if content is None:
+                    content = source.read()
+                # Mask PII trực tiếp trên DataFrame (không ghi file tạm)
+                with timed("csv_parse"):
+                    df = load_csv(content, url=url if fobj is None else None)
+                df = mask_csv_pii(df)
+                dataset_cache.put(key, df)
+            profile = DatasetProfile(key, df)
+            profile_memo.put(key, profile)
+    finally:
+        if fobj is None:
+            source.close()
+
+    return _answer_dataframe(profile, q)
+
+
+async def process_csv(file=None, url=None, question=None, stream=None):
+    """
+    Đọc CSV, mask PII, và trả kết quả theo câu hỏi người dùng.
+    stream=True (hoặc file lớn hơn CSV_STREAM_THRESHOLD_BYTES) → đọc theo chunk,
+    RAM chỉ phụ thuộc kích thước chunk. Ngược lại DataFrame đã mask được cache
+    theo nội dung / URL để các câu hỏi tiếp theo bỏ qua parse + mask.
+    Thống kê của mỗi dataset được memo trong profile_memo.
+    Toàn bộ phần xử lý chạy trên io_pool để không chặn event loop.
+    """
+    # Chuẩn hóa câu hỏi
+    q = question.lower() if question else ""
+
+    if not file and not url:
+        raise ValueError("Cần file hoặc URL CSV!")
+
+    fobj, size = (file.file, file.size) if file else (None, None)
+    return await run_io(_process_csv_sync, fobj, size, url, q, stream)
+
+# ====================================================
+# 💾 HÀM LƯU LỊCH SỬ CHAT
+# ====================================================
+def save_memory(user_msg: str, bot_reply: str, session_id: str | None = None):
+    """
+    Lưu 1 turn chat vào conversation store (append 1 record, không ghi lại toàn bộ file).
+    """
+    with timed("memory_write"):
+        get_store().append(user_msg, bot_reply, session_id=session_id)
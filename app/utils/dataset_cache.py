@@ -0,0 +1,174 @@
+import os
+import hashlib
+import tempfile
+import threading
+import importlib.util
+from pathlib import Path
+from collections import OrderedDict
+import pandas as pd
+
+# ⚙️ Cấu hình cache dataset (DataFrame đã mask PII)
+DATASET_CACHE_DIR = Path(os.getenv("DATASET_CACHE_DIR", "app/data/cache/datasets"))
+DATASET_CACHE_MAX_BYTES = int(os.getenv("DATASET_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+
+def content_key(content: bytes) -> str:
+    """
+    Key theo nội dung file (sha256).
+    """
+    return "sha256-" + hashlib.sha256(content).hexdigest()
+
+
+def url_key(url, headers):
+    """
+    Key theo URL + ETag (hoặc Last-Modified). None nếu server không trả validator nào.
+    """
+    if headers is None:
+        return None
+    validator = headers.get("ETag") or headers.get("Last-Modified")
+    if not validator:
+        return None
+    return "url-" + hashlib.sha256(f"{url}\n{validator}".encode("utf-8")).hexdigest()
+
+
+class DatasetCache:
+    """
+    Cache DataFrame đã mask trên đĩa (Parquet nếu có pyarrow, nếu không thì pickle),
+    LRU theo tổng dung lượng file. Bộ đếm hit/miss đọc qua stats().
+    """
+
+    def __init__(self, directory=DATASET_CACHE_DIR, max_bytes=DATASET_CACHE_MAX_BYTES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.use_parquet = importlib.util.find_spec("pyarrow") is not None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (path, size), cũ nhất ở đầu
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # Dựng lại index LRU từ các file còn trên đĩa (mtime = lần dùng gần nhất)
+        files = sorted(
+            (p for p in self.directory.iterdir() if p.suffix in (".parquet", ".pkl")),
+            key=lambda p: p.stat().st_mtime,
+        )
+        for path in files:
+            size = path.stat().st_size
+            self._entries[path.stem] = (path, size)
+            self.total_bytes += size
+
+    def get(self, key, columns=None):
+        """
+        Lấy DataFrame theo key (chỉ đọc các cột cần nếu truyền columns) hoặc None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        path = entry[0]
+        try:
+            os.utime(path)
+            if path.suffix == ".parquet":
+                return pd.read_parquet(path, columns=columns)
+            df = pd.read_pickle(path)
+            return df[columns] if columns is not None else df
+        except (OSError, ValueError, KeyError):
+            self._drop(key)
+            return None
+
+    def schema(self, key):
+        """
+        (list cột, list cột số) đọc từ metadata Parquet (không đọc dữ liệu) hoặc None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry[0].suffix != ".parquet":
+            return None
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        try:
+            schema = pq.read_schema(entry[0])
+        except (OSError, ValueError):
+            return None
+        names = [name for name in schema.names if not name.startswith("__index_level_")]
+        numeric = [name for name in names
+                   if pa.types.is_integer(schema.field(name).type) or pa.types.is_floating(schema.field(name).type)]
+        return names, numeric
+
+    def _tmp_path(self, path):
+        # Tên tạm riêng cho mỗi lần ghi → 2 request (thread / worker) cùng put 1 key không ghi đè file của nhau
+        fd, name = tempfile.mkstemp(dir=self.directory, prefix=f"{path.name}.", suffix=".tmp")
+        os.close(fd)
+        return Path(name)
+
+    def put(self, key, df):
+        """
+        Ghi DataFrame vào cache (ghi file tạm rồi rename) và evict LRU nếu vượt ngân sách.
+        """
+        path = None
+        if self.use_parquet:
+            path = self.directory / f"{key}.parquet"
+            tmp = self._tmp_path(path)
+            try:
+                df.to_parquet(tmp, index=False)
+            except Exception:
+                # Cột object lẫn kiểu dữ liệu → Arrow không ghi được, dùng pickle
+                tmp.unlink(missing_ok=True)
+                path = None
+        if path is None:
+            path = self.directory / f"{key}.pkl"
+            tmp = self._tmp_path(path)
+            try:
+                df.to_pickle(tmp)
+            except Exception:
+                tmp.unlink(missing_ok=True)
+                raise
+        os.replace(tmp, path)
+
+        size = path.stat().st_size
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+                if old[0] != path:
+                    old[0].unlink(missing_ok=True)
+            self._entries[key] = (path, size)
+            self.total_bytes += size
+            self._evict()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            _, (path, size) = self._entries.popitem(last=False)
+            path.unlink(missing_ok=True)
+            self.total_bytes -= size
+            self.evictions += 1
+
+    def _drop(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.total_bytes -= entry[1]
+                entry[0].unlink(missing_ok=True)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "format": "parquet" if self.use_parquet else "pickle",
+            }
+
+
+dataset_cache = DatasetCache()
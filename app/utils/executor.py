@@ -0,0 +1,182 @@
+import os
+import asyncio
+import threading
+import functools
+import weakref
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+# ⚙️ Cấu hình worker pool
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", os.cpu_count() or 1))
+IO_WORKERS = int(os.getenv("IO_WORKERS", min(32, (os.cpu_count() or 1) + 4)))
+CPU_QUEUE = int(os.getenv("CPU_QUEUE", CPU_WORKERS * 4))
+IO_QUEUE = int(os.getenv("IO_QUEUE", IO_WORKERS * 4))
+CHAT_IO_WORKERS = int(os.getenv("CHAT_IO_WORKERS", 4))
+CHAT_IO_QUEUE = int(os.getenv("CHAT_IO_QUEUE", CHAT_IO_WORKERS * 16))
+QUEUE_TIMEOUT = float(os.getenv("QUEUE_TIMEOUT", 5))
+
+
+class Overloaded(Exception):
+    """
+    Hàng đợi của pool đã đầy quá QUEUE_TIMEOUT giây → route trả 503.
+    """
+
+
+class WorkerPool:
+    """
+    Bọc 1 executor (thread hoặc process) + giới hạn số job đang chờ/chạy.
+    Khi đủ max_pending job, request mới phải chờ slot; chờ quá timeout → Overloaded.
+    Code async dùng run(); code đồng bộ đang chạy trong job của pool khác dùng map().
+    """
+
+    def __init__(self, name, executor_cls, max_workers, max_pending, timeout=QUEUE_TIMEOUT, **executor_kwargs):
+        self.name = name
+        self.executor_cls = executor_cls
+        self.executor_kwargs = executor_kwargs
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+        self._semaphores = weakref.WeakKeyDictionary()  # 1 semaphore cho mỗi event loop
+        self._sync_cond = threading.Condition()  # slot cho map() từ thread khác
+        self._sync_free = max_pending
+        self._stats_lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    @property
+    def executor(self):
+        """
+        Executor được tạo lười ở lần dùng đầu tiên.
+        """
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = self.executor_cls(max_workers=self.max_workers, **self.executor_kwargs)
+        return self._executor
+
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        sem = self._semaphores.get(loop)
+        if sem is None:
+            sem = self._semaphores[loop] = asyncio.Semaphore(self.max_pending)
+        return sem
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Chạy fn(*args, **kwargs) trên pool, không chặn event loop.
+        """
+        sem = self._semaphore()
+        try:
+            await asyncio.wait_for(sem.acquire(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self._count(rejected=1)
+            raise Overloaded(f"{self.name} pool đang quá tải, thử lại sau")
+
+        self._count(in_flight=1)
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            self._count(in_flight=-1, completed=1)
+            sem.release()
+
+    def map(self, fn, *iterables):
+        """
+        Bản đồng bộ của run() cho nhiều job: list(fn(*args) cho từng bộ args), giữ thứ tự.
+        Lấy 1 lần đủ slot cho cả lô (tối đa max_pending, lô lớn hơn chạy cuốn chiếu trong
+        số slot đó) → 2 lô chạy cùng lúc không giữ mỗi bên 1 phần slot rồi chờ nhau.
+        Chờ slot quá timeout → Overloaded. Không gọi từ event loop (chặn tới khi xong).
+        """
+        jobs = list(zip(*iterables))
+        if not jobs:
+            return []
+        slots = min(len(jobs), self.max_pending)
+        self._acquire_sync(slots)
+        results = [None] * len(jobs)
+        pending = {}
+        try:
+            next_job = 0
+            while next_job < len(jobs) or pending:
+                while next_job < len(jobs) and len(pending) < slots:
+                    pending[self.executor.submit(fn, *jobs[next_job])] = next_job
+                    self._count(in_flight=1)
+                    next_job += 1
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    self._count(in_flight=-1, completed=1)
+                    results[index] = future.result()
+            return results
+        finally:
+            # Lỗi giữa chừng → huỷ job chưa chạy, chờ job đang chạy rồi mới trả slot
+            for future in pending:
+                future.cancel()
+            wait(pending)
+            self._count(in_flight=-len(pending), completed=len(pending))
+            self._release_sync(slots)
+
+    def _acquire_sync(self, slots):
+        with self._sync_cond:
+            if not self._sync_cond.wait_for(lambda: self._sync_free >= slots, timeout=self.timeout):
+                self._count(rejected=1)
+                raise Overloaded(f"{self.name} pool đang quá tải, thử lại sau")
+            self._sync_free -= slots
+
+    def _release_sync(self, slots):
+        with self._sync_cond:
+            self._sync_free += slots
+            self._sync_cond.notify_all()
+
+    def _count(self, in_flight=0, completed=0, rejected=0):
+        # run() cập nhật trên event loop, map() từ thread worker → khoá chung
+        with self._stats_lock:
+            self.in_flight += in_flight
+            self.completed += completed
+            self.rejected += rejected
+
+    def stats(self):
+        return {
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+# 🧵 Thread pool: I/O + thư viện nhả GIL (tesseract subprocess, cv2, parser C của pandas, ghi file)
+io_pool = WorkerPool("io", ThreadPoolExecutor, IO_WORKERS, IO_QUEUE)
+# 🧠 Process pool: xử lý Python thuần nặng CPU (regex mask DataFrame lớn)
+# spawn thay vì fork mặc định: fork từ server đa luồng có thể copy lock đang bị giữ vào process con
+cpu_pool = WorkerPool("cpu", ProcessPoolExecutor, CPU_WORKERS, CPU_QUEUE,
+                      mp_context=multiprocessing.get_context("spawn"))
+# 💬 Thread pool nhỏ cho I/O ngắn trên đường chat (ghi/đọc lịch sử) → không phải xếp hàng
+# sau job CSV/OCR/CLIP đang chiếm io_pool
+chat_pool = WorkerPool("chat", ThreadPoolExecutor, CHAT_IO_WORKERS, CHAT_IO_QUEUE)
+
+
+async def run_io(fn, *args, **kwargs):
+    return await io_pool.run(fn, *args, **kwargs)
+
+
+async def run_cpu(fn, *args, **kwargs):
+    return await cpu_pool.run(fn, *args, **kwargs)
+
+
+async def run_chat_io(fn, *args, **kwargs):
+    return await chat_pool.run(fn, *args, **kwargs)
+
+
+def shutdown_pools():
+    io_pool.shutdown()
+    cpu_pool.shutdown()
+    chat_pool.shutdown()
@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import atexit
+import threading
+from pathlib import Path
+import numpy as np
+from app.utils.ocr import cv2
+
+# ⚙️ Cấu hình cache ảnh upload
+IMAGE_UPLOAD_DIR = Path("app/data/uploads")
+IMAGE_INDEX_PATH = Path(os.getenv("IMAGE_INDEX_PATH", "app/data/cache/image_index.json"))  # ngoài thư mục public /uploads
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+IMAGE_DHASH_MAX_DISTANCE = int(os.getenv("IMAGE_DHASH_MAX_DISTANCE", 4))  # /64 bit
+# Ảnh gần giống chỉ được coi là trùng khi gần như không có pixel nào đổi
+# (tránh trả ảnh mask cũ cho 1 ảnh chụp màn hình chỉ khác số điện thoại)
+IMAGE_NEAR_DUP_PIXEL_DIFF = int(os.getenv("IMAGE_NEAR_DUP_PIXEL_DIFF", 48))
+IMAGE_NEAR_DUP_MAX_CHANGED = float(os.getenv("IMAGE_NEAR_DUP_MAX_CHANGED", 0.0002))
+# Cache hit chỉ đổi last_used (dùng cho LRU) → ghi lại index tối đa 1 lần mỗi khoảng này
+IMAGE_INDEX_SAVE_INTERVAL = float(os.getenv("IMAGE_INDEX_SAVE_INTERVAL", 5))
+
+
+def dhash(gray, size=8):
+    """
+    Difference hash 64 bit: thu nhỏ (size+1)×size, so sánh pixel kề nhau theo hàng ngang.
+    """
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def _hamming(hashes, value):
+    xor = np.bitwise_xor(hashes, np.uint64(value))
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class ImageCache:
+    """
+    Index ảnh upload theo sha256 (trùng tuyệt đối) + dHash (gần trùng, vd. ảnh nén lại):
+    - trúng → trả lại ảnh đã mask + loại PII, không OCR lại
+    - mỗi ảnh khác nhau chỉ lưu 1 bản (tên file = sha256)
+    - tổng dung lượng (ảnh gốc + ảnh mask) vượt IMAGE_CACHE_MAX_BYTES → xoá ảnh ít dùng nhất
+    Thêm ảnh → ghi index ngay; cache hit → chỉ đánh dấu dirty, ghi gộp (IMAGE_INDEX_SAVE_INTERVAL)
+    và ghi nốt lúc tắt process.
+    """
+
+    def __init__(self, directory=IMAGE_UPLOAD_DIR, index_path=IMAGE_INDEX_PATH, max_bytes=IMAGE_CACHE_MAX_BYTES):
+        self.directory = Path(directory)
+        self.index_path = Path(index_path)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.hits_exact = 0
+        self.hits_similar = 0
+        self.misses = 0
+        self.evictions = 0
+        self.index_writes = 0
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self._load()
+        atexit.register(self.flush)
+
+    # ---------- index trên đĩa ----------
+    def _load(self):
+        if not self.index_path.exists():
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        # Bỏ entry mà file đã bị xoá bằng tay, hoặc ảnh mask đã ghi đè ảnh gốc (bản cũ, đuôi .jpeg/.webp)
+        self._entries = {sha: e for sha, e in entries.items()
+                         if e["path"] != e["masked_path"]
+                         and os.path.exists(e["path"]) and os.path.exists(e["masked_path"])}
+
+    def _save(self):
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.index_path)
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self.index_writes += 1
+
+    def flush(self):
+        """
+        Ghi các last_used còn chờ (gọi khi tắt process).
+        """
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def path_for(self, sha256, ext):
+        return str(self.directory / f"{sha256[:32]}{ext.lower()}")
+
+    # ---------- tra cứu ----------
+    def _touch(self, entry):
+        # Gọi khi đang giữ _lock; mất vài giây last_used khi crash chỉ làm LRU lệch chút
+        entry["last_used"] = time.time()
+        self._dirty = True
+        if time.monotonic() - self._last_save >= IMAGE_INDEX_SAVE_INTERVAL:
+            self._save()
+        return dict(entry)
+
+    def get(self, sha256):
+        """
+        Trùng tuyệt đối theo sha256 của bytes upload.
+        """
+        with self._lock:
+            entry = self._entries.get(sha256)
+            if entry is None:
+                return None
+            self.hits_exact += 1
+            return self._touch(entry)
+
+    def find_similar(self, image_path, img=None):
+        """
+        Tìm ảnh gần trùng: cùng kích thước + dHash lệch ≤ IMAGE_DHASH_MAX_DISTANCE bit,
+        rồi xác nhận bằng so sánh pixel. Trả về (entry hoặc None, chữ ký {dhash, shape} của ảnh mới).
+        img: ảnh BGR đã decode sẵn (bỏ qua cv2.imread).
+        """
+        if img is not None:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        else:
+            gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            return None, None
+        value = dhash(gray)
+        signature = {"dhash": value, "shape": gray.shape}
+        with self._lock:
+            candidates = [e for e in self._entries.values() if tuple(e["shape"]) == gray.shape]
+        if candidates:
+            distances = _hamming(np.array([int(e["dhash"]) for e in candidates], dtype=np.uint64), value)
+            for idx in np.argsort(distances):
+                if distances[idx] > IMAGE_DHASH_MAX_DISTANCE:
+                    break
+                if self._same_pixels(gray, candidates[idx]["path"]):
+                    with self._lock:
+                        # Có thể vừa bị evict bởi request khác sau khi nhả lock → bỏ qua
+                        entry = self._entries.get(candidates[idx]["sha256"])
+                        if entry is None:
+                            continue
+                        self.hits_similar += 1
+                        return self._touch(entry), signature
+        with self._lock:
+            self.misses += 1
+        return None, signature
+
+    @staticmethod
+    def _same_pixels(gray, other_path):
+        other = cv2.imread(other_path, cv2.IMREAD_GRAYSCALE)
+        if other is None or other.shape != gray.shape:
+            return False
+        changed = np.count_nonzero(cv2.absdiff(gray, other) > IMAGE_NEAR_DUP_PIXEL_DIFF)
+        return changed <= IMAGE_NEAR_DUP_MAX_CHANGED * gray.size
+
+    # ---------- ghi ----------
+    def add(self, sha256, path, masked_path, detected, signature):
+        size = os.path.getsize(path) + os.path.getsize(masked_path)
+        with self._lock:
+            self._entries[sha256] = {
+                "sha256": sha256,
+                "path": path,
+                "masked_path": masked_path,
+                "detected": list(detected),
+                "dhash": str(signature["dhash"]),
+                "shape": list(signature["shape"]),
+                "size": size,
+                "last_used": time.time(),
+            }
+            self._evict(keep=sha256)
+            self._save()
+
+    def _evict(self, keep=None):
+        total = sum(e["size"] for e in self._entries.values())
+        for entry in sorted(self._entries.values(), key=lambda e: e["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if entry["sha256"] == keep:
+                continue
+            for path in (entry["path"], entry["masked_path"]):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            del self._entries[entry["sha256"]]
+            total -= entry["size"]
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            hits = self.hits_exact + self.hits_similar
+            lookups = hits + self.misses
+            return {
+                "hits_exact": self.hits_exact,
+                "hits_similar": self.hits_similar,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": sum(e["size"] for e in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "index_writes": self.index_writes,
+            }
+
+
+image_cache = ImageCache()
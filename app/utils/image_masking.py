@@ -0,0 +1,138 @@
+import os
+import numpy as np
+from app.utils.pii_utils import pii_scanner, log_audit
+from app.utils.ocr import cv2, run_ocr, StageTimer
+
+DIGIT_JOIN_CHARS = set("0123456789-.")
+
+
+# ====================================================
+# 🧩 GHÉP TỪ OCR THÀNH DÒNG
+# ====================================================
+def group_lines(words):
+    """
+    Gom các từ OCR theo dòng (tile, block, par, line), giữ thứ tự đọc.
+    Trả về list dòng, mỗi dòng là list index từ (sắp theo word_num).
+    """
+    lines = {}
+    tiles = words.get("tile") or [0] * len(words["text"])
+    for i in range(len(words["text"])):
+        if not str(words["text"][i]).strip():
+            continue
+        key = (tiles[i], words["block_num"][i], words["par_num"][i], words["line_num"][i])
+        lines.setdefault(key, []).append(i)
+    return [sorted(idx, key=lambda i: words["word_num"][i]) for idx in lines.values()]
+
+
+def _join_line(texts):
+    """
+    Nối các từ của 1 dòng thành chuỗi + vị trí (start, end) của từng từ.
+    Hai từ toàn số/dấu nối liền nhau (số điện thoại bị OCR tách) được nối không dấu cách.
+    """
+    parts, spans = [], []
+    pos = 0
+    for j, text in enumerate(texts):
+        if j:
+            prev = texts[j - 1]
+            sep = "" if prev[-1] in DIGIT_JOIN_CHARS and text[0] in DIGIT_JOIN_CHARS \
+                and set(prev) <= DIGIT_JOIN_CHARS and set(text) <= DIGIT_JOIN_CHARS else " "
+            parts.append(sep)
+            pos += len(sep)
+        parts.append(text)
+        spans.append((pos, pos + len(text)))
+        pos += len(text)
+    return "".join(parts), spans
+
+
+def find_pii_boxes(words):
+    """
+    Quét regex PII (1 lượt / dòng) trên cả dòng thay vì từng từ → bắt được
+    tên 2 từ và số điện thoại bị tách token. Trả về (mảng box (k, 4) x0,y0,x1,y1, list type).
+    """
+    boxes, detected = [], []
+    for line in group_lines(words):
+        texts = [str(words["text"][i]).strip() for i in line]
+        line_text, spans = _join_line(texts)
+        for pii_type, start, end in pii_scanner.scan(line_text):
+            detected.append(pii_type)
+            for i, (w_start, w_end) in zip(line, spans):
+                if w_start < end and w_end > start:
+                    x, y = words["left"][i], words["top"][i]
+                    boxes.append((x, y, x + words["width"][i], y + words["height"][i]))
+    return np.array(boxes, dtype=np.int64).reshape(-1, 4), detected
+
+
+# ====================================================
+# ⬛ TÔ ĐEN CÁC BOX (1 lần numpy)
+# ====================================================
+def fill_boxes(img, boxes, color=0):
+    """
+    Tô tất cả box bằng mảng hiệu 2D (difference array) + cumsum, chỉ trên vùng bao các box.
+    """
+    if not len(boxes):
+        return img
+    h, w = img.shape[:2]
+    boxes = boxes.copy()
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, w)
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, h)
+    boxes = boxes[(boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])]
+    if not len(boxes):
+        return img
+
+    x_min, y_min = boxes[:, 0].min(), boxes[:, 1].min()
+    x_max, y_max = boxes[:, 2].max(), boxes[:, 3].max()
+    x0, y0 = boxes[:, 0] - x_min, boxes[:, 1] - y_min
+    x1, y1 = boxes[:, 2] - x_min, boxes[:, 3] - y_min
+
+    diff = np.zeros((y_max - y_min + 1, x_max - x_min + 1), dtype=np.int32)
+    np.add.at(diff, (y0, x0), 1)
+    np.add.at(diff, (y0, x1), -1)
+    np.add.at(diff, (y1, x0), -1)
+    np.add.at(diff, (y1, x1), 1)
+    covered = diff.cumsum(axis=0).cumsum(axis=1)[:-1, :-1] > 0
+    img[y_min:y_max, x_min:x_max][covered] = color
+    return img
+
+
+# ====================================================
+# 🖼️ ENGINE MASK ẢNH
+# ====================================================
+def mask_image(img, timer=None):
+    """
+    OCR → tìm PII theo dòng → tô đen. Sửa trực tiếp img, trả về (img, list type).
+    """
+    timer = timer or StageTimer()
+    words = run_ocr(img, timer)
+    boxes, detected = find_pii_boxes(words)
+    fill_boxes(img, boxes)
+    timer.mark("mask")
+    return img, detected
+
+
+def masked_path_for(image_path):
+    # Mọi đuôi (.jpeg, .webp, ...) → file *_masked riêng, không ghi đè ảnh gốc
+    root, ext = os.path.splitext(image_path)
+    return f"{root}_masked{ext}"
+
+
+def mask_image_file(image_path, output_path=None, timer=None, img=None):
+    """
+    Đọc ảnh → mask PII → lưu *_masked → ghi audit. Trả về (output_path, list type).
+    img: ảnh đã decode sẵn từ buffer upload (bỏ qua cv2.imread).
+    """
+    timer = timer or StageTimer()
+    if img is None:
+        img = cv2.imread(image_path)
+    if img is None:
+        raise ValueError(f"Cannot read image: {image_path}")
+    timer.mark("decode")
+
+    img, detected = mask_image(img, timer)
+
+    output_path = output_path or masked_path_for(image_path)
+    cv2.imwrite(output_path, img)
+    timer.mark("save")
+
+    if detected:
+        log_audit("mask_image", detected)
+    return output_path, detected
@@ -1,13 +1,7 @@
 import os
-import cv2
-import re
-import json
-import pytesseract
-from datetime import datetime
-from app.utils.pii_utils import PII_PATTERNS, log_audit
-
-# Cấu hình đường dẫn Tesseract
-pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+from app.utils.ocr import StageTimer
+from app.utils.image_masking import mask_image_file
+from app.utils.executor import run_io
 
 DATA_DIR = "app/data"
 os.makedirs(DATA_DIR, exist_ok=True)
@@ -15,47 +9,35 @@ os.makedirs(DATA_DIR, exist_ok=True)
 # ====================================================
 # 🧩 HÀM XỬ LÝ IMAGE (MASK + OCR + AUDIT)
 # ====================================================
-async def process_image(image_path, question: str = "Mô tả ảnh này"):
-    """
-    Nhận file image → OCR → mask PII → trả về câu trả lời có reference đến ảnh.
-    """
-    if not os.path.exists(image_path):
-        raise FileNotFoundError(f"Không tìm thấy file: {image_path}")
-
-    img = cv2.imread(image_path)
-    if img is None:
-        raise ValueError("Không thể đọc ảnh. Hãy kiểm tra định dạng file!")
-
-    detected_types = []
-
-    # OCR detect text
-    text_boxes = pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT)
-    for i, word in enumerate(text_boxes["text"]):
-        for key, pattern in PII_PATTERNS.items():
-            if re.match(pattern, word):
-                x, y, w, h = (
-                    text_boxes["left"][i],
-                    text_boxes["top"][i],
-                    text_boxes["width"][i],
-                    text_boxes["height"][i]
-                )
-                cv2.rectangle(img, (x, y), (x + w, y + h), (0, 0, 0), -1)
-                detected_types.append(key)
-
-    # Save masked image
-    masked_path = image_path.replace(".jpg", "_masked.jpg").replace(".png", "_masked.png")
-    cv2.imwrite(masked_path, img)
-
-    # Ghi log nếu có phát hiện
-    if detected_types:
-        log_audit("mask_image", detected_types)
-
+def image_reply(question):
     # 🧠 Tạo câu trả lời AI reference tới ảnh
-    response = (
+    return (
         "🤖 I’ve analyzed the uploaded image. "
         "It seems to contain text and possibly faces. "
         f"You asked: '{question}' — "
         "this question has been linked to your uploaded image."
     )
 
-    return {"reply": response, "masked_image_path": masked_path}
+
+def _process_image_sync(image_path, question, img=None):
+    if not os.path.exists(image_path):
+        raise FileNotFoundError(f"Không tìm thấy file: {image_path}")
+
+    # OCR (tiền xử lý + chia tile) → mask PII theo dòng → lưu *_masked → audit
+    timer = StageTimer()
+    try:
+        masked_path, detected = mask_image_file(image_path, timer=timer, img=img)
+    except ValueError as e:
+        raise ValueError("Không thể đọc ảnh. Hãy kiểm tra định dạng file!") from e
+
+    return {"reply": image_reply(question), "masked_image_path": masked_path,
+            "detected": detected, "timings": timer.timings}
+
+
+async def process_image(image_path, question: str = "Mô tả ảnh này", img=None):
+    """
+    Nhận file image → OCR → mask PII → trả về câu trả lời có reference đến ảnh.
+    img: ảnh đã decode từ RAM lúc upload (nếu có) → không đọc lại từ đĩa.
+    OCR + cv2 chạy trên io_pool (tesseract là subprocess, cv2 nhả GIL).
+    """
+    return await run_io(_process_image_sync, image_path, question, img)
@@ -0,0 +1,102 @@
+import os
+import time
+import threading
+import importlib
+
+# ⚙️ Warmup nền sau khi server khởi động (0 = chỉ load khi dùng lần đầu)
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "0") == "1"
+
+_registry = {}
+
+
+class LazySingleton:
+    """
+    Đối tượng nặng (model, thư viện) chỉ được tạo ở lần get() đầu tiên, an toàn đa luồng.
+    cache_errors=True → factory lỗi 1 lần thì các lần sau báo lại lỗi đó, không load lại.
+    """
+
+    def __init__(self, name, factory, cache_errors=False):
+        self.name = name
+        self.factory = factory
+        self.cache_errors = cache_errors
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.error = None
+        self.load_seconds = None
+        _registry[name] = self
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def get(self, *args, **kwargs):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    if self.error is not None and self.cache_errors:
+                        raise self.error
+                    start = time.perf_counter()
+                    try:
+                        self._value = self.factory(*args, **kwargs)
+                    except Exception as e:
+                        self.error = e
+                        raise
+                    self.load_seconds = time.perf_counter() - start
+                    self._loaded = True
+        return self._value
+
+    def status(self):
+        return {
+            "loaded": self._loaded,
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "error": str(self.error) if self.error is not None else None,
+        }
+
+
+class LazyModule:
+    """
+    Proxy cho module: import thật ở lần truy cập thuộc tính đầu tiên.
+    on_load(module) chạy đúng 1 lần ngay sau khi import (cấu hình module).
+    """
+
+    def __init__(self, module_name, on_load=None):
+        def _import():
+            module = importlib.import_module(module_name)
+            if on_load is not None:
+                on_load(module)
+            return module
+
+        object.__setattr__(self, "_singleton", LazySingleton(module_name, _import))
+
+    def __getattr__(self, attr):
+        return getattr(self._singleton.get(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._singleton.get(), attr, value)
+
+
+# ====================================================
+# 🔥 WARMUP NỀN
+# ====================================================
+def warmup(names=None):
+    """
+    Load trước các singleton đã đăng ký (hoặc chỉ các tên trong names) trên 1 thread nền.
+    Lỗi khi warmup chỉ được ghi lại trong status(), request sau sẽ gặp lại lỗi thật.
+    """
+    targets = [s for name, s in _registry.items() if names is None or name in names]
+
+    def _run():
+        for singleton in targets:
+            try:
+                singleton.get()
+            except Exception as e:
+                print(f"[⚠️] Warmup {singleton.name} lỗi: {e}")
+
+    thread = threading.Thread(target=_run, name="lazy-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def status():
+    return {name: s.status() for name, s in _registry.items()}
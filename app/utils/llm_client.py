@@ -1,6 +1,239 @@
-def query_LLM(message: str) -> str:
+import os
+import json
+import random
+import asyncio
+import weakref
+
+# ⚙️ Cấu hình LLM
+LLM_BACKEND = os.getenv("LLM_BACKEND", "echo")  # echo | openai (API tương thích OpenAI)
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "http://127.0.0.1:8001/v1")
+LLM_API_KEY = os.getenv("LLM_API_KEY", "")
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 5))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", 0.5))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", 8))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 16))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 32))
+
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
     """
-    Mô phỏng LLM (có thể thay bằng OpenAI, Gemini, Claude...)
+    Gọi LLM thất bại sau khi đã retry hết.
     """
-    # Sau này ta sẽ thay bằng model thật
-    return f"🤖 AI says: I received your message — '{message}'"
+
+
+class LLMResponseError(LLMError):
+    """
+    LLM trả body sai định dạng (không phải JSON, thiếu choices...) → coi như lỗi tạm thời, được retry.
+    """
+
+
+def _parse_choice(raw, field):
+    """
+    Lấy choices[0][field] từ body JSON của /chat/completions
+    (field="message" khi complete, "delta" với từng chunk SSE khi stream).
+    """
+    try:
+        choice = json.loads(raw)["choices"][0]
+        part = choice[field] if field == "message" else choice.get(field) or {}
+        if not isinstance(part, dict):
+            raise TypeError(f"{field} không phải object")
+        content = part.get("content")
+        if content is not None and not isinstance(content, str):
+            raise TypeError("content không phải chuỗi")
+        return content
+    except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+        raise LLMResponseError(f"LLM trả phản hồi sai định dạng: {raw[:200]!r}") from e
+
+
+# ====================================================
+# 🤖 GIAO DIỆN CHUNG
+# ====================================================
+class LLMClient:
+    """
+    complete(): trả cả câu trả lời; stream(): sinh từng token (async iterator).
+    history: các message trước đó của session ([{"role", "content"}], xem app/utils/conversation.py).
+    """
+
+    async def complete(self, message: str, history=None) -> str:
+        return "".join([token async for token in self.stream(message, history)])
+
+    async def stream(self, message: str, history=None):
+        yield await self.complete(message, history)
+
+    async def aclose(self):
+        pass
+
+
+class EchoLLM(LLMClient):
+    """
+    Mô phỏng LLM (mặc định khi chưa cấu hình model thật)
+    """
+
+    async def complete(self, message: str, history=None) -> str:
+        return f"🤖 AI says: I received your message — '{message}'"
+
+    async def stream(self, message: str, history=None):
+        reply = await self.complete(message, history)
+        for i, word in enumerate(reply.split(" ")):
+            yield word if i == 0 else " " + word
+
+
+# ====================================================
+# 🌐 CLIENT TƯƠNG THÍCH OPENAI (httpx, pool kết nối dùng chung)
+# ====================================================
+class OpenAICompatibleLLM(LLMClient):
+    """
+    Gọi POST {base_url}/chat/completions:
+    - 1 httpx.AsyncClient (keep-alive pool) + 1 semaphore giới hạn số request đồng thời cho mỗi event loop
+    - timeout connect/read riêng, retry lỗi mạng / 429 / 5xx / body sai định dạng với exponential backoff + jitter
+    - stream=True đọc SSE, trả token ngay khi tới
+    """
+
+    def __init__(self, base_url=LLM_BASE_URL, api_key=LLM_API_KEY, model=LLM_MODEL,
+                 max_retries=LLM_MAX_RETRIES, max_concurrency=LLM_MAX_CONCURRENCY):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self._clients = weakref.WeakKeyDictionary()  # 1 client + semaphore cho mỗi event loop
+
+    def _client(self):
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        entry = self._clients.get(loop)
+        if entry is None:
+            headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+            client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=headers,
+                timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS,
+                                    max_keepalive_connections=LLM_MAX_CONNECTIONS),
+            )
+            entry = self._clients[loop] = (client, asyncio.Semaphore(self.max_concurrency))
+        return entry
+
+    def _payload(self, message, stream, history=None):
+        return {
+            "model": self.model,
+            "messages": list(history or []) + [{"role": "user", "content": message}],
+            "stream": stream,
+        }
+
+    def _backoff(self, attempt, retry_after=None):
+        # Full jitter: ngẫu nhiên trong [0, base * 2^attempt] → client không retry cùng lúc
+        if retry_after:
+            try:
+                return min(float(retry_after), LLM_BACKOFF_MAX)
+            except ValueError:
+                pass
+        return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+
+    async def _with_retries(self, call):
+        """
+        Chạy call() (1 lần gửi request); lỗi tạm thời → chờ backoff rồi thử lại.
+        """
+        import httpx
+
+        client, semaphore = self._client()
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            async with semaphore:
+                try:
+                    return await call(client)
+                except httpx.HTTPStatusError as e:
+                    if e.response.status_code not in RETRY_STATUS:
+                        raise LLMError(f"LLM trả lỗi {e.response.status_code}") from e
+                    retry_after = e.response.headers.get("Retry-After")
+                    last_error = e
+                except (httpx.TransportError, LLMResponseError) as e:
+                    last_error = e
+            if attempt < self.max_retries:
+                await asyncio.sleep(self._backoff(attempt, retry_after))
+        raise LLMError(f"LLM không phản hồi sau {self.max_retries + 1} lần thử: {last_error}") from last_error
+
+    async def complete(self, message: str, history=None) -> str:
+        async def call(client):
+            resp = await client.post("/chat/completions", json=self._payload(message, False, history))
+            resp.raise_for_status()
+            return _parse_choice(resp.text, "message") or ""
+
+        return await self._with_retries(call)
+
+    async def stream(self, message: str, history=None):
+        import httpx
+
+        client, semaphore = self._client()
+        sent_any = False
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                async with semaphore:
+                    async with client.stream("POST", "/chat/completions",
+                                             json=self._payload(message, True, history)) as resp:
+                        resp.raise_for_status()
+                        async for line in resp.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[5:].strip()
+                            if data == "[DONE]":
+                                return
+                            delta = _parse_choice(data, "delta")
+                            if delta:
+                                sent_any = True
+                                yield delta
+                return
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code not in RETRY_STATUS:
+                    raise LLMError(f"LLM trả lỗi {e.response.status_code}") from e
+                retry_after = e.response.headers.get("Retry-After")
+                last_error = e
+            except (httpx.TransportError, LLMResponseError) as e:
+                # Đã gửi token cho client → không retry được (sẽ bị lặp nội dung)
+                if sent_any:
+                    raise LLMError(f"LLM ngắt stream giữa chừng: {e}") from e
+                last_error = e
+            if attempt < self.max_retries:
+                await asyncio.sleep(self._backoff(attempt, retry_after))
+        raise LLMError(f"LLM không phản hồi sau {self.max_retries + 1} lần thử: {last_error}") from last_error
+
+    async def aclose(self):
+        clients = list(self._clients.items())
+        self._clients.clear()
+        for loop, (client, _) in clients:
+            if loop is asyncio.get_running_loop():
+                await client.aclose()
+
+
+# ====================================================
+# 🔌 CHỌN BACKEND
+# ====================================================
+BACKENDS = {
+    "echo": EchoLLM,
+    "openai": OpenAICompatibleLLM,
+}
+
+_llm = None
+
+
+def get_llm() -> LLMClient:
+    global _llm
+    if _llm is None:
+        _llm = BACKENDS[LLM_BACKEND]()
+    return _llm
+
+
+async def query_LLM(message: str, history=None) -> str:
+    """
+    Gọi LLM đã cấu hình (LLM_BACKEND), trả về cả câu trả lời.
+    """
+    return await get_llm().complete(message, history)
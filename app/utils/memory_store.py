@@ -0,0 +1,451 @@
+import os
+import abc
+import json
+import math
+import time
+import bisect
+import sqlite3
+import threading
+from pathlib import Path
+from datetime import datetime
+
+# ⚙️ Cấu hình backend lưu lịch sử chat
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "segment")  # "segment" | "sqlite"
+MEMORY_DIR = Path(os.getenv("MEMORY_DIR", "app/data/memory"))
+LEGACY_MEMORY_PATH = Path("app/data/memory.json")
+SEGMENT_MAX_BYTES = int(os.getenv("MEMORY_SEGMENT_MAX_BYTES", 8 * 1024 * 1024))
+MEMORY_FSYNC = os.getenv("MEMORY_FSYNC", "0") == "1"
+TIME_FORMAT = "%H:%M %d/%m/%y"
+
+
+def _json_safe(value):
+    """
+    Thay NaN/inf bằng None để record luôn là JSON hợp lệ.
+    """
+    if isinstance(value, str) or value is None:
+        return value
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    return value
+
+
+# ====================================================
+# 🧩 INTERFACE CHUNG
+# ====================================================
+class MemoryStore(abc.ABC):
+    """
+    Interface cho backend lịch sử hội thoại (backend thiếu method bắt buộc → lỗi ngay khi khởi tạo).
+    Mỗi turn là 1 record: {"id", "ts", "time", "user", "bot"} (+ "session" nếu có session id);
+    id tăng dần từ 1 và được dùng làm cursor phân trang.
+    """
+
+    @abc.abstractmethod
+    def append(self, user_msg, bot_reply, ts=None, time_str=None, session_id=None):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def iter_records(self, cursor=None, since=None, until=None):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def session_tail(self, session_id, limit):
+        """
+        limit turn mới nhất của 1 session (cũ → mới), chỉ đọc đúng các dòng đó.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def session_range(self, session_id, after_id=0, before_id=None, limit=None):
+        """
+        Các turn của session có after_id < id < before_id (cũ → mới); có limit → chỉ limit turn cuối.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def __len__(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def iter_raw(self, cursor=None, since=None, until=None):
+        """
+        Giống iter_records nhưng trả về từng dòng JSON (bytes, kèm xuống dòng) — dùng cho NDJSON.
+        """
+        for record in self.iter_records(cursor=cursor, since=since, until=until):
+            yield (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+    def query(self, cursor=None, limit=None, since=None, until=None):
+        """
+        Trả về (records, next_cursor). next_cursor = None khi đã hết dữ liệu.
+        """
+        records = []
+        for record in self.iter_records(cursor=cursor, since=since, until=until):
+            if limit is not None and len(records) >= limit:
+                return records, records[-1]["id"]
+            records.append(record)
+        return records, None
+
+    @staticmethod
+    def _make_record(record_id, user_msg, bot_reply, ts, time_str, session_id=None):
+        record = {
+            "id": record_id,
+            "ts": ts,
+            "time": time_str if time_str is not None else datetime.fromtimestamp(ts).strftime(TIME_FORMAT),
+            "user": _json_safe(user_msg),
+            "bot": _json_safe(bot_reply),
+        }
+        if session_id is not None:
+            record["session"] = session_id
+        return record
+
+
+# ====================================================
+# 📜 BACKEND 1: APPEND-ONLY SEGMENT LOG (JSON Lines)
+# ====================================================
+class SegmentLogStore(MemoryStore):
+    """
+    Log append-only chia thành các segment JSONL (segment-000001.jsonl, ...).
+    Mỗi turn ghi đúng 1 dòng; index (ts, segment, offset, length) giữ trong RAM
+    nên đọc theo cursor/khoảng thời gian chỉ cần seek + read đúng các dòng cần thiết.
+    Thêm index session → danh sách vị trí, để lấy đuôi hội thoại của 1 session không phải quét log.
+    Chỉ an toàn với 1 process ghi — nhiều worker thì dùng backend sqlite.
+    """
+
+    def __init__(self, directory=MEMORY_DIR, segment_max_bytes=SEGMENT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_max_bytes = segment_max_bytes
+        self._lock = threading.Lock()
+        self._ts = []        # ts của từng record (tăng dần, dùng bisect)
+        self._locs = []      # (segment_no, offset, length)
+        self._sessions = {}  # session_id → [vị trí record] (tăng dần)
+        self._readers = {}  # segment_no → file handle đọc (dùng chung, seek + read dưới _lock)
+        self._segment_no = 0
+        self._segment_size = 0
+        self._writer = None
+        self._load_index()
+
+    def _segment_path(self, segment_no):
+        return self.directory / f"segment-{segment_no:06d}.jsonl"
+
+    def _load_index(self):
+        """
+        Dựng index từ các segment có sẵn (chỉ chạy 1 lần lúc khởi động).
+        Dòng cuối bị ghi dở (crash giữa chừng) sẽ được cắt bỏ.
+        """
+        segments = sorted(self.directory.glob("segment-*.jsonl"))
+        for path in segments:
+            segment_no = int(path.stem.split("-")[1])
+            good_end = 0
+            with open(path, "rb") as f:
+                offset = 0
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        record = json.loads(line)
+                        ts = record["ts"]
+                    except (ValueError, KeyError):
+                        break
+                    if record.get("session") is not None:
+                        self._sessions.setdefault(record["session"], []).append(len(self._ts))
+                    self._ts.append(ts)
+                    self._locs.append((segment_no, offset, len(line)))
+                    offset += len(line)
+                    good_end = offset
+            if good_end != path.stat().st_size:
+                with open(path, "r+b") as f:
+                    f.truncate(good_end)
+            self._segment_no = segment_no
+            self._segment_size = good_end
+
+    def _open_writer(self):
+        if self._writer is not None and self._segment_size < self.segment_max_bytes:
+            return self._writer
+        if self._writer is not None:
+            self._writer.close()
+        # Segment hiện tại đã đầy (hoặc chưa có segment nào) → mở segment mới
+        if self._segment_no == 0 or self._segment_size >= self.segment_max_bytes:
+            self._segment_no += 1
+        self._writer = open(self._segment_path(self._segment_no), "ab")
+        self._segment_size = self._writer.tell()
+        return self._writer
+
+    def append(self, user_msg, bot_reply, ts=None, time_str=None, session_id=None):
+        with self._lock:
+            now = time.time() if ts is None else ts
+            # Giữ ts không giảm để bisect theo thời gian luôn đúng
+            if self._ts:
+                now = max(now, self._ts[-1])
+            record = self._make_record(len(self._ts) + 1, user_msg, bot_reply, now, time_str, session_id)
+            line = (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+            writer = self._open_writer()
+            offset = self._segment_size
+            writer.write(line)
+            writer.flush()
+            if MEMORY_FSYNC:
+                os.fsync(writer.fileno())
+
+            self._segment_size += len(line)
+            if session_id is not None:
+                self._sessions.setdefault(session_id, []).append(len(self._ts))
+            self._ts.append(now)
+            self._locs.append((self._segment_no, offset, len(line)))
+            return record
+
+    def _reader(self, segment_no):
+        # Gọi khi đang giữ _lock
+        reader = self._readers.get(segment_no)
+        if reader is None:
+            reader = self._readers[segment_no] = open(self._segment_path(segment_no), "rb")
+        return reader
+
+    def read_raw(self, position):
+        """
+        Đọc bytes thô (1 dòng JSON) của record thứ position (0-based).
+        Handle đọc dùng chung giữa các thread → seek + read phải nằm trong _lock
+        (không dùng os.pread vì Windows không có).
+        """
+        with self._lock:
+            segment_no, offset, length = self._locs[position]
+            reader = self._reader(segment_no)
+            reader.seek(offset)
+            return reader.read(length)
+
+    def positions(self, cursor=None, since=None, until=None):
+        """
+        Khoảng vị trí [start, end) trong index khớp cursor + khoảng thời gian.
+        """
+        with self._lock:
+            end = len(self._ts)
+            start = int(cursor) if cursor else 0
+            if since is not None:
+                start = max(start, bisect.bisect_left(self._ts, since, 0, end))
+            if until is not None:
+                end = bisect.bisect_right(self._ts, until, 0, end)
+        return range(start, max(start, end))
+
+    def iter_records(self, cursor=None, since=None, until=None):
+        for position in self.positions(cursor, since, until):
+            yield json.loads(self.read_raw(position))
+
+    def session_tail(self, session_id, limit):
+        with self._lock:
+            positions = self._sessions.get(session_id, [])[-limit:] if limit > 0 else []
+        return [json.loads(self.read_raw(position)) for position in positions]
+
+    def session_range(self, session_id, after_id=0, before_id=None, limit=None):
+        # id = vị trí + 1
+        with self._lock:
+            positions = self._sessions.get(session_id, [])
+            start = bisect.bisect_left(positions, after_id)
+            end = len(positions) if before_id is None else bisect.bisect_left(positions, before_id - 1)
+            if limit is not None:
+                start = max(start, end - limit)
+            selected = positions[start:end]
+        return [json.loads(self.read_raw(position)) for position in selected]
+
+    def iter_raw(self, cursor=None, since=None, until=None):
+        # Dòng trong segment đã là NDJSON → trả thẳng bytes, không cần parse
+        for position in self.positions(cursor, since, until):
+            yield self.read_raw(position)
+
+    def __len__(self):
+        return len(self._ts)
+
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            for reader in self._readers.values():
+                reader.close()
+            self._readers.clear()
+
+
+# ====================================================
+# 🗄️ BACKEND 2: SQLITE (WAL mode)
+# ====================================================
+class SqliteMemoryStore(MemoryStore):
+    """
+    SQLite ở chế độ WAL: mỗi turn là 1 INSERT, an toàn khi nhiều worker cùng ghi.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path or MEMORY_DIR / "memory.sqlite3")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL" if MEMORY_FSYNC else "PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS turns ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, ts REAL NOT NULL, time TEXT, user TEXT, bot TEXT, session TEXT)"
+        )
+        # DB tạo trước khi có session id → thêm cột
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(turns)")}
+        if "session" not in columns:
+            self._conn.execute("ALTER TABLE turns ADD COLUMN session TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_turns_ts ON turns(ts)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_turns_session ON turns(session, id)")
+
+    def append(self, user_msg, bot_reply, ts=None, time_str=None, session_id=None):
+        record = self._make_record(None, user_msg, bot_reply, time.time() if ts is None else ts, time_str,
+                                   session_id)
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO turns (ts, time, user, bot, session) VALUES (?, ?, ?, ?, ?)",
+                (record["ts"], record["time"], json.dumps(record["user"], ensure_ascii=False, default=str),
+                 json.dumps(record["bot"], ensure_ascii=False, default=str), session_id),
+            )
+        record["id"] = cur.lastrowid
+        return record
+
+    @staticmethod
+    def _row_to_record(row):
+        row_id, ts, time_str, user, bot, session = row
+        record = {"id": row_id, "ts": ts, "time": time_str, "user": json.loads(user), "bot": json.loads(bot)}
+        if session is not None:
+            record["session"] = session
+        return record
+
+    def session_tail(self, session_id, limit):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, ts, time, user, bot, session FROM turns WHERE session = ? ORDER BY id DESC LIMIT ?",
+                (session_id, limit),
+            ).fetchall()
+        return [self._row_to_record(row) for row in reversed(rows)]
+
+    def session_range(self, session_id, after_id=0, before_id=None, limit=None):
+        sql = "SELECT id, ts, time, user, bot, session FROM turns WHERE session = ? AND id > ?"
+        params = [session_id, after_id]
+        if before_id is not None:
+            sql += " AND id < ?"
+            params.append(before_id)
+        # Lấy từ cuối khoảng (DESC + LIMIT) rồi đảo lại → cũ → mới
+        sql += " ORDER BY id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._row_to_record(row) for row in reversed(rows)]
+
+    def iter_records(self, cursor=None, since=None, until=None, page_size=500):
+        last_id = int(cursor) if cursor else 0
+        while True:
+            sql = "SELECT id, ts, time, user, bot, session FROM turns WHERE id > ?"
+            params = [last_id]
+            if since is not None:
+                sql += " AND ts >= ?"
+                params.append(since)
+            if until is not None:
+                sql += " AND ts <= ?"
+                params.append(until)
+            sql += " ORDER BY id LIMIT ?"
+            params.append(page_size)
+            with self._lock:
+                rows = self._conn.execute(sql, params).fetchall()
+            for row in rows:
+                yield self._row_to_record(row)
+            if len(rows) < page_size:
+                return
+            last_id = rows[-1][0]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM turns").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+BACKENDS = {
+    "segment": SegmentLogStore,
+    "sqlite": SqliteMemoryStore,
+}
+
+
+# ====================================================
+# 🔁 MIGRATOR TỪ memory.json CŨ
+# ====================================================
+def migrate_legacy_json(store, legacy_path=LEGACY_MEMORY_PATH):
+    """
+    Chuyển {"history": [...]} trong memory.json cũ sang store mới (chạy 1 lần).
+    Turn cũ không có "time" sẽ lấy ts của turn trước đó.
+    Trả về số turn đã chuyển.
+    """
+    legacy_path = Path(legacy_path)
+    if not legacy_path.exists():
+        return 0
+
+    with open(legacy_path, "r", encoding="utf-8") as f:
+        try:
+            memory = json.load(f)
+        except json.JSONDecodeError:
+            return 0
+
+    history = memory.get("history", []) if isinstance(memory, dict) else []
+    last_ts = 0.0
+    migrated = 0
+    for turn in history:
+        if not isinstance(turn, dict):
+            continue
+        time_str = turn.get("time")
+        ts = last_ts
+        if time_str:
+            try:
+                ts = max(last_ts, datetime.strptime(time_str, TIME_FORMAT).timestamp())
+            except ValueError:
+                pass
+        store.append(turn.get("user"), turn.get("bot"), ts=ts, time_str=time_str or "")
+        last_ts = ts
+        migrated += 1
+    return migrated
+
+
+# ====================================================
+# 🔒 SINGLETON
+# ====================================================
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """
+    Lấy store dùng chung cho cả app (tạo lần đầu + tự migrate memory.json nếu store trống).
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                backend = BACKENDS.get(MEMORY_BACKEND)
+                if backend is None:
+                    raise ValueError(f"MEMORY_BACKEND không hợp lệ: {MEMORY_BACKEND}")
+                store = backend()
+                if len(store) == 0:
+                    migrate_legacy_json(store)
+                _store = store
+    return _store
+
+
+if __name__ == "__main__":
+    import sys
+
+    # python -m app.utils.memory_store [đường_dẫn_memory.json]
+    source = sys.argv[1] if len(sys.argv) > 1 else LEGACY_MEMORY_PATH
+    target = BACKENDS[MEMORY_BACKEND]()
+    if len(target) > 0:
+        print(f"[⚠️] Store đã có {len(target)} turn, bỏ qua migrate.")
+    else:
+        count = migrate_legacy_json(target, source)
+        print(f"✅ Đã migrate {count} turn từ {source} sang backend '{MEMORY_BACKEND}'")
+    target.close()
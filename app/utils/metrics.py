@@ -0,0 +1,275 @@
+import os
+import sys
+import time
+import hmac
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from urllib.parse import parse_qs
+
+# ⚙️ Cấu hình metrics / profiler
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_ADMIN_TOKEN = os.getenv("METRICS_ADMIN_TOKEN")  # không đặt → tắt ?profile=1
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", 5)) / 1000
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Frame "đang chờ" (thread rảnh, event loop đợi I/O) → bỏ khỏi stack dump
+IDLE_FILES = ("threading.py", "selectors.py", "queue.py", "thread.py")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (list(extra.items()) if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+# ====================================================
+# 📈 METRIC CƠ BẢN (định dạng text của Prometheus)
+# ====================================================
+class Histogram:
+    """
+    Histogram có nhãn: mỗi bộ nhãn giữ count theo bucket + tổng + số lần đo.
+    """
+
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}  # labels -> [counts theo bucket, sum, count]
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, [list(s[0]), s[1], s[2]]) for labels, s in self._series.items())
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, {'le': bound})} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, {'le': '+Inf'})} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+class Gauge:
+    """
+    Gauge có nhãn (tăng/giảm), vd. số request đang xử lý.
+    """
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def add(self, delta, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + delta
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f"{self.name}{_labels(self.label_names, labels)} {value}" for labels, value in items]
+        return lines
+
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "Thời gian xử lý request theo route",
+                            ("method", "route", "status"))
+# Route chỉ biết sau khi router khớp → in-flight chỉ theo method (tránh nhãn theo path thô)
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "Số request đang xử lý", ("method",))
+STAGE_LATENCY = Histogram("stage_duration_seconds",
+                          "Thời gian từng bước (parse, mask, ocr, llm, memory_write, audit_write, ...)", ("stage",))
+
+
+def observe_stage(stage, seconds):
+    if METRICS_ENABLED:
+        STAGE_LATENCY.observe(seconds, stage)
+
+
+@contextmanager
+def timed(stage):
+    """
+    with timed("parse"): ...  → ghi thời gian khối lệnh vào stage_duration_seconds.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+# ====================================================
+# 🧾 GOM METRIC KHI SCRAPE
+# ====================================================
+_collectors = {}
+
+
+def register_collector(name, fn, label=None):
+    """
+    fn() → dict stats (kiểu các hàm stats() sẵn có); mỗi trường số xuất thành gauge "<name>_<field>".
+    Có label → fn() trả {giá trị nhãn: stats}, vd. register_collector("app_cache", ..., label="cache").
+    """
+    _collectors[name] = (fn, label)
+
+
+def _samples(name, stats, labels):
+    for field, value in stats.items():
+        if isinstance(value, (bool, int, float)):
+            yield f"{name}_{field}", labels, int(value) if isinstance(value, bool) else value
+
+
+def render_metrics():
+    """
+    Toàn bộ metric dạng text exposition của Prometheus (version 0.0.4).
+    """
+    lines = REQUEST_LATENCY.render() + REQUESTS_IN_FLIGHT.render() + STAGE_LATENCY.render()
+    for name, (fn, label) in _collectors.items():
+        try:
+            stats = fn()
+        except Exception:
+            # 1 nguồn stats lỗi không được làm hỏng cả lần scrape
+            continue
+        groups = stats.items() if label else [(None, stats)]
+        series = {}
+        for value_label, group in groups:
+            for metric, labels, value in _samples(name, group, {label: value_label} if label else {}):
+                series.setdefault(metric, []).append(f"{metric}{_labels((), (), labels)} {value}")
+        for metric, metric_lines in series.items():
+            lines.append(f"# TYPE {metric} gauge")
+            lines += metric_lines
+    return "\n".join(lines) + "\n"
+
+
+# ====================================================
+# 🔥 SAMPLING PROFILER (1 REQUEST)
+# ====================================================
+class StackSampler:
+    """
+    Thread nền chụp stack mọi thread (sys._current_frames) mỗi PROFILE_INTERVAL giây,
+    gộp thành định dạng "folded" (frame;frame;frame count) cho flamegraph.pl / speedscope.
+    Lấy mẫu cả worker pool nên request khác chạy song song cũng có thể lọt vào.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == own or os.path.basename(frame.f_code.co_filename) in IDLE_FILES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _profile_requested(scope):
+    if scope["type"] != "http" or not METRICS_ADMIN_TOKEN:
+        return False
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    if query.get("profile") != ["1"]:
+        return False
+    token = dict(scope.get("headers") or []).get(b"x-admin-token", b"").decode("latin-1")
+    return hmac.compare_digest(token, METRICS_ADMIN_TOKEN)
+
+
+# ====================================================
+# ⏱️ ASGI MIDDLEWARE
+# ====================================================
+class MetricsMiddleware:
+    """
+    Đo latency theo route (template, vd. /csv/chart/{chart_id}) + số request đang xử lý.
+    Admin gửi ?profile=1 + header X-Admin-Token → trả stack dump dạng folded thay cho response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            return await self.app(scope, receive, send)
+        if _profile_requested(scope):
+            return await self._profile(scope, receive, send)
+
+        method = scope["method"]
+        status = 500
+        start = time.perf_counter()
+        REQUESTS_IN_FLIGHT.add(1, method)
+
+        async def tracked_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, tracked_send)
+        finally:
+            REQUESTS_IN_FLIGHT.add(-1, method)
+            route = scope.get("route")
+            REQUEST_LATENCY.observe(time.perf_counter() - start, method,
+                                    getattr(route, "path", "other"), str(status))
+
+    async def _profile(self, scope, receive, send):
+        status = None
+
+        async def discard(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        start = time.perf_counter()
+        with StackSampler() as sampler:
+            await self.app(scope, receive, discard)
+        elapsed = time.perf_counter() - start
+
+        body = sampler.folded().encode("utf-8")
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/plain; charset=utf-8"),
+                                (b"content-length", str(len(body)).encode()),
+                                (b"x-profile-samples", str(sampler.samples).encode()),
+                                (b"x-profile-elapsed-ms", f"{elapsed * 1000:.1f}".encode()),
+                                (b"x-profile-status", str(status).encode())]})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,158 @@
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.lazy import LazyModule
+from app.utils.executor import WorkerPool
+from app.utils.metrics import observe_stage
+
+# ⚙️ Cấu hình OCR
+TESSERACT_CMD = os.getenv("TESSERACT_CMD")  # không đặt → dùng "tesseract" trên PATH
+WINDOWS_TESSERACT_CMD = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+OCR_BINARIZE = os.getenv("OCR_BINARIZE", "otsu")  # otsu | adaptive | none
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", 2400))  # cạnh dài hơn → thu nhỏ trước khi OCR
+OCR_DPI = int(os.getenv("OCR_DPI", 300))
+OCR_TILE_MIN_HEIGHT = int(os.getenv("OCR_TILE_MIN_HEIGHT", 1600))  # ảnh cao hơn → chia dải ngang
+OCR_TILE_HEIGHT = int(os.getenv("OCR_TILE_HEIGHT", 800))
+OCR_TILE_OVERLAP = int(os.getenv("OCR_TILE_OVERLAP", 120))  # > chiều cao 1 dòng chữ
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", os.cpu_count() or 1))
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+# Nhiều tile chạy song song → mỗi process tesseract chỉ dùng 1 thread OpenMP
+OCR_OMP_THREAD_LIMIT = os.getenv("OCR_OMP_THREAD_LIMIT", "1")
+
+WORD_FIELDS = ["block_num", "par_num", "line_num", "word_num", "left", "top", "width", "height", "conf", "text"]
+
+
+def _configure_tesseract(module):
+    # 🧠 Đường dẫn tesseract: TESSERACT_CMD > bản cài mặc định trên Windows > PATH
+    if TESSERACT_CMD:
+        module.pytesseract.tesseract_cmd = TESSERACT_CMD
+    elif sys.platform == "win32" and os.path.exists(WINDOWS_TESSERACT_CMD):
+        module.pytesseract.tesseract_cmd = WINDOWS_TESSERACT_CMD
+    # Giới hạn OpenMP chỉ trong env của subprocess tesseract (pytesseract truyền env=environ
+    # của module nó) — không đổi os.environ, torch/CLIP/BLAS trong server giữ nguyên số thread
+    if OCR_OMP_THREAD_LIMIT:
+        module.pytesseract.environ = {**os.environ, "OMP_THREAD_LIMIT": OCR_OMP_THREAD_LIMIT}
+
+
+# cv2 / pytesseract chỉ import khi xử lý ảnh lần đầu (chat text không cần)
+cv2 = LazyModule("cv2")
+pytesseract = LazyModule("pytesseract", on_load=_configure_tesseract)
+
+# 🧵 Pool riêng cho tile OCR (tesseract là subprocess → thread là đủ);
+# tách khỏi io_pool vì OCR đang chạy bên trong 1 job của io_pool
+ocr_pool = WorkerPool("ocr", ThreadPoolExecutor, OCR_WORKERS, OCR_WORKERS * 4)
+
+
+class StageTimer:
+    """
+    Đo thời gian từng bước (ms) → trả về trong response để biết ảnh chậm ở đâu,
+    đồng thời ghi vào histogram stage "image_<bước>" của /metrics.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self._last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.timings[stage] = round((now - self._last) * 1000, 2) + self.timings.get(stage, 0)
+        observe_stage(f"image_{stage}", now - self._last)
+        self._last = now
+
+
+# ====================================================
+# 🧼 TIỀN XỬ LÝ
+# ====================================================
+def preprocess(img):
+    """
+    Grayscale → thu nhỏ (cạnh dài ≤ OCR_MAX_SIDE) → nhị phân hoá.
+    Trả về (ảnh đã xử lý, scale so với ảnh gốc).
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    scale = 1.0
+    longest = max(gray.shape[:2])
+    if longest > OCR_MAX_SIDE:
+        scale = OCR_MAX_SIDE / longest
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    if OCR_BINARIZE == "otsu":
+        _, gray = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    elif OCR_BINARIZE == "adaptive":
+        gray = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 15)
+    return gray, scale
+
+
+# ====================================================
+# 🧩 CHIA TILE + OCR SONG SONG
+# ====================================================
+def tile_bounds(height, tile_height=OCR_TILE_HEIGHT, overlap=OCR_TILE_OVERLAP, min_height=OCR_TILE_MIN_HEIGHT):
+    """
+    Các dải ngang (top, bottom) chồng lên nhau overlap px; ảnh thấp → 1 tile duy nhất.
+    """
+    if height <= min_height:
+        return [(0, height)]
+    step = tile_height - overlap
+    bounds = []
+    top = 0
+    while True:
+        bottom = min(height, top + tile_height)
+        bounds.append((top, bottom))
+        if bottom >= height:
+            return bounds
+        top += step
+
+
+def _ocr_tile(img, dpi):
+    config = f"--dpi {dpi}"
+    return pytesseract.image_to_data(img, lang=OCR_LANG, config=config, output_type=pytesseract.Output.DICT)
+
+
+def _merge_tiles(results, bounds, overlap, scale):
+    """
+    Gộp kết quả các tile về toạ độ ảnh gốc. Vùng chồng lấn: mỗi tile chỉ giữ từ có tâm
+    nằm trong nửa vùng của mình → 1 từ không bị lấy 2 lần.
+    """
+    merged = {field: [] for field in WORD_FIELDS + ["tile"]}
+    half = overlap / 2
+    last = len(bounds) - 1
+    for tile_id, (data, (top, bottom)) in enumerate(zip(results, bounds)):
+        own_top = top + half if tile_id > 0 else float("-inf")
+        own_bottom = bottom - half if tile_id < last else float("inf")
+        for i, text in enumerate(data["text"]):
+            if not str(text).strip():
+                continue
+            y = data["top"][i] + top
+            center = y + data["height"][i] / 2
+            if not (own_top <= center < own_bottom):
+                continue
+            for field in ("block_num", "par_num", "line_num", "word_num", "conf", "text"):
+                merged[field].append(data[field][i])
+            merged["left"].append(int(round(data["left"][i] / scale)))
+            merged["top"].append(int(round(y / scale)))
+            merged["width"].append(int(round(data["width"][i] / scale)))
+            merged["height"].append(int(round(data["height"][i] / scale)))
+            merged["tile"].append(tile_id)
+    return merged
+
+
+def run_ocr(img, timer=None):
+    """
+    OCR 1 ảnh (BGR hoặc gray) → dict kiểu pytesseract.Output.DICT (chỉ các từ có chữ,
+    toạ độ theo ảnh gốc, thêm cột "tile"). Ảnh cao được chia tile OCR song song.
+    """
+    timer = timer or StageTimer()
+    processed, scale = preprocess(img)
+    timer.mark("preprocess")
+
+    bounds = tile_bounds(processed.shape[0])
+    dpi = max(70, int(round(OCR_DPI * scale)))
+    tiles = [processed[top:bottom] for top, bottom in bounds]
+    if len(tiles) == 1:
+        results = [_ocr_tile(tiles[0], dpi)]
+    else:
+        results = ocr_pool.map(_ocr_tile, tiles, [dpi] * len(tiles))
+    timer.mark("ocr")
+
+    merged = _merge_tiles(results, bounds, OCR_TILE_OVERLAP, scale)
+    timer.mark("merge")
+    return merged
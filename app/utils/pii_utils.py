@@ -1,13 +1,10 @@
 import re
+import numpy as np
 import pandas as pd
-import json
 import os
-import cv2
-import pytesseract
-from datetime import datetime
-
-# 🧠 Đường dẫn đến tesseract.exe
-pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+from app.utils.executor import cpu_pool
+from app.utils import audit_log
+from app.utils.metrics import timed
 
 # -----------------------------
 # 1️⃣ Cấu hình PII patterns
@@ -19,77 +16,199 @@ PII_PATTERNS = {
 }
 
 # -----------------------------
-# 2️⃣ File log
+# 1️⃣b PII scanner (compile 1 lần, quét 1 lượt)
+# -----------------------------
+class PIIScanner:
+    """
+    Compile PII_PATTERNS đúng 1 lần. scan/mask: mỗi type 1 lượt finditer trên chuỗi gốc
+    (regex riêng lẻ nhanh hơn 1 alternation lớn), thay thế trong 1 lần ghép chuỗi.
+    Ưu tiên theo thứ tự khai báo (phone → email → name), giống các lượt mask cũ:
+    match của type sau chồng lên match của type trước thì bị bỏ, kể cả khi nó bắt đầu
+    sớm hơn (vd. "Mary Jane@x.com" → "Mary <EMAIL>", không phải "<NAME>@x.com").
+    match_word (từ OCR) dùng 1 regex alternation với named group.
+    """
+
+    def __init__(self, patterns=None):
+        patterns = PII_PATTERNS if patterns is None else patterns
+        self.types = list(patterns)
+        self.regex = re.compile("|".join(f"(?P<{key}>{pattern})" for key, pattern in patterns.items()))
+        self._by_type = [(key, re.compile(pattern)) for key, pattern in patterns.items()]
+        self.placeholders = {key: f"<{key.upper()}>" for key in self.types}
+
+    def _ordered(self, found):
+        return [key for key in self.types if key in found]
+
+    def scan(self, text):
+        """
+        Trả về list (type, start, end) của mọi PII trong text: không chồng nhau, theo vị trí.
+        """
+        spans = []
+        for key, regex in self._by_type:
+            for m in regex.finditer(text):
+                start, end = m.span()
+                if all(end <= s or start >= e for _, s, e in spans):
+                    spans.append((key, start, end))
+        spans.sort(key=lambda span: span[1])
+        return spans
+
+    def mask(self, text):
+        """
+        Mask 1 chuỗi → (chuỗi đã mask, list type phát hiện được).
+        """
+        spans = self.scan(text)
+        if not spans:
+            return text, []
+        parts = []
+        last = 0
+        for key, start, end in spans:
+            parts.append(text[last:start])
+            parts.append(self.placeholders[key])
+            last = end
+        parts.append(text[last:])
+        return "".join(parts), self._ordered({key for key, _, _ in spans})
+
+    def mask_batch(self, texts):
+        """
+        Mask nhiều chuỗi 1 lúc → (list chuỗi đã mask, list type phát hiện được).
+        """
+        found = set()
+        masked = []
+        for text in texts:
+            text, types = self.mask(text)
+            masked.append(text)
+            found.update(types)
+        return masked, self._ordered(found)
+
+    def match_word(self, word):
+        """
+        Kiểm tra 1 từ OCR (khớp từ đầu chuỗi như re.match) → type hoặc None.
+        """
+        m = self.regex.match(word)
+        return m.lastgroup if m else None
+
+
+pii_scanner = PIIScanner()
+
+# -----------------------------
+# 2️⃣ File log (JSON Lines, xem app/utils/audit_log.py)
 # -----------------------------
-AUDIT_DIR = "data"
-AUDIT_LOG = os.path.join(AUDIT_DIR, "pii_audit.json")
+AUDIT_DIR = str(audit_log.AUDIT_DIR)
+AUDIT_LOG = str(audit_log.AUDIT_LOG)
 os.makedirs(AUDIT_DIR, exist_ok=True)
 
 # -----------------------------
 # 3️⃣ Hàm ghi log
 # -----------------------------
 def log_audit(action, details):
-    entry = {
-        "time": datetime.now().strftime("%H:%M %d/%m/%y"),
-        "action": action,
-        "details": details
-    }
-
-    # Nếu file chưa có, tạo mới
-    if not os.path.exists(AUDIT_LOG):
-        with open(AUDIT_LOG, "w", encoding="utf-8") as f:
-            json.dump([entry], f, indent=2, ensure_ascii=False)
-        return
-
-    # Ghi thêm vào log cũ
-    try:
-        with open(AUDIT_LOG, "r+", encoding="utf-8") as f:
-            data = json.load(f)
-            data.append(entry)
-            f.seek(0)
-            json.dump(data, f, indent=2, ensure_ascii=False)
-    except json.JSONDecodeError:
-        with open(AUDIT_LOG, "w", encoding="utf-8") as f:
-            json.dump([entry], f, indent=2, ensure_ascii=False)
+    """
+    Đẩy 1 entry vào audit writer nền — không đọc/ghi file trong request.
+    """
+    audit_log.audit_writer.write(audit_log.make_entry(action, details))
 
 # -----------------------------
 # 4️⃣ Hàm mask text
 # -----------------------------
 def mask_pii(text):
-    masked = text
-    detected = []
-    for key, pattern in PII_PATTERNS.items():
-        matches = re.findall(pattern, masked)
-        if matches:
-            detected.append(key)
-            masked = re.sub(pattern, f"<{key.upper()}>", masked)
+    with timed("text_mask"):
+        masked, detected = pii_scanner.mask(text)
     if detected:
         log_audit("mask_text", detected)
     return masked
 
 # -----------------------------
-# 5️⃣ Hàm mask CSV (đã tối ưu)
+# 5️⃣ Hàm mask CSV (DataFrame, 1 lượt regex / cột, song song khi lớn)
 # -----------------------------
-def mask_csv_pii(csv_path):
+CSV_PARALLEL_MIN_CELLS = int(os.getenv("CSV_PARALLEL_MIN_CELLS", 200_000))
+CSV_MASK_WORKERS = int(os.getenv("CSV_MASK_WORKERS", cpu_pool.max_workers))
+
+
+def _mask_series(series):
+    """
+    Mask 1 cột text; NaN và giá trị không phải chuỗi được giữ nguyên.
     """
-    Mask toàn bộ CSV — chỉ log 1 dòng duy nhất cho mỗi lần xử lý.
+    values = series.to_numpy(dtype=object, copy=True)
+    is_text = np.fromiter((isinstance(v, str) for v in values), dtype=bool, count=len(values))
+    if not is_text.any():
+        return series, []
+    masked, found = pii_scanner.mask_batch(values[is_text])
+    values[is_text] = masked
+    result = pd.Series(values, index=series.index, name=series.name)
+    # Giữ kiểu chuỗi gốc (vd. string[pyarrow]) thay vì rơi về object
+    return (result if series.dtype == object else result.astype(series.dtype)), found
+
+
+def _mask_categorical(series):
     """
-    df = pd.read_csv(csv_path)
-    detected_types = set()
+    Cột category: chỉ mask các giá trị phân biệt (categories) rồi map lại theo code.
+    """
+    categories, found = _mask_series(pd.Series(series.cat.categories.to_numpy(dtype=object)))
+    if not found:
+        return series, []
+    # 2 category khác nhau có thể mask ra cùng 1 chuỗi → gộp lại
+    remap, uniques = pd.factorize(categories.to_numpy(dtype=object))
+    codes = series.cat.codes.to_numpy()
+    new_codes = np.where(codes >= 0, remap[codes], -1)
+    return pd.Series(pd.Categorical.from_codes(new_codes, categories=uniques),
+                     index=series.index, name=series.name), found
+
+
+def _mask_frame(frame):
+    """
+    Mask tất cả cột của 1 DataFrame con (chạy được trong worker process).
+    """
+    detected = set()
+    for col in frame.columns:
+        frame[col], found = _mask_series(frame[col])
+        detected.update(found)
+    return frame, detected
 
-    for col in df.columns:
-        if df[col].dtype == object:
-            # Quét và mask PII (không log từng ô)
-            df[col] = df[col].astype(str)
-            for key, pattern in PII_PATTERNS.items():
-                has_match = df[col].str.contains(pattern, regex=True, na=False, flags=re.IGNORECASE)
-                if has_match.any():
-                    detected_types.add(key)
-                    df[col] = df[col].str.replace(pattern, f"<{key.upper()}>", regex=True)
+
+def mask_dataframe(df, parallel=None):
+    """
+    Mask PII trong mọi cột text (kể cả category) của DataFrame → (DataFrame mới, set type phát hiện).
+    Không ghi audit log. Frame lớn (>= CSV_PARALLEL_MIN_CELLS ô text) được chia theo
+    khối dòng và mask song song trên cpu_pool.
+    """
+    df = df.copy(deep=False)
+    detected = set()
+    for col in df.select_dtypes(include=["category"]).columns:
+        df[col], found = _mask_categorical(df[col])
+        detected.update(found)
+
+    text_cols = list(df.select_dtypes(include=["object", "string"]).columns)
+    if not text_cols:
+        return df, detected
+
+    n_cells = len(df) * len(text_cols)
+    if parallel is None:
+        parallel = CSV_MASK_WORKERS > 1 and n_cells >= CSV_PARALLEL_MIN_CELLS
+
+    if not parallel:
+        masked, found = _mask_frame(df[text_cols].copy(deep=False))
+    else:
+        chunks = np.array_split(np.arange(len(df)), CSV_MASK_WORKERS)
+        parts = [df[text_cols].iloc[idx] for idx in chunks if len(idx)]
+        results = cpu_pool.map(_mask_frame, parts)
+        masked = pd.concat([frame for frame, _ in results])
+        found = set().union(*(found for _, found in results))
+
+    for col in text_cols:
+        df[col] = masked[col]
+    return df, detected | found
+
+
+def mask_csv_pii(data):
+    """
+    Mask toàn bộ CSV — nhận DataFrame (hoặc đường dẫn CSV cho tương thích cũ).
+    Chỉ log 1 dòng duy nhất cho mỗi lần xử lý.
+    """
+    df = pd.read_csv(data) if isinstance(data, (str, os.PathLike)) else data
+    with timed("csv_mask"):
+        df, detected_types = mask_dataframe(df)
 
     # 🔥 Log chỉ 1 dòng duy nhất
     if detected_types:
-        log_audit("mask_csv", list(detected_types))
+        log_audit("mask_csv", [key for key in PII_PATTERNS if key in detected_types])
 
     return df
 
@@ -97,31 +216,10 @@ def mask_csv_pii(csv_path):
 # 6️⃣ Hàm mask Image
 # -----------------------------
 def mask_image_pii(image_path, output_path=None):
-    img = cv2.imread(image_path)
-    if img is None:
-        raise ValueError(f"Cannot read image: {image_path}")
-
-    detected_types = []
-
-    text_boxes = pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT)
-    for i, word in enumerate(text_boxes['text']):
-        for key, pattern in PII_PATTERNS.items():
-            if re.match(pattern, word):
-                x, y, w, h = (
-                    text_boxes['left'][i],
-                    text_boxes['top'][i],
-                    text_boxes['width'][i],
-                    text_boxes['height'][i]
-                )
-                cv2.rectangle(img, (x, y), (x + w, y + h), (0, 0, 0), -1)
-                detected_types.append(key)
-
-    # Save masked image
-    if not output_path:
-        output_path = image_path.replace(".jpg", "_masked.jpg").replace(".png", "_masked.png")
-    cv2.imwrite(output_path, img)
-
-    if detected_types:
-        log_audit("mask_image", detected_types)
+    """
+    Mask PII trên ảnh (dùng chung engine với process_image, xem app/utils/image_masking.py).
+    """
+    from app.utils.image_masking import mask_image_file
 
+    output_path, _ = mask_image_file(image_path, output_path)
     return output_path
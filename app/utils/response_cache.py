@@ -0,0 +1,215 @@
+import os
+import re
+import sys
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from app.utils.pii_utils import pii_scanner
+
+# ⚙️ Cấu hình cache câu trả lời LLM
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 3600))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 10_000))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# Tier tương đồng (encode câu hỏi bằng CLIP text encoder của SelfRAG) — tắt mặc định
+RESPONSE_CACHE_SEMANTIC = os.getenv("RESPONSE_CACHE_SEMANTIC", "0") == "1"
+RESPONSE_CACHE_SIM_THRESHOLD = float(os.getenv("RESPONSE_CACHE_SIM_THRESHOLD", 0.95))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def cache_key(masked_message):
+    """
+    Key = sha256 của câu hỏi đã mask, chuẩn hoá khoảng trắng + chữ hoa/thường.
+    """
+    normalized = _WHITESPACE.sub(" ", masked_message).strip().casefold()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("reply", "size", "expires", "slot")
+
+    def __init__(self, reply, size, expires, slot=None):
+        self.reply = reply
+        self.size = size
+        self.expires = expires
+        self.slot = slot
+
+
+class ResponseCache:
+    """
+    Cache câu trả lời LLM theo câu hỏi đã mask PII:
+    - tier exact: dict theo hash câu hỏi (không lưu câu hỏi gốc)
+    - tier semantic (tuỳ chọn): embedding câu hỏi trong 1 ma trận, cosine ≥ threshold → hit
+    - TTL + LRU theo số entry và tổng dung lượng; câu trả lời được mask lại trước khi lưu
+    """
+
+    def __init__(self, ttl=RESPONSE_CACHE_TTL, max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                 max_bytes=RESPONSE_CACHE_MAX_BYTES, semantic=RESPONSE_CACHE_SEMANTIC,
+                 threshold=RESPONSE_CACHE_SIM_THRESHOLD, encoder=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.semantic = semantic
+        self.threshold = threshold
+        self._encoder = encoder
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        # Tier semantic: ma trận embedding (tăng gấp đôi khi đầy) + slot trống tái sử dụng
+        self._vectors = None
+        self._slot_keys = []
+        self._free_slots = []
+        self._pending_vectors = OrderedDict()  # embedding đã tính lúc get, dùng lại khi put
+        self.hits_exact = 0
+        self.hits_semantic = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    # ---------- exact ----------
+    def get(self, masked_message):
+        """
+        Tra tier exact (O(1), gọi được trực tiếp trong event loop).
+        """
+        key = cache_key(masked_message)
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                self.hits_exact += 1
+                return entry.reply
+            if not self.semantic:
+                self.misses += 1
+            return None
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires < time.time():
+            self._remove(key)
+            self.expired += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    # ---------- semantic ----------
+    def _encode(self, masked_message):
+        if self._encoder is None:
+            from app.SelfRAG.feature_extraction import clip_model
+            if clip_model.error is not None:
+                return None
+            try:
+                self._encoder = clip_model.get()
+            except Exception as e:
+                print(f"[⚠️] Không load được CLIP, tắt cache semantic: {e}")
+                self.semantic = False
+                return None
+        vector = np.asarray(self._encoder.encode([masked_message], convert_to_numpy=True)[0], dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def get_similar(self, masked_message):
+        """
+        Tra tier semantic (encode câu hỏi → tốn CPU, nên gọi qua run_io). Gọi sau get() miss.
+        """
+        if not self.semantic:
+            return None
+        vector = self._encode(masked_message)
+        key = cache_key(masked_message)
+        with self._lock:
+            if vector is None or self._vectors is None or len(self._entries) == 0:
+                self.misses += 1
+                if vector is not None:
+                    self._remember_vector(key, vector)
+                return None
+            n = len(self._slot_keys)
+            scores = self._vectors[:n] @ vector
+            scores[[k is None for k in self._slot_keys]] = -1.0
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                entry = self._lookup(self._slot_keys[best])
+                if entry is not None:
+                    self.hits_semantic += 1
+                    return entry.reply
+            self.misses += 1
+            self._remember_vector(key, vector)
+            return None
+
+    def _remember_vector(self, key, vector):
+        self._pending_vectors[key] = vector
+        while len(self._pending_vectors) > 256:
+            self._pending_vectors.popitem(last=False)
+
+    def _assign_slot(self, key, vector):
+        if self._free_slots:
+            slot = self._free_slots.pop()
+        else:
+            slot = len(self._slot_keys)
+            self._slot_keys.append(None)
+            if self._vectors is None:
+                self._vectors = np.zeros((64, len(vector)), dtype=np.float32)
+            elif slot >= len(self._vectors):
+                grown = np.zeros((len(self._vectors) * 2, self._vectors.shape[1]), dtype=np.float32)
+                grown[:len(self._vectors)] = self._vectors
+                self._vectors = grown
+        self._vectors[slot] = vector
+        self._slot_keys[slot] = key
+        return slot
+
+    # ---------- ghi ----------
+    def put(self, masked_message, reply):
+        """
+        Lưu câu trả lời (đã mask lại PII — cache không bao giờ giữ text chưa mask).
+        """
+        if not isinstance(reply, str):
+            return
+        reply, _ = pii_scanner.mask(reply)
+        key = cache_key(masked_message)
+        size = sys.getsizeof(reply) + 128
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            vector = self._pending_vectors.pop(key, None) if self.semantic else None
+            slot = self._assign_slot(key, vector) if vector is not None else None
+            self._entries[key] = _Entry(reply, size, time.time() + self.ttl, slot)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
+        if entry.slot is not None:
+            self._slot_keys[entry.slot] = None
+            self._vectors[entry.slot] = 0.0
+            self._free_slots.append(entry.slot)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            hits = self.hits_exact + self.hits_semantic
+            lookups = hits + self.misses
+            return {
+                "hits_exact": self.hits_exact,
+                "hits_semantic": self.hits_semantic,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "semantic": self.semantic,
+            }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,174 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+from starlette.exceptions import HTTPException
+from app.utils.ocr import cv2
+
+# ⚙️ Cấu hình upload
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", 1024 * 1024))
+UPLOAD_DECODE_IN_MEMORY_BYTES = int(os.getenv("UPLOAD_DECODE_IN_MEMORY_BYTES", 8 * 1024 * 1024))  # ảnh nhỏ hơn → decode từ RAM
+UPLOAD_MAX_IMAGE_BYTES = int(os.getenv("UPLOAD_MAX_IMAGE_BYTES", 20 * 1024 * 1024))
+UPLOAD_MAX_CSV_BYTES = int(os.getenv("UPLOAD_MAX_CSV_BYTES", 512 * 1024 * 1024))
+
+# Giới hạn body theo route (kể cả phần multipart bao quanh file)
+UPLOAD_LIMITS = {
+    "/image/upload_image/": UPLOAD_MAX_IMAGE_BYTES,
+    "/csv/upload_csv/": UPLOAD_MAX_CSV_BYTES,
+}
+
+
+class UploadStats:
+    """
+    Bộ đếm upload: số file, tổng byte đã copy, số file đi đường RAM / chunk, số request bị chặn.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.bytes = 0
+        self.in_memory = 0
+        self.chunked = 0
+        self.rejected = 0
+
+    def record(self, copied, in_memory):
+        with self._lock:
+            self.uploads += 1
+            self.bytes += copied
+            if in_memory:
+                self.in_memory += 1
+            else:
+                self.chunked += 1
+
+    def reject(self):
+        with self._lock:
+            self.rejected += 1
+
+    def stats(self):
+        with self._lock:
+            return {"uploads": self.uploads, "bytes": self.bytes, "in_memory": self.in_memory,
+                    "chunked": self.chunked, "rejected": self.rejected}
+
+
+upload_stats = UploadStats()
+
+
+class UploadTooLarge(HTTPException):
+    """
+    Body request vượt giới hạn của route → 413.
+    Là HTTPException để FastAPI không bọc lại thành lỗi 400 khi đang parse form.
+    """
+
+    def __init__(self, limit):
+        super().__init__(status_code=413, detail=f"File quá lớn (tối đa {limit} bytes)")
+        upload_stats.reject()
+
+
+# ====================================================
+# 💾 GHI FILE UPLOAD RA ĐĨA
+# ====================================================
+def upload_size(src):
+    """
+    Kích thước file upload chỉ qua API file công khai (seek/tell), giữ nguyên vị trí đọc.
+    Không dùng fileno(): với SpooledTemporaryFile, fileno() ép phần đang nằm trong RAM ghi ra đĩa.
+    """
+    position = src.tell()
+    size = src.seek(0, os.SEEK_END)
+    src.seek(position)
+    return size
+
+
+def read_small(src, limit=None):
+    """
+    Toàn bộ bytes của file upload nếu ≤ limit (mặc định UPLOAD_DECODE_IN_MEMORY_BYTES),
+    ngược lại None (vị trí đọc về đầu file).
+    """
+    src.seek(0)
+    if upload_size(src) > (UPLOAD_DECODE_IN_MEMORY_BYTES if limit is None else limit):
+        return None
+    return src.read()
+
+
+def save_upload(src, path, decode_image=False):
+    """
+    Ghi file upload ra path, tính sha256 trong cùng 1 lượt đọc.
+    - File nhỏ (≤ UPLOAD_DECODE_IN_MEMORY_BYTES): đọc 1 lần vào RAM, ghi 1 lần,
+      decode_image=True → cv2.imdecode luôn từ buffer (khỏi cv2.imread đọc lại từ đĩa).
+    - File lớn: copy theo chunk UPLOAD_CHUNK_BYTES bằng readinto vào 1 buffer dùng lại.
+    Lưu ý: Starlette đã spool body trước khi route chạy (≤ 1MB trong RAM, lớn hơn → file tạm),
+    nên file lớn được ghi đĩa 2 lần (file tạm + path). Chấp nhận vì upload đã bị giới hạn
+    kích thước ở UploadLimitMiddleware và tên file đích chỉ biết sau khi có sha256.
+    Trả về {"path", "bytes", "sha256", "in_memory", "image"}.
+    """
+    digest = hashlib.sha256()
+    data = read_small(src)
+
+    image = None
+    with open(path, "wb") as out:
+        if data is not None:
+            digest.update(data)
+            out.write(data)
+            copied = len(data)
+            if decode_image:
+                image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        else:
+            buffer = bytearray(UPLOAD_CHUNK_BYTES)
+            view = memoryview(buffer)
+            copied = 0
+            while True:
+                n = src.readinto(buffer)
+                if not n:
+                    break
+                digest.update(view[:n])
+                out.write(view[:n])
+                copied += n
+
+    upload_stats.record(copied, data is not None)
+    return {"path": path, "bytes": copied, "sha256": digest.hexdigest(),
+            "in_memory": data is not None, "image": image}
+
+
+# ====================================================
+# 🚧 GIỚI HẠN KÍCH THƯỚC UPLOAD (ASGI MIDDLEWARE)
+# ====================================================
+class UploadLimitMiddleware:
+    """
+    Chặn upload quá lớn trước khi multipart được parse:
+    - Content-Length vượt giới hạn → 413 ngay, không đọc body
+    - không có Content-Length (chunked) → đếm byte khi nhận, vượt → dừng đọc + 413
+    """
+
+    def __init__(self, app, limits=None):
+        self.app = app
+        self.limits = UPLOAD_LIMITS if limits is None else limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        length = headers.get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > limit:
+            error = UploadTooLarge(limit)
+            body = json.dumps({"error": error.detail}, ensure_ascii=False).encode()
+            await send({"type": "http.response.start", "status": error.status_code,
+                        "headers": [(b"content-type", b"application/json"),
+                                    (b"content-length", str(len(body)).encode()),
+                                    (b"connection", b"close")]})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise UploadTooLarge(limit)
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -37,6 +37,8 @@ if "uploaded_image_path" not in st.session_state:
     st.session_state.uploaded_image_path = None
 if "csv_preview" not in st.session_state:
     st.session_state.csv_preview = None
+if "csv_chart" not in st.session_state:
+    st.session_state.csv_chart = None
 
 # --- SIDEBAR: Upload & Config ---
 with st.sidebar:
@@ -66,6 +68,8 @@ with st.sidebar:
                 else:
                     reply = result.get("reply", "🤖 Phân tích CSV hoàn thành.")
                     append_to_history("assistant", reply)
+                    # Histogram: backend trả bin JSON → vẽ ngay trên client, không cần tải PNG
+                    st.session_state.csv_chart = result.get("chart")
                     
                     # Cập nhật CSV Preview
                     if isinstance(reply, (dict, list)):
@@ -162,8 +166,16 @@ with col_img:
         except Exception as e:
             st.warning(f"Không thể hiển thị ảnh: {e}")
 
-# 5. Hiển thị CSV Preview (Bên phải)
+# 5. Hiển thị CSV Preview + biểu đồ (Bên phải)
 with col_csv:
+    if st.session_state.csv_chart:
+        chart = st.session_state.csv_chart
+        st.subheader(f"📊 Histogram: {chart['column']}")
+        edges = chart["edges"]
+        labels = [f"{edges[i]:.4g} – {edges[i + 1]:.4g}" for i in range(len(chart["counts"]))]
+        st.bar_chart(pd.DataFrame({"count": chart["counts"]}, index=labels))
+        st.caption(f"PNG: {API_BASE}{chart['png_url']}")
+
     if st.session_state.csv_preview is not None:
         st.subheader("📊 CSV Data Preview (5 hàng đầu)")
         try:
@@ -0,0 +1,88 @@
+# benchmarks/bench_csv_loader.py
+# -------------------------------------------------------------
+# So sánh đường đọc CSV cũ (pd.read_csv engine C + mask) với load_csv
+# (pyarrow + dtype Arrow + category, lần đầu và khi đã cache schema)
+# trên file "dài" (nhiều dòng, ít cột) và "rộng" (ít dòng, nhiều cột).
+# Chạy: python -m benchmarks.bench_csv_loader [--rows 500000]
+# -------------------------------------------------------------
+import io
+import sys
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+from app.utils import csv_loader
+from app.utils.pii_utils import mask_dataframe
+
+rng = np.random.default_rng(0)
+CITIES = ["Hanoi", "Saigon", "Hue", "Da Nang", "Can Tho", "Singapore"]
+
+
+def make_long(n_rows):
+    return pd.DataFrame({
+        "id": np.arange(n_rows),
+        "city": rng.choice(CITIES, n_rows),
+        "status": rng.choice(["open", "closed", "pending"], n_rows),
+        "email": [f"user{i}@example.com" for i in range(n_rows)],
+        "price": rng.normal(100, 20, n_rows).round(2),
+        "qty": rng.integers(1, 50, n_rows),
+    })
+
+
+def make_wide(n_rows, n_cols=200):
+    data = {}
+    for j in range(n_cols):
+        if j % 4 == 0:
+            data[f"cat_{j}"] = rng.choice(CITIES, n_rows)
+        else:
+            data[f"num_{j}"] = rng.normal(size=n_rows).round(4)
+    return pd.DataFrame(data)
+
+
+def legacy_load(content):
+    # Đường cũ: engine C, suy luận kiểu đầy đủ, cột chuỗi là object
+    return mask_dataframe(pd.read_csv(io.BytesIO(content)))[0]
+
+
+def new_load(content):
+    return mask_dataframe(csv_loader.load_csv(content))[0]
+
+
+def bench(label, fn, content, repeat=3):
+    best = min(_timed(fn, content) for _ in range(repeat))
+    df = fn(content)
+    mem = df.memory_usage(deep=True).sum() / 1024 ** 2
+    print(f"  {label:<34} {best * 1e3:9.1f} ms   {mem:8.1f} MB")
+    return best
+
+
+def _timed(fn, content):
+    start = time.perf_counter()
+    fn(content)
+    return time.perf_counter() - start
+
+
+def run(name, df):
+    content = df.to_csv(index=False).encode()
+    print(f"📊 {name}: {df.shape[0]} dòng × {df.shape[1]} cột, {len(content) / 1024 ** 2:.1f} MB CSV")
+    old = bench("read_csv (C) + mask", legacy_load, content)
+
+    # Schema cache tạm để lần đo "cold" luôn phải suy luận kiểu
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_loader.schema_cache = csv_loader.SchemaCache(path=f"{tmp}/schemas.json")
+        key = csv_loader.schema_key(content=content)
+
+        def cold(data):
+            csv_loader.schema_cache.drop(key)
+            return new_load(data)
+
+        first = bench(f"load_csv ({csv_loader.CSV_ENGINE}, infer)", cold, content)
+        new_load(content)
+        warm = bench(f"load_csv ({csv_loader.CSV_ENGINE}, cached schema)", new_load, content)
+    print(f"  → speedup: {old / first:.1f}x (infer), {old / warm:.1f}x (cached schema)\n")
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[sys.argv.index("--rows") + 1]) if "--rows" in sys.argv else 300_000
+    run("long", make_long(rows))
+    run("wide", make_wide(max(1000, rows // 30)))
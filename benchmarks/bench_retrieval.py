@@ -0,0 +1,69 @@
+# benchmarks/bench_retrieval.py
+# -------------------------------------------------------------
+# Đo latency + recall@k của retrieval: brute force (argpartition) vs IVF,
+# so với vòng lặp Python trên list dict kiểu clip_features.pkl cũ
+# Chạy: python -m benchmarks.bench_retrieval [n_items] [dim]
+# -------------------------------------------------------------
+import sys
+import time
+import numpy as np
+from app.SelfRAG.retrieval import IVFIndex, _as_queries, _score, top_k
+
+K = 10
+N_QUERIES = 64
+
+
+def make_corpus(n, dim, n_clusters=256, seed=0):
+    # Dữ liệu có cụm giống embeddings thật (không phải nhiễu đều)
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, size=n)
+    corpus = centers[labels] + 0.6 * rng.normal(size=(n, dim)).astype(np.float32)
+    queries = centers[rng.integers(0, n_clusters, size=N_QUERIES)] + 0.6 * rng.normal(size=(N_QUERIES, dim))
+    return _as_queries(corpus), _as_queries(queries)
+
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def legacy_search(rows, query, k):
+    # Cách làm "ngây thơ" trên list dict: cosine từng item trong Python rồi sort toàn bộ
+    scored = []
+    for row in rows:
+        emb = row["image_embedding"]
+        scored.append((float(np.dot(emb, query) / (np.linalg.norm(emb) * np.linalg.norm(query))), row["id"]))
+    scored.sort(reverse=True)
+    return scored[:k]
+
+
+def recall(found, truth):
+    return np.mean([len(set(f[f >= 0]) & set(t)) / len(t) for f, t in zip(found, truth)])
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 512
+    corpus, queries = make_corpus(n, dim)
+    print(f"corpus: {n} x {dim} | {N_QUERIES} query | k={K}\n")
+
+    rows = [{"id": i, "image_embedding": corpus[i]} for i in range(min(n, 20_000))]
+    t_legacy, _ = timed(lambda: legacy_search(rows, queries[0], K), repeat=1)
+    print(f"{'python loop (1 query, ' + str(len(rows)) + ' item)':<38} {t_legacy * 1e3:10.2f} ms/query")
+
+    t_single, _ = timed(lambda: [top_k(_score(corpus, q[None, :]), K) for q in queries])
+    t_batch, (truth, _) = timed(lambda: top_k(_score(corpus, queries), K))
+    print(f"{'brute force (từng query)':<38} {t_single / N_QUERIES * 1e3:10.2f} ms/query")
+    print(f"{'brute force (batch)':<38} {t_batch / N_QUERIES * 1e3:10.2f} ms/query")
+
+    t_build, index = timed(lambda: IVFIndex(corpus), repeat=1)
+    print(f"{'IVF build (' + str(index.n_lists) + ' list)':<38} {t_build * 1e3:10.2f} ms")
+    for nprobe in (1, 4, 8, 16, 32):
+        t_ivf, (found, _) = timed(lambda: index.search(queries, K, nprobe=nprobe))
+        print(f"{'IVF nprobe=' + str(nprobe):<38} {t_ivf / N_QUERIES * 1e3:10.2f} ms/query"
+              f"   recall@{K}={recall(found, truth):.3f}")
@@ -0,0 +1,94 @@
+# benchmarks/llm_stub_server.py
+# -------------------------------------------------------------
+# Server giả lập API tương thích OpenAI (/v1/chat/completions) để test/benchmark
+# LLM client mà không cần model thật. Có thể chèn độ trễ + lỗi ngẫu nhiên.
+# Chạy: python -m benchmarks.llm_stub_server --port 8001 --latency 0.5 --token-delay 0.02
+# Backend: LLM_BACKEND=openai LLM_BASE_URL=http://127.0.0.1:8001/v1 uvicorn app.main:app
+# -------------------------------------------------------------
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# ⚙️ Cấu hình (env hoặc tham số dòng lệnh)
+STUB_LATENCY = float(os.getenv("STUB_LATENCY", 0.2))  # giây trước token đầu tiên
+STUB_TOKEN_DELAY = float(os.getenv("STUB_TOKEN_DELAY", 0.01))  # giây giữa 2 token
+STUB_FAIL_RATE = float(os.getenv("STUB_FAIL_RATE", 0.0))  # tỉ lệ trả 503 (test retry)
+
+app = FastAPI(title="LLM stub 🧪")
+stats = {"requests": 0, "failed": 0}
+
+
+def _reply_tokens(messages):
+    content = messages[-1]["content"] if messages else ""
+    words = f"Stub reply to: {content}".split(" ")
+    return [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+
+def _chunk(model, delta, finish_reason=None):
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    if random.random() < STUB_FAIL_RATE:
+        stats["failed"] += 1
+        return JSONResponse(status_code=503, content={"error": "stub overloaded"}, headers={"Retry-After": "0"})
+
+    model = body.get("model", "stub")
+    tokens = _reply_tokens(body.get("messages", []))
+    await asyncio.sleep(STUB_LATENCY)
+
+    if not body.get("stream"):
+        await asyncio.sleep(STUB_TOKEN_DELAY * len(tokens))
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)},
+                         "finish_reason": "stop"}],
+        }
+
+    async def events():
+        yield f"data: {json.dumps(_chunk(model, {'role': 'assistant'}))}\n\n"
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(STUB_TOKEN_DELAY)
+            yield f"data: {json.dumps(_chunk(model, {'content': token}))}\n\n"
+        yield f"data: {json.dumps(_chunk(model, {}, 'stop'))}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/stats")
+def get_stats():
+    return stats
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="OpenAI-compatible LLM stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=STUB_LATENCY)
+    parser.add_argument("--token-delay", type=float, default=STUB_TOKEN_DELAY)
+    parser.add_argument("--fail-rate", type=float, default=STUB_FAIL_RATE)
+    args = parser.parse_args()
+
+    STUB_LATENCY, STUB_TOKEN_DELAY, STUB_FAIL_RATE = args.latency, args.token_delay, args.fail_rate
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,333 @@
+# benchmarks/run_benchmarks.py
+# -------------------------------------------------------------
+# Load test các endpoint chính: /chat/, /csv/upload_csv/, /image/upload_image/,
+# /memory/history/ với CSV tổng hợp (có / không PII, nhiều kích thước) và ảnh
+# có chữ vẽ bằng cv2.putText. Báo throughput, p50/p95/p99, peak RSS và so với
+# baseline (benchmarks/baselines.json) để bắt regression ở mask / parse / history I/O.
+#
+# Chạy in-process (ASGI, thư mục dữ liệu tạm, không cần server):
+#   python -m benchmarks.run_benchmarks [--only chat,csv_small_pii] [--requests 20] [--concurrency 8]
+# Chạy với server thật (peak RSS đọc từ /proc/<pid> nếu truyền --pid):
+#   uvicorn app.main:app --port 8000 &
+#   python -m benchmarks.run_benchmarks --url http://127.0.0.1:8000 --pid $!
+# Lưu baseline mới: thêm --save-baseline. Có regression → exit code 1.
+# -------------------------------------------------------------
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import numpy as np
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+rng = np.random.default_rng(0)
+
+CITIES = ["Hanoi", "Saigon", "Hue", "Da Nang", "Can Tho", "Singapore"]
+NAMES = ["John Smith", "Mary Jane", "Anna Lee", "Peter Parker", "Linh Tran"]
+
+
+# ====================================================
+# 🧪 DỮ LIỆU TỔNG HỢP
+# ====================================================
+def make_csv(n_rows, pii=True):
+    """
+    CSV bytes: cột số + cột category; pii=True thêm tên / email / số điện thoại.
+    """
+    import pandas as pd
+
+    data = {
+        "id": np.arange(n_rows),
+        "city": rng.choice(CITIES, n_rows),
+        "price": rng.normal(100, 20, n_rows).round(2),
+        "qty": rng.integers(1, 50, n_rows),
+    }
+    if pii:
+        data["name"] = rng.choice(NAMES, n_rows)
+        data["email"] = [f"user{i}@example.com" for i in range(n_rows)]
+        data["phone"] = [f"090-{i % 1000:03d}-{i % 10000:04d}" for i in range(n_rows)]
+    else:
+        data["code"] = [f"item_{i}" for i in range(n_rows)]
+    return pd.DataFrame(data).to_csv(index=False).encode()
+
+
+def make_image(seed, width=1000, height=700):
+    """
+    PNG có vài dòng chữ chứa PII trên nền khối xám ngẫu nhiên (mỗi seed 1 ảnh khác hẳn
+    → không trúng cache ảnh trùng / gần trùng).
+    """
+    import cv2
+
+    local = np.random.default_rng(seed)
+    img = np.full((height, width, 3), 255, dtype=np.uint8)
+    for _ in range(12):
+        x, y = local.integers(0, width), local.integers(0, height)
+        shade = int(local.integers(150, 250))
+        cv2.rectangle(img, (int(x), int(y)), (int(x) + 120, int(y) + 80), (shade, shade, shade), -1)
+    lines = [f"Invoice #{seed}", "Customer: John Smith", "Call 090-123-4567", f"Email: user{seed}@example.com"]
+    for i, line in enumerate(lines):
+        cv2.putText(img, line, (40, 120 + i * 110), cv2.FONT_HERSHEY_SIMPLEX, 1.6, (0, 0, 0), 3, cv2.LINE_AA)
+    return cv2.imencode(".png", img)[1].tobytes()
+
+
+def _unique_csv(base, i):
+    # Thêm 1 dòng (id riêng) cho mỗi request → hash nội dung khác → luôn parse + mask lại, không trúng cache
+    first_row = base.split(b"\n", 2)[1]
+    return base + str(10 ** 9 + i).encode() + first_row[first_row.index(b","):] + b"\n"
+
+
+# ====================================================
+# 📋 KỊCH BẢN
+# ====================================================
+def build_scenarios(rows):
+    """
+    name → (số request mặc định, factory). factory() tạo dữ liệu tổng hợp (chỉ khi kịch bản
+    được chạy) và trả về hàm i → tham số request của httpx.
+    """
+    def chat():
+        def request(i):
+            message = (f"Hello, I am John Smith, call me at 090-123-{i % 10000:04d}" if i % 2
+                       else f"What is the price of item {i}?")
+            return {"method": "POST", "url": "/chat/", "json": {"message": message, "session_id": f"bench-{i % 8}"}}
+        return request
+
+    def csv_upload(n_rows, pii=True, question="Tóm tắt dataset", unique=True):
+        def factory():
+            content = make_csv(n_rows, pii)
+
+            def request(i):
+                data = _unique_csv(content, i) if unique else content
+                return {"method": "POST", "url": "/csv/upload_csv/",
+                        "files": {"file": (f"bench_{i}.csv", data, "text/csv")}, "data": {"question": question}}
+            return request
+        return factory
+
+    def image():
+        def request(i):
+            return {"method": "POST", "url": "/image/upload_image/",
+                    "files": {"file": (f"bench_{i}.png", make_image(i), "image/png")},
+                    "data": {"question": "What is this?"}}
+        return request
+
+    def history(params):
+        return lambda: lambda i: {"method": "GET", "url": "/memory/history/", "params": params}
+
+    return {
+        "chat": (200, chat),
+        "csv_small_pii": (40, csv_upload(1_000)),
+        "csv_small_clean": (40, csv_upload(1_000, pii=False)),
+        "csv_large_pii": (6, csv_upload(rows)),
+        "csv_cached_query": (40, csv_upload(1_000, question="average price by city where qty >= 10", unique=False)),
+        "image": (10, image),
+        "history": (200, history({"limit": 100})),
+        "history_export": (20, history({"format": "ndjson"})),
+    }
+
+
+# ====================================================
+# ⏱️ ĐO
+# ====================================================
+def peak_rss_mb(pid=None):
+    """
+    Peak RSS (VmHWM) của process pid (mặc định process hiện tại) theo MB; None nếu không đọc được.
+    """
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if pid is None:
+        try:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        except ImportError:
+            pass
+    return None
+
+
+def _failed(resp):
+    # Route của repo trả lỗi nghiệp vụ dạng 200 + {"error": ...}
+    if resp.status_code >= 400:
+        return True
+    if resp.headers.get("content-type", "").startswith("application/json"):
+        body = resp.json()
+        return isinstance(body, dict) and "error" in body
+    return False
+
+
+async def run_scenario(client, make_request, n, concurrency, warmup=2):
+    for i in range(warmup):
+        # Index ngoài dải đo → dữ liệu warmup không trùng với request được đo
+        await client.request(**make_request(10 ** 6 + i))
+
+    latencies, errors = [], []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            # Tạo body trong slot → tối đa `concurrency` bản dữ liệu cùng lúc, không tính vào latency
+            kwargs = make_request(i)
+            start = time.perf_counter()
+            resp = await client.request(**kwargs)
+            await resp.aread()
+            latencies.append(time.perf_counter() - start)
+        if _failed(resp):
+            errors.append(f"{resp.status_code} {resp.text[:120]}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n)))
+    wall = time.perf_counter() - start
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    return {
+        "requests": n,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "throughput_rps": n / wall,
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+    }
+
+
+# ====================================================
+# 📉 BASELINE
+# ====================================================
+def machine_info():
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()}
+
+
+def compare(results, baseline, tolerance):
+    """
+    So với baseline: p95 / peak RSS tăng hoặc throughput giảm quá tolerance → regression.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        if result["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']:.1f} ms > baseline {base['p95_ms']:.1f} ms")
+        if result["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {result['throughput_rps']:.1f} < baseline {base['throughput_rps']:.1f} req/s")
+        if result.get("peak_rss_mb") and base.get("peak_rss_mb") and result["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{name}: peak RSS {result['peak_rss_mb']:.0f} MB > baseline {base['peak_rss_mb']:.0f} MB")
+    return regressions
+
+
+def print_table(results):
+    print(f"{'scenario':<18} {'req':>5} {'err':>4} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'RSS MB':>8}")
+    for name, r in results.items():
+        rss = f"{r['peak_rss_mb']:8.0f}" if r.get("peak_rss_mb") else f"{'-':>8}"
+        print(f"{name:<18} {r['requests']:>5} {r['errors']:>4} {r['throughput_rps']:8.1f} "
+              f"{r['p50_ms']:9.1f} {r['p95_ms']:9.1f} {r['p99_ms']:9.1f} {rss}")
+    for name, r in results.items():
+        if r["first_error"]:
+            print(f"  ⚠️ {name}: {r['errors']} lỗi, vd. {r['first_error']}")
+
+
+# ====================================================
+# 🚀 MAIN
+# ====================================================
+async def main(args):
+    import httpx
+
+    scenarios = build_scenarios(args.rows)
+    names = args.only.split(",") if args.only else list(scenarios)
+    unknown = [name for name in names if name not in scenarios]
+    if unknown:
+        sys.exit(f"Không có kịch bản: {', '.join(unknown)} (có: {', '.join(scenarios)})")
+
+    if args.url:
+        transport, base_url, pid = None, args.url, args.pid
+    else:
+        # Import app sau khi chdir → mọi dữ liệu (uploads, cache, memory, audit) nằm trong thư mục tạm
+        from app.main import app
+        transport, base_url, pid = httpx.ASGITransport(app=app), "http://bench", None
+
+    results = {}
+    seeded = False
+    timeout = httpx.Timeout(args.timeout)
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=timeout) as client:
+        for name in names:
+            default_n, factory = scenarios[name]
+            if name.startswith("history") and not seeded:
+                # History cần sẵn dữ liệu: ghi trước --history-seed turn qua /chat/ (không tính giờ)
+                await run_scenario(client, scenarios["chat"][1](), args.history_seed, args.concurrency, warmup=0)
+                seeded = True
+            make_request = factory()
+            n = args.requests or default_n
+            print(f"▶️ {name} ({n} request, concurrency {args.concurrency})", flush=True)
+            result = await run_scenario(client, make_request, n, args.concurrency)
+            # Peak RSS là đỉnh từ đầu process tới cuối kịch bản (tăng dần theo thứ tự chạy);
+            # in-process thì gồm cả dữ liệu tổng hợp phía client
+            result["peak_rss_mb"] = peak_rss_mb(pid)
+            results[name] = result
+
+    if not args.url:
+        from app.utils.executor import shutdown_pools
+        shutdown_pools()
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark / load test các endpoint backend")
+    parser.add_argument("--url", help="server đang chạy (mặc định: in-process qua ASGI)")
+    parser.add_argument("--pid", type=int, help="pid của server (--url) để đọc peak RSS")
+    parser.add_argument("--only", help="danh sách kịch bản, phân cách bằng dấu phẩy")
+    parser.add_argument("--requests", type=int, help="số request mỗi kịch bản (mặc định theo kịch bản)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=200_000, help="số dòng của csv_large_pii")
+    parser.add_argument("--history-seed", type=int, default=1000, help="số turn chat ghi trước kịch bản history")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="sai lệch cho phép so với baseline")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--json", help="ghi kết quả ra file JSON")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    # Đường dẫn file output tính theo thư mục gọi lệnh, trước khi chdir
+    baseline_path = os.path.abspath(args.baseline)
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    with tempfile.TemporaryDirectory() as workdir:
+        if not args.url:
+            sys.path.insert(0, os.getcwd())
+            os.chdir(workdir)
+        results = asyncio.run(main(args))
+
+    print()
+    print_table(results)
+    report = {"machine": machine_info(), "mode": "url" if args.url else "in-process",
+              "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "scenarios": results}
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.save_baseline:
+        # Kịch bản có lỗi (vd. máy chưa cài tesseract) không làm baseline được
+        skipped = [name for name, r in results.items() if r["errors"]]
+        baseline = {**report, "scenarios": {name: r for name, r in results.items() if name not in skipped}}
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, ensure_ascii=False)
+        if skipped:
+            print(f"\n⚠️ Bỏ khỏi baseline vì có lỗi: {', '.join(skipped)}")
+        print(f"\n💾 Đã lưu baseline: {baseline_path}")
+    elif os.path.exists(baseline_path):
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("machine") != report["machine"] or baseline.get("mode") != report["mode"]:
+            print(f"\nℹ️ Baseline đo trên máy / chế độ khác ({baseline.get('machine')}, {baseline.get('mode')})")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\n❌ Regression so với baseline:")
+            for line in regressions:
+                print("  - " + line)
+            sys.exit(1)
+        print(f"\n✅ Không có regression (tolerance {args.tolerance:.0%})")
@@ -0,0 +1,6 @@
+import os
+import tempfile
+
+# Module trong app/ tạo dữ liệu (cache, uploads, memory, audit) theo đường dẫn tương đối
+# → chạy test trong thư mục tạm để không đụng dữ liệu thật của repo
+os.chdir(tempfile.mkdtemp(prefix="ai-chat-tests-"))
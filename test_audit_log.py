@@ -0,0 +1,121 @@
+import gzip
+import json
+import threading
+
+import pytest
+
+from app.utils import audit_log
+from app.utils.audit_log import AuditWriter, make_entry, query_audit
+
+
+def _entry(i, action="mask_text", details=("email",)):
+    return make_entry(action, list(details), ts=1_700_000_000 + i)
+
+
+def _lines(path):
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def writers():
+    created = []
+    yield created
+    for writer in created:
+        writer.close()
+
+
+def test_entries_are_written_in_batches(tmp_path, monkeypatch, writers):
+    monkeypatch.setattr(audit_log, "AUDIT_BATCH_SIZE", 8)
+    writer = AuditWriter(tmp_path / "pii_audit.jsonl")
+    writers.append(writer)
+    batches = []
+    write_batch = writer._write_batch
+    monkeypatch.setattr(writer, "_write_batch", lambda entries: (batches.append(len(entries)),
+                                                                 write_batch(entries)))
+    for i in range(50):
+        writer.write(_entry(i))
+    writer.flush()
+
+    assert sum(batches) == 50 and max(batches) <= 8
+    assert [e["ts"] for e in _lines(writer.path)] == [_entry(i)["ts"] for i in range(50)]
+    assert writer.stats()["written"] == 50
+
+
+def test_full_queue_drops_instead_of_blocking(tmp_path, monkeypatch, writers):
+    writer = AuditWriter(tmp_path / "pii_audit.jsonl", queue_size=2)
+    writers.append(writer)
+    release = threading.Event()
+    write_batch = writer._write_batch
+    monkeypatch.setattr(writer, "_write_batch", lambda entries: (release.wait(5), write_batch(entries)))
+
+    writer.write(_entry(0))
+    while writer._queue.unfinished_tasks and writer._queue.qsize():
+        pass  # chờ thread nền lấy entry đầu rồi kẹt trong _write_batch
+    for i in range(1, 6):
+        writer.write(_entry(i))  # không được chặn
+    assert writer.stats()["dropped"] == 3
+
+    release.set()
+    writer.flush()
+    assert len(_lines(writer.path)) == 3
+
+
+def test_rotation_and_query(tmp_path, monkeypatch, writers):
+    path = tmp_path / "pii_audit.jsonl"
+    writer = AuditWriter(path, max_bytes=1024)
+    writers.append(writer)
+    monkeypatch.setattr(audit_log, "AUDIT_DIR", tmp_path)
+    monkeypatch.setattr(audit_log, "AUDIT_LOG", path)
+    monkeypatch.setattr(audit_log, "audit_writer", writer)
+
+    for i in range(40):
+        writer.write(_entry(i, "mask_csv" if i % 4 == 0 else "mask_text", ["phone"] if i % 5 == 0 else ["email"]))
+    writer.flush()
+
+    rotated = sorted(tmp_path.glob("pii_audit.*.jsonl.gz"))
+    assert rotated and writer.stats()["rotations"] == len(rotated)
+    assert all(audit_log.ROTATED_RE.match(p.name) for p in rotated)
+    assert sum(len(_lines(p)) for p in rotated) + len(_lines(path)) == 40
+
+    all_ts = [e["ts"] for e in query_audit()]
+    assert all_ts == sorted(all_ts) and len(all_ts) == 40
+    assert len(list(query_audit(action="mask_csv"))) == 10
+    assert len(list(query_audit(pii_type="phone"))) == 8
+    since, until = _entry(10)["ts"], _entry(19)["ts"]
+    assert [e["ts"] for e in query_audit(since=since, until=until)] == [_entry(i)["ts"] for i in range(10, 20)]
+    assert len(list(query_audit(limit=5))) == 5
+
+
+def test_legacy_import_runs_on_writer_thread(tmp_path, monkeypatch, writers):
+    path = tmp_path / "pii_audit.jsonl"
+    legacy = tmp_path / "pii_audit.json"
+    legacy.write_text(json.dumps([{"time": "09:30 01/02/24", "action": "mask_text", "details": ["email"]}]))
+    monkeypatch.setattr(audit_log, "AUDIT_LOG", path)
+    monkeypatch.setattr(audit_log, "LEGACY_AUDIT_LOG", legacy)
+    threads = []
+    import_legacy = audit_log._import_legacy
+    monkeypatch.setattr(audit_log, "_import_legacy", lambda *args: (threads.append(threading.current_thread().name),
+                                                                    import_legacy(*args)))
+    writer = AuditWriter(path)
+    writers.append(writer)
+
+    writer.write(_entry(0))
+    assert writer.flush()
+    assert threads == ["audit-writer"]
+    assert [e["action"] for e in _lines(path)] == ["mask_text", "mask_text"]
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_flush_does_not_hang_when_writer_died(tmp_path, monkeypatch, writers):
+    writer = AuditWriter(tmp_path / "pii_audit.jsonl")
+    writers.append(writer)
+
+    def boom(entries):
+        raise OSError("disk gone")
+
+    monkeypatch.setattr(writer, "_write_batch", boom)
+    writer.write(_entry(0))
+    writer._thread.join(5)
+    assert writer.flush(timeout=1) is False
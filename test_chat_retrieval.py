@@ -0,0 +1,39 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.routes import chat
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    seen = []
+
+    def search_text(text, k=3):
+        seen.append(text)
+        return [{"id": "img-1", "caption": "a cat", "score": 0.9}]
+
+    monkeypatch.setattr(chat.retriever, "search_text", search_text)
+    monkeypatch.setattr(chat, "RESPONSE_CACHE_ENABLED", False)
+    return seen
+
+
+def test_chat_skips_retrieval_by_default(calls):
+    with TestClient(app) as client:
+        body = client.post("/chat/", json={"message": "hello"}).json()
+    assert body["similar"] == []
+    assert calls == []
+
+
+def test_chat_retrieval_on_request(calls):
+    with TestClient(app) as client:
+        body = client.post("/chat/", json={"message": "hello", "similar": True}).json()
+    assert body["similar"][0]["id"] == "img-1"
+    assert calls == ["hello"]
+
+
+def test_stream_chat_skips_retrieval_by_default(calls):
+    with TestClient(app) as client:
+        text = client.post("/chat/", json={"message": "hello", "stream": True}).text
+    assert '"similar": []' in text
+    assert calls == []
@@ -0,0 +1,93 @@
+import pytest
+
+from app.utils import conversation
+from app.utils.conversation import SummaryStore, build_context, estimate_tokens
+from app.utils.memory_store import SegmentLogStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = SegmentLogStore(tmp_path / "memory")
+    summaries = SummaryStore(tmp_path / "summaries.jsonl")
+    monkeypatch.setattr(conversation, "get_store", lambda: store)
+    monkeypatch.setattr(conversation, "get_summaries", lambda: summaries)
+    yield store
+    store.close()
+
+
+def _turns(store, n, session="s", size=40, start=0):
+    for i in range(start, start + n):
+        store.append(f"q{i} " + "x" * size, f"a{i} " + "y" * size, session_id=session)
+
+
+def _history(messages):
+    return [m["content"].split()[0] for m in messages if m["role"] != "system"]
+
+
+def test_window_takes_newest_turns_within_budget(store, monkeypatch):
+    monkeypatch.setattr(conversation, "SUMMARY_MAX_TOKENS", 0)
+    _turns(store, 10)
+    _turns(store, 3, session="other")
+    turn_cost = 2 * estimate_tokens("q0 " + "x" * 40)
+    budget = estimate_tokens("hi") + 3 * turn_cost
+    messages = build_context("s", "hi", budget=budget, max_turns=20)
+    assert _history(messages)[-6:] == ["q7", "a7", "q8", "a8", "q9", "a9"]
+    assert len(_history(messages)) == 6
+
+
+def test_max_turns_caps_window(store):
+    _turns(store, 10)
+    assert _history(build_context("s", "hi", budget=100_000, max_turns=2)) == ["q8", "a8", "q9", "a9"]
+
+
+def test_dropped_turns_go_into_summary_once(store, monkeypatch):
+    _turns(store, 6)
+    first = build_context("s", "hi", budget=100_000, max_turns=2)
+    assert first[0]["role"] == "system"
+    assert [line.split()[2] for line in first[0]["content"].splitlines()[1:]] == ["q0", "q1", "q2", "q3"]
+
+    read = []
+    session_range = store.session_range
+
+    def counting_range(*args, **kwargs):
+        records = session_range(*args, **kwargs)
+        read.extend(records)
+        return records
+
+    monkeypatch.setattr(store, "session_range", counting_range)
+    second = build_context("s", "hi", budget=100_000, max_turns=2)
+    assert second == first
+    # Tóm tắt được dùng lại: chỉ đọc các turn sau watermark → không đọc lại turn nào
+    assert read == [] and conversation.get_summaries().get("s")["upto"] == 4
+
+    _turns(store, 1, start=6)
+    third = build_context("s", "hi", budget=100_000, max_turns=2)
+    assert third[0]["content"].splitlines()[-1].split()[2] == "q4"
+    assert _history(third) == ["q5", "a5", "q6", "a6"]
+
+
+def test_first_call_on_long_session_reads_bounded_history(store, monkeypatch):
+    monkeypatch.setattr(conversation, "SUMMARY_CATCHUP_TURNS", 5)
+    _turns(store, 300)
+    read = []
+    session_range = store.session_range
+
+    def counting_range(*args, **kwargs):
+        records = session_range(*args, **kwargs)
+        read.extend(records)
+        return records
+
+    monkeypatch.setattr(store, "session_range", counting_range)
+    messages = build_context("s", "hi", budget=100_000, max_turns=3)
+    assert len(read) == 5
+    assert [line.split()[2] for line in messages[0]["content"].splitlines()[1:]] == \
+        ["q292", "q293", "q294", "q295", "q296"]
+    assert conversation.get_summaries().get("s")["upto"] == 297
+
+
+def test_summary_survives_reload(tmp_path):
+    summaries = SummaryStore(tmp_path / "summaries.jsonl")
+    summaries.advance("s", [{"id": 1, "user": "hello", "bot": "hi"}])
+    summaries.advance("s", [{"id": 2, "user": "again", "bot": "sure"}])
+    reloaded = SummaryStore(tmp_path / "summaries.jsonl").get("s")
+    assert reloaded["upto"] == 2 and len(reloaded["lines"]) == 2
@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from app.utils import csv_loader
+from app.utils.csv_loader import SchemaCache, load_csv, schema_key
+
+CLEAN = b"id,city,val\n1,HN,1.5\n2,SG,2.5\n3,HN,4.0\n"
+DIRTY = b"id,city,val\n1,HN,1.5\n2,SG,abc\n3,HN,4.0\n"
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    cache = SchemaCache(path=tmp_path / "schemas.json")
+    monkeypatch.setattr(csv_loader, "schema_cache", cache)
+    return cache
+
+
+def _is_numeric(series):
+    return series.dtype.kind in "fi"
+
+
+def test_dirty_file_does_not_poison_shared_header(cache):
+    assert _is_numeric(load_csv(CLEAN)["val"])
+    assert not _is_numeric(load_csv(DIRTY)["val"])
+    assert _is_numeric(load_csv(CLEAN)["val"])
+    assert cache.get(schema_key(content=CLEAN))["val"].startswith("double")
+
+
+def test_dirty_file_first_does_not_pin_string(cache):
+    assert not _is_numeric(load_csv(DIRTY)["val"])
+    assert "val" not in cache.get(schema_key(content=DIRTY))
+    assert _is_numeric(load_csv(CLEAN)["val"])
+
+
+def test_cached_schema_is_used_and_categories_still_applied(cache):
+    content = CLEAN + b"4,SG,5.0\n5,HN,6.5\n"
+    load_csv(content)
+    hits = cache.stats()["hits"]
+    df = load_csv(content)
+    assert cache.stats()["hits"] == hits + 1
+    assert str(df["city"].dtype) == "category"
+    assert list(df["val"]) == [1.5, 2.5, 4.0, 5.0, 6.5]
+
+
+def test_url_source_relearns_after_format_change(cache):
+    url = "https://example.com/data.csv"
+    load_csv(CLEAN, url=url)
+    load_csv(DIRTY, url=url)
+    assert "val" not in cache.get(schema_key(url=url))
+
+
+def test_legacy_cache_entries_drop_string_pins(tmp_path):
+    path = tmp_path / "old.json"
+    key = schema_key(content=CLEAN)
+    path.write_text(json.dumps({key: {"id": "int64[pyarrow]", "val": "string[pyarrow]", "city": "category"}}))
+    assert SchemaCache(path=path).get(key) == {"id": "int64[pyarrow]"}
+
+
+def test_fallback_read_keeps_values_and_shared_schema(cache):
+    ints = b"id,city,val\n1,HN,1\n2,SG,2\n"
+    floats = b"id,city,val\n1,HN,1.5\n2,SG,2\n"
+    load_csv(ints)
+    pinned = cache.get(schema_key(content=ints))
+    assert pinned["val"].startswith("int64")
+    # val bị ghim int64 → đọc với schema cache lỗi → suy luận lại cho riêng file này
+    assert list(load_csv(floats)["val"]) == [1.5, 2.0]
+    assert list(load_csv(DIRTY, usecols=["val"])["val"]) == ["1.5", "abc", "4.0"]
+    assert cache.get(schema_key(content=ints)) == pinned
@@ -0,0 +1,56 @@
+import io
+
+import pandas as pd
+
+from app.utils import csv_utils
+from app.utils.csv_profile import DatasetProfile, ProfileMemo, profile_memo
+
+
+def test_memo_is_lru_and_counts_lookups():
+    memo = ProfileMemo(max_entries=2)
+    memo.put("a", "A")
+    memo.put("b", "B")
+    assert memo.get("a") == "A"  # a mới dùng → b bị evict trước
+    memo.put("c", "C")
+    assert memo.get("b") is None
+    assert memo.get("a") == "A" and memo.get("c") == "C"
+    assert memo.stats() == {"hits": 3, "misses": 1, "hit_rate": 0.75, "entries": 2}
+
+
+def test_profile_fields_are_computed_once():
+    df = pd.DataFrame({"x": [1.0, 2.0, None], "y": ["a", "b", "b"]})
+    profile = DatasetProfile("k", df)
+    assert profile.missing is profile.missing
+    assert profile.missing.to_dict() == {"x": 1, "y": 0}
+    assert profile.numeric_cols == ["x"]
+
+
+def test_describe_numeric_reuses_describe_all():
+    df = pd.DataFrame({"x": [1, 2, 3, 4], "z": [0.5, 1.5, 2.5, None], "y": list("abcd")})
+    direct = DatasetProfile("k", df).describe_numeric
+    profile = DatasetProfile("k", df)
+    assert "x" in profile.describe_all.columns
+    pd.testing.assert_frame_equal(profile.describe_numeric, direct, check_dtype=False)
+
+
+def test_second_question_on_same_csv_uses_memo(monkeypatch):
+    csv = b"id,score\n1,10\n2,\n3,30\n4,40\n"
+
+    def ask(q):
+        return csv_utils._process_csv_sync(io.BytesIO(csv), len(csv), None, q, False)
+
+    ask("summary")
+    key = csv_utils.content_key(csv)
+    profile = profile_memo.get(key)
+    assert profile is not None
+
+    def fail(*args, **kwargs):
+        raise AssertionError("không được parse lại CSV")
+
+    monkeypatch.setattr(csv_utils, "load_csv", fail)
+    monkeypatch.setattr(csv_utils.dataset_cache, "get", fail)
+    hits = profile_memo.hits
+    assert "score" in ask("how many missing values")
+    assert profile_memo.hits == hits + 1
+    assert profile_memo.get(key) is profile
+    assert profile.missing["score"] == 1
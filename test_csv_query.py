@@ -0,0 +1,154 @@
+import io
+import numpy as np
+import pandas as pd
+import pytest
+from app.utils import csv_utils
+from app.utils.csv_query import plan_query, run_query, run_query_chunks
+from app.utils.csv_utils import _process_csv_sync
+
+CSV = (b"id,city,email,status,is_active,price\n"
+       b"1,Hanoi,a@example.com,active,true,10\n"
+       b"2,Saigon,,closed,false,20\n"
+       b"3,Hanoi,c@example.com,active,,30\n")
+COLUMNS = ["id", "city", "email", "status", "is_active", "price"]
+
+
+def ask(q, csv=CSV, stream=False):
+    return _process_csv_sync(io.BytesIO(csv), len(csv), None, q.lower(), stream)
+
+
+# ====================================================
+# 🧭 Từ khoá missing / summary / số cột thắng query planner
+# ====================================================
+@pytest.mark.parametrize("q", [
+    "how many missing values are there?",
+    "count missing values",
+    "how many na in email",
+    "number of missing values per column",
+])
+def test_missing_questions_are_not_counts(q):
+    assert ask(q).startswith("🔍 Missing value summary")
+
+
+def test_most_missing():
+    assert "'email'" in ask("which column has the most missing values")
+
+
+def test_column_count_is_shape():
+    assert ask("how many columns does it have") == "Dataset có 3 hàng và 6 cột."
+
+
+@pytest.mark.parametrize("q", ["summary by city", "tóm tắt dataset theo city"])
+def test_summary_wins_over_groupby(q):
+    assert ask(q) == ask("summary")
+    assert "count by" not in ask(q)
+
+
+def test_bare_is_is_not_a_filter():
+    plan = plan_query("show the status is active rows", COLUMNS)
+    assert plan is None or not plan["filters"]
+
+
+def test_name_is_not_missing_keyword():
+    # "na" chỉ khớp nguyên từ (không khớp "name", "Da Nang")
+    assert ask("average price by city").startswith("📊 mean by 'city'")
+
+
+# ====================================================
+# 🔢 count cần cột hoặc filter cụ thể
+# ====================================================
+@pytest.mark.parametrize("q", ["how many rows", "count", "how many rows are there"])
+def test_bare_count_has_no_plan(q):
+    assert plan_query(q, COLUMNS) is None
+    assert ask(q) == "Dataset có 3 hàng và 6 cột."
+
+
+def test_count_with_filter():
+    plan = plan_query("how many rows where city = hanoi", COLUMNS)
+    assert plan["op"] == "groupby" and plan["agg"] == "count"
+    assert plan["filters"] == [{"column": "city", "op": "==", "value": "hanoi"}]
+    assert ask("how many rows where city = hanoi") == "🔢 Count (where city == 'hanoi'): 2"
+
+
+def test_count_of_column_is_non_null_count():
+    assert ask("count email").splitlines()[1].split() == ["email", "2"]
+
+
+# ====================================================
+# 🌊 Streaming (theo chunk) cho cùng câu trả lời với in-memory
+# ====================================================
+def _dataset(n=500):
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame({
+        "id": np.arange(n),
+        "city": rng.choice(["Hanoi", "Saigon", "Hue", "Da Nang"], n),
+        "price": rng.normal(100, 20, n).round(2),
+        "qty": rng.integers(1, 50, n).astype(float),
+    })
+    df.loc[df.index % 7 == 0, "qty"] = np.nan
+    return df.to_csv(index=False).encode()
+
+
+@pytest.mark.parametrize("q", [
+    "how many rows", "count", "count qty", "how many rows where city = hanoi",
+    "average price", "sum of qty", "max price", "min qty where city = hue", "median price",
+    "average price by city", "sum qty by city where price > 100", "max price by city", "count by city",
+    "median qty by city", "correlation between price and qty",
+])
+def test_stream_matches_in_memory(q, monkeypatch):
+    monkeypatch.setattr(csv_utils, "CSV_CHUNK_ROWS", 64)
+    data = _dataset()
+    assert ask(q, data, stream=True) == ask(q, data, stream=False)
+
+
+@pytest.mark.parametrize("q", ["price > 120", "top 5 price", "bottom 3 qty where city = hanoi"])
+def test_stream_rows_match_in_memory(q, monkeypatch):
+    monkeypatch.setattr(csv_utils, "CSV_CHUNK_ROWS", 64)
+    data = _dataset()
+
+    def summary(answer):
+        # Dòng tiêu đề + index (số dòng trong file) của các dòng được in ra
+        lines = answer.splitlines()
+        return lines[0], [line.split()[0] for line in lines[2:]]
+
+    assert summary(ask(q, data, stream=True)) == summary(ask(q, data, stream=False))
+
+
+def test_stream_count_without_columns_is_row_count():
+    assert ask("how many rows", stream=True) == "Dataset có 3 hàng và 6 cột."
+    assert ask("count", stream=True) == "Dataset có 3 hàng và 6 cột."
+
+
+def test_plain_count_uses_cached_profile():
+    ask("summary", stream=True)  # profile streaming được memo
+    assert ask("count email", stream=True) == ask("count email", stream=False)
+
+
+def test_run_query_chunks_reads_lazily():
+    plan = plan_query("average price by city", ["city", "price"])
+    seen = []
+
+    def chunks():
+        for i in range(3):
+            seen.append(i)
+            yield pd.DataFrame({"city": ["a", "b"], "price": [float(i), 1.0]}, index=[2 * i, 2 * i + 1])
+
+    answer = run_query_chunks(plan, chunks())
+    assert seen == [0, 1, 2]
+    assert answer == run_query(plan, pd.concat(chunks()))
+
+
+# ====================================================
+# 📊 Histogram: bin xấp xỉ (stream) và bin chính xác không dùng chung id
+# ====================================================
+@pytest.mark.parametrize("q", ["histogram of price", "histogram of price where city = hanoi"])
+def test_stream_and_exact_charts_have_separate_ids(q, monkeypatch):
+    monkeypatch.setattr(csv_utils, "CSV_CHUNK_ROWS", 64)
+    data = _dataset()
+    exact = ask(q, data)["chart"]
+    approx = ask(q, data, stream=True)["chart"]
+    assert (exact["source"], approx["source"]) == ("exact", "stream")
+    assert exact["id"] != approx["id"]
+    assert sum(exact["counts"]) == sum(approx["counts"])
+    # Hỏi lại ở chế độ thường vẫn ra đúng bin chính xác ban đầu
+    assert ask(q, data)["chart"] == exact
@@ -0,0 +1,73 @@
+import io
+import numpy as np
+import pandas as pd
+from app.utils import csv_stream
+from app.utils.csv_stream import QuantileSketch, RunningStats, StreamingHistogram, profile_csv_stream
+from app.utils.csv_utils import _answer_profile
+
+rng = np.random.default_rng(0)
+
+
+def _csv(df):
+    return io.BytesIO(df.to_csv(index=False).encode())
+
+
+# ====================================================
+# 🧮 Streaming stats so với kết quả chính xác của pandas
+# ====================================================
+def test_small_file_matches_pandas_describe():
+    df = pd.DataFrame({"a": [10.0, 20.0, 30.0], "b": [1, 2, 4], "city": ["Hanoi", "Hue", None]})
+    profile = profile_csv_stream(_csv(df))
+    assert not profile.approximate
+    pd.testing.assert_frame_equal(profile.describe_numeric(), df.describe(), check_exact=False)
+    assert profile.describe_numeric().loc["25%", "a"] == 15.0
+    assert profile.missing()["city"] == 1
+    assert profile.shape == (3, 3)
+
+
+def test_chunked_file_matches_pandas_within_one_chunk_limit():
+    df = pd.DataFrame({"x": rng.normal(50, 10, 5000).round(3), "y": rng.integers(0, 100, 5000)})
+    profile = profile_csv_stream(_csv(df), chunksize=700)
+    assert not profile.approximate
+    pd.testing.assert_frame_equal(profile.describe_numeric(), df.describe(), check_exact=False)
+
+
+def test_large_file_is_approximate_and_labelled(monkeypatch):
+    monkeypatch.setattr(csv_stream, "CSV_EXACT_QUANTILE_ROWS", 1000)
+    df = pd.DataFrame({"x": rng.normal(50, 10, 5000)})
+    profile = profile_csv_stream(_csv(df), chunksize=1000)
+    assert profile.approximate
+    exact = df["x"].quantile([0.25, 0.5, 0.75]).to_numpy()
+    approx = profile.describe_numeric().loc[["25%", "50%", "75%"], "x"].to_numpy()
+    assert np.allclose(approx, exact, atol=0.5)
+    assert "approx. quantiles" in _answer_profile(profile, "summary")
+    assert "approx. quantiles" in _answer_profile(profile, "basic stats")
+
+
+def test_quantile_sketch_switches_to_histogram_over_limit():
+    sketch = QuantileSketch(exact_limit=100)
+    sketch.update(np.arange(60, dtype=float))
+    assert sketch.exact and sketch.quantile(0.5, 0, 59) == 29.5
+    sketch.update(np.arange(60, 120, dtype=float))
+    assert not sketch.exact
+    assert abs(sketch.quantile(0.5, 0, 119) - 59.5) < 1
+
+
+def test_running_stats_merge_matches_numpy():
+    values = rng.normal(size=1000)
+    left, right = RunningStats(), RunningStats()
+    left.update(values[:300])
+    right.update(values[300:])
+    left.merge(right)
+    assert left.count == 1000
+    assert np.isclose(left.mean, values.mean()) and np.isclose(left.std, values.std(ddof=1))
+    assert (left.min, left.max) == (values.min(), values.max())
+
+
+def test_streaming_histogram_keeps_every_value():
+    hist = StreamingHistogram(bins=16)
+    hist.update(np.array([0.0, 1.0]))
+    hist.update(np.array([-100.0, 500.0]))  # ngoài khoảng → bin giãn ra
+    counts, edges = hist.to_bins(target=4)
+    assert counts.sum() == 4
+    assert edges[0] <= -100 and edges[-1] >= 500
@@ -0,0 +1,43 @@
+import threading
+
+import pandas as pd
+
+from app.utils.dataset_cache import DatasetCache
+
+
+def test_concurrent_put_same_key(tmp_path):
+    cache = DatasetCache(tmp_path / "datasets")
+    frames = [pd.DataFrame({"a": range(i * 1000, i * 1000 + 5000), "b": [f"v{i}"] * 5000}) for i in range(8)]
+    barrier = threading.Barrier(len(frames))
+    errors = []
+
+    def put(df):
+        barrier.wait()
+        try:
+            cache.put("k", df)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=put, args=(df,)) for df in frames]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    result = cache.get("k")
+    # File cuối cùng là 1 trong các DataFrame đã ghi, nguyên vẹn
+    assert any(result.equals(df) for df in frames)
+    assert not list((tmp_path / "datasets").glob("*.tmp"))
+    assert len(list((tmp_path / "datasets").iterdir())) == 1
+
+
+def test_put_get_roundtrip_and_reload(tmp_path):
+    cache = DatasetCache(tmp_path / "datasets")
+    df = pd.DataFrame({"a": [1, 2, 3], "b": ["x", "y", "z"]})
+    cache.put("k", df)
+    assert cache.get("k", columns=["b"]).equals(df[["b"]])
+    reloaded = DatasetCache(tmp_path / "datasets")
+    assert reloaded.get("k").equals(df)
+    assert reloaded.get("missing") is None
+    assert reloaded.stats()["hits"] == 1
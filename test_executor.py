@@ -0,0 +1,138 @@
+import time
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import pytest
+
+from app.utils.executor import WorkerPool, Overloaded, cpu_pool
+
+
+def _square(x):
+    return x * x
+
+
+def test_map_keeps_order_and_counts_jobs():
+    pool = WorkerPool("test", ThreadPoolExecutor, 2, 3)
+    try:
+        assert pool.map(_square, range(10)) == [x * x for x in range(10)]
+        assert pool.map(pow, [2, 3], [3, 2]) == [8, 9]
+        stats = pool.stats()
+        assert stats["completed"] == 12
+        assert stats["in_flight"] == 0
+    finally:
+        pool.shutdown()
+
+
+def test_map_rejects_when_pool_is_full():
+    pool = WorkerPool("test", ThreadPoolExecutor, 1, 1, timeout=0.05)
+    release = threading.Event()
+    try:
+        blocker = threading.Thread(target=pool.map, args=(lambda _: release.wait(5), [0]))
+        blocker.start()
+        while pool.stats()["in_flight"] == 0:
+            pass
+        with pytest.raises(Overloaded):
+            pool.map(_square, [1])
+        release.set()
+        blocker.join()
+        assert pool.stats()["rejected"] == 1
+        assert pool.map(_square, [3]) == [9]
+        assert pool.stats()["in_flight"] == 0
+    finally:
+        release.set()
+        pool.shutdown()
+
+
+def test_map_larger_than_max_pending_runs_in_window():
+    pool = WorkerPool("test", ThreadPoolExecutor, 4, 2)
+    running = peak = 0
+    lock = threading.Lock()
+
+    def job(x):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.01)
+        with lock:
+            running -= 1
+        return x
+
+    try:
+        assert pool.map(job, range(10)) == list(range(10))
+        assert peak <= 2
+        assert pool.stats()["completed"] == 10
+    finally:
+        pool.shutdown()
+
+
+def test_concurrent_batches_do_not_starve_each_other():
+    pool = WorkerPool("test", ThreadPoolExecutor, 4, 4, timeout=5)
+    results, errors = [], []
+
+    def batch():
+        try:
+            results.append(pool.map(lambda x: time.sleep(0.02) or x, range(8)))
+        except Exception as e:
+            errors.append(e)
+
+    try:
+        threads = [threading.Thread(target=batch) for _ in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert errors == [] and results == [list(range(8))] * 3
+        assert pool.stats()["rejected"] == 0
+    finally:
+        pool.shutdown()
+
+
+def test_map_error_releases_slots():
+    pool = WorkerPool("test", ThreadPoolExecutor, 2, 2, timeout=0.2)
+
+    def job(x):
+        if x == 3:
+            raise ValueError("bad row")
+        return x
+
+    try:
+        with pytest.raises(ValueError):
+            pool.map(job, range(6))
+        assert pool.stats()["in_flight"] == 0
+        assert pool.map(job, [1, 2]) == [1, 2]
+    finally:
+        pool.shutdown()
+
+
+def test_run_rejects_when_queue_is_full():
+    pool = WorkerPool("test", ThreadPoolExecutor, 1, 1, timeout=0.05)
+    release = threading.Event()
+
+    async def scenario():
+        blocker = asyncio.create_task(pool.run(release.wait, 5))
+        await asyncio.sleep(0.01)
+        with pytest.raises(Overloaded):
+            await pool.run(_square, 2)
+        release.set()
+        await blocker
+        return await pool.run(_square, 3)
+
+    try:
+        assert asyncio.run(scenario()) == 9
+        stats = pool.stats()
+        assert stats["rejected"] == 1 and stats["completed"] == 2 and stats["in_flight"] == 0
+    finally:
+        release.set()
+        pool.shutdown()
+
+
+def test_cpu_pool_uses_spawn():
+    assert cpu_pool.executor_kwargs["mp_context"].get_start_method() == "spawn"
+    pool = WorkerPool("test", ProcessPoolExecutor, 1, 2, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        assert pool.map(_square, [2, 3]) == [4, 9]
+    finally:
+        pool.shutdown()
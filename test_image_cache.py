@@ -0,0 +1,101 @@
+import os
+import json
+
+import numpy as np
+import pytest
+
+from app.utils import image_cache as image_cache_module
+from app.utils.image_cache import ImageCache
+from app.utils.image_masking import masked_path_for
+from app.utils.ocr import cv2
+
+
+def _cache(tmp_path, max_bytes=10_000):
+    return ImageCache(tmp_path / "uploads", tmp_path / "index.json", max_bytes=max_bytes)
+
+
+def _add(cache, tmp_path, sha, size=100):
+    paths = []
+    for suffix in ("", "_masked"):
+        path = tmp_path / f"{sha}{suffix}.png"
+        path.write_bytes(b"\0" * size)
+        paths.append(str(path))
+    cache.add(sha, paths[0], paths[1], ["email"], {"dhash": 1, "shape": (4, 4)})
+
+
+def test_hits_do_not_rewrite_index_each_time(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_cache_module, "IMAGE_INDEX_SAVE_INTERVAL", 3600)
+    cache = _cache(tmp_path)
+    _add(cache, tmp_path, "a" * 64)
+    assert cache.stats()["index_writes"] == 1
+
+    for _ in range(100):
+        assert cache.get("a" * 64)["detected"] == ["email"]
+    assert cache.stats()["index_writes"] == 1
+
+    last_used = cache.get("a" * 64)["last_used"]
+    cache.flush()
+    assert cache.stats()["index_writes"] == 2
+    assert json.loads((tmp_path / "index.json").read_text())["a" * 64]["last_used"] == last_used
+    cache.flush()
+    assert cache.stats()["index_writes"] == 2
+
+
+def test_hits_are_saved_after_interval(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_cache_module, "IMAGE_INDEX_SAVE_INTERVAL", 0)
+    cache = _cache(tmp_path)
+    _add(cache, tmp_path, "b" * 64)
+    cache.get("b" * 64)
+    assert cache.stats()["index_writes"] == 2
+
+
+def test_lru_eviction_uses_touched_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_cache_module, "IMAGE_INDEX_SAVE_INTERVAL", 3600)
+    cache = _cache(tmp_path, max_bytes=450)
+    _add(cache, tmp_path, "a" * 64)
+    _add(cache, tmp_path, "b" * 64)
+    cache.get("a" * 64)
+    _add(cache, tmp_path, "c" * 64)
+    assert cache.get("b" * 64) is None
+    assert cache.get("a" * 64) is not None
+
+    reloaded = _cache(tmp_path, max_bytes=450)
+    assert sorted(reloaded._entries) == ["a" * 64, "c" * 64]
+
+
+@pytest.mark.parametrize("name", ["a.jpg", "a.jpeg", "a.PNG", "a.webp", "dir.jpg/a.jpeg"])
+def test_masked_path_never_overwrites_original(name):
+    masked = masked_path_for(name)
+    assert masked != name
+    assert os.path.splitext(masked)[1] == os.path.splitext(name)[1]
+    assert masked.endswith("_masked" + os.path.splitext(name)[1])
+
+
+def test_load_drops_entries_whose_mask_overwrote_original(tmp_path):
+    cache = _cache(tmp_path)
+    _add(cache, tmp_path, "a" * 64)
+    path = str(tmp_path / "b.webp")
+    open(path, "wb").write(b"\0" * 10)
+    cache.add("b" * 64, path, path, [], {"dhash": 1, "shape": (4, 4)})
+    assert sorted(_cache(tmp_path)._entries) == ["a" * 64]
+
+
+def test_find_similar_skips_entry_evicted_concurrently(tmp_path, monkeypatch):
+    cache = _cache(tmp_path)
+    img = np.tile(np.arange(64, dtype=np.uint8) * 4, (64, 1))
+    path = str(tmp_path / "img.png")
+    cv2.imwrite(path, img)
+    masked = str(tmp_path / "img_masked.png")
+    cv2.imwrite(masked, img)
+    _, signature = cache.find_similar(path)
+    cache.add("c" * 64, path, masked, [], signature)
+
+    def evicted_meanwhile(gray, other_path):
+        with cache._lock:
+            cache._entries.pop("c" * 64, None)
+        return True
+
+    monkeypatch.setattr(cache, "_same_pixels", evicted_meanwhile)
+    entry, _ = cache.find_similar(path)
+    assert entry is None
+    assert cache.stats()["misses"] == 2
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from app.utils.image_masking import fill_boxes, find_pii_boxes, group_lines
+
+
+def _words(*lines):
+    """
+    Dựng dict kiểu pytesseract.image_to_data: mỗi dòng là list từ, từ rộng 10px, cách nhau 5px.
+    """
+    words = {k: [] for k in ("text", "block_num", "par_num", "line_num", "word_num",
+                             "left", "top", "width", "height")}
+    for line_num, texts in enumerate(lines, 1):
+        for word_num, text in enumerate(texts, 1):
+            words["text"].append(text)
+            words["block_num"].append(1)
+            words["par_num"].append(1)
+            words["line_num"].append(line_num)
+            words["word_num"].append(word_num)
+            words["left"].append((word_num - 1) * 15)
+            words["top"].append(line_num * 20)
+            words["width"].append(10)
+            words["height"].append(12)
+    return words
+
+
+def test_group_lines_skips_blank_and_keeps_reading_order():
+    words = _words(["a", "", "b"], ["c"])
+    words["word_num"][0], words["word_num"][2] = 3, 1
+    assert group_lines(words) == [[2, 0], [3]]
+
+
+def test_name_across_two_words_and_split_phone():
+    words = _words(["hello", "Mary", "Jane"], ["call", "090-123", "-4567", "now"])
+    boxes, detected = find_pii_boxes(words)
+    assert sorted(detected) == ["name", "phone"]
+    assert boxes.tolist() == [
+        [15, 20, 25, 32], [30, 20, 40, 32],  # Mary, Jane
+        [15, 40, 25, 52], [30, 40, 40, 52],  # 090-123, -4567
+    ]
+
+
+def test_no_pii_gives_empty_box_array():
+    boxes, detected = find_pii_boxes(_words(["nothing", "here"]))
+    assert boxes.shape == (0, 4) and detected == []
+
+
+def _fill_reference(img, boxes, color=0):
+    h, w = img.shape[:2]
+    for x0, y0, x1, y1 in boxes:
+        x0, x1 = np.clip([x0, x1], 0, w)
+        y0, y1 = np.clip([y0, y1], 0, h)
+        img[y0:y1, x0:x1] = color
+    return img
+
+
+@pytest.mark.parametrize("channels", [None, 3])
+def test_fill_boxes_matches_per_box_fill(channels):
+    rng = np.random.default_rng(0)
+    shape = (60, 80) if channels is None else (60, 80, channels)
+    img = rng.integers(1, 255, shape, dtype=np.uint8)
+    x0 = rng.integers(-10, 80, 40)
+    y0 = rng.integers(-10, 60, 40)
+    boxes = np.stack([x0, y0, x0 + rng.integers(0, 25, 40), y0 + rng.integers(0, 25, 40)], axis=1)
+    expected = _fill_reference(img.copy(), boxes)
+    result = fill_boxes(img, boxes)
+    assert result is img
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_fill_boxes_ignores_empty_and_outside_boxes():
+    img = np.full((10, 10), 7, dtype=np.uint8)
+    fill_boxes(img, np.empty((0, 4), dtype=np.int64))
+    fill_boxes(img, np.array([[20, 20, 30, 30], [3, 3, 3, 8]]))
+    assert (img == 7).all()
+    fill_boxes(img, np.array([[-5, -5, 2, 2]]), color=1)
+    assert img[:2, :2].tolist() == [[1, 1], [1, 1]] and img.sum() == 7 * 96 + 4
@@ -0,0 +1,40 @@
+import os
+import sys
+import json
+import tempfile
+import subprocess
+
+# ⏱️ Ngân sách thời gian import app.main (cold start / worker restart)
+IMPORT_BUDGET_SECONDS = float(os.getenv("IMPORT_BUDGET_SECONDS", 1.5))
+HEAVY_MODULES = ["cv2", "pytesseract", "matplotlib", "torch", "sentence_transformers"]
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PROBE = f"""
+import sys, time, json
+start = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def measure_import():
+    # Chạy trong process mới + thư mục tạm (import app tạo app/data/... theo cwd)
+    with tempfile.TemporaryDirectory() as cwd:
+        env = {**os.environ, "PYTHONPATH": ROOT}
+        out = subprocess.run([sys.executable, "-c", PROBE], cwd=cwd, env=env,
+                             capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def test_import_time():
+    # Lấy lần nhanh nhất trong 3 lần để bớt nhiễu từ disk cache
+    results = [measure_import() for _ in range(3)]
+    best = min(r["seconds"] for r in results)
+    assert best < IMPORT_BUDGET_SECONDS, f"import app.main mất {best:.2f}s (budget {IMPORT_BUDGET_SECONDS}s)"
+    assert results[0]["loaded"] == [], f"Module nặng bị import lúc khởi động: {results[0]['loaded']}"
+
+
+if __name__ == "__main__":
+    result = measure_import()
+    print(f"import app.main: {result['seconds']:.3f}s | module nặng đã load: {result['loaded']}")
@@ -0,0 +1,84 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.utils import llm_client
+from app.utils.llm_client import OpenAICompatibleLLM, LLMError
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_BACKOFF_BASE", 0)
+
+
+def _run(llm, bodies, action):
+    """
+    Mỗi request nhận lần lượt 1 body trong bodies (bytes); trả (kết quả | exception, số request).
+    """
+    calls = []
+
+    def handler(request):
+        body = bodies[min(len(calls), len(bodies) - 1)]
+        calls.append(request)
+        return httpx.Response(200, content=body)
+
+    async def main():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://llm/v1")
+        llm._clients[asyncio.get_running_loop()] = (client, asyncio.Semaphore(4))
+        try:
+            return await action()
+        except LLMError as e:
+            return e
+        finally:
+            await llm.aclose()
+
+    return asyncio.run(main()), len(calls)
+
+
+def _completion(content):
+    return json.dumps({"choices": [{"message": {"role": "assistant", "content": content}}]}).encode()
+
+
+@pytest.mark.parametrize("body", [b"<html>bad gateway</html>", b'{"error": "overloaded"}',
+                                  b'{"choices": []}', b'{"choices": [{"message": null}]}'])
+def test_complete_retries_malformed_response(body):
+    llm = OpenAICompatibleLLM(max_retries=2)
+    result, calls = _run(llm, [body, _completion("ok")], lambda: llm.complete("hi"))
+    assert result == "ok"
+    assert calls == 2
+
+
+def test_complete_raises_llm_error_when_always_malformed():
+    llm = OpenAICompatibleLLM(max_retries=2)
+    result, calls = _run(llm, [b"not json"], lambda: llm.complete("hi"))
+    assert isinstance(result, LLMError)
+    assert calls == 3
+
+
+def _sse(*chunks):
+    return "".join(f"data: {chunk}\n\n" for chunk in chunks).encode()
+
+
+def _collect(llm):
+    async def action():
+        return [token async for token in llm.stream("hi")]
+    return action
+
+
+def test_stream_retries_malformed_chunk_before_first_token():
+    llm = OpenAICompatibleLLM(max_retries=1)
+    good = _sse(json.dumps({"choices": [{"delta": {"content": "a"}}]}),
+                json.dumps({"choices": [{"delta": {"content": "b"}}]}), "[DONE]")
+    result, calls = _run(llm, [_sse("{oops"), good], _collect(llm))
+    assert result == ["a", "b"]
+    assert calls == 2
+
+
+def test_stream_malformed_chunk_after_tokens_is_llm_error():
+    llm = OpenAICompatibleLLM(max_retries=3)
+    body = _sse(json.dumps({"choices": [{"delta": {"content": "a"}}]}), '{"choices": "x"}')
+    result, calls = _run(llm, [body], _collect(llm))
+    assert isinstance(result, LLMError)
+    assert calls == 1
@@ -0,0 +1,144 @@
+import json
+import threading
+
+import pytest
+
+from app.utils.memory_store import MemoryStore, SegmentLogStore, SqliteMemoryStore, migrate_legacy_json
+
+
+@pytest.fixture(params=["segment", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "segment":
+        store = SegmentLogStore(tmp_path / "memory", segment_max_bytes=256)
+    else:
+        store = SqliteMemoryStore(tmp_path / "memory.sqlite3")
+    yield store
+    store.close()
+
+
+def _fill(store, n, session_every=None):
+    for i in range(n):
+        session = f"s{i % session_every}" if session_every else None
+        store.append(f"q{i}", f"a{i}", ts=1000.0 + i, session_id=session)
+
+
+def test_cursor_pagination_covers_every_record_once(store):
+    _fill(store, 23)
+    seen, cursor = [], None
+    while True:
+        records, cursor = store.query(cursor=cursor, limit=5)
+        seen += [r["user"] for r in records]
+        if cursor is None:
+            break
+    assert seen == [f"q{i}" for i in range(23)]
+    assert [r["id"] for r in store.query(limit=3)[0]] == [1, 2, 3]
+
+
+def test_time_range_and_sessions(store):
+    _fill(store, 12, session_every=3)
+    records, _ = store.query(since=1004.0, until=1006.0)
+    assert [r["user"] for r in records] == ["q4", "q5", "q6"]
+    assert [r["user"] for r in store.session_tail("s1", 2)] == ["q7", "q10"]
+    assert [r["user"] for r in store.session_range("s0", after_id=1, before_id=10)] == ["q3", "q6"]
+    assert store.session_tail("missing", 5) == []
+
+
+def test_iter_raw_is_ndjson(store):
+    _fill(store, 4)
+    lines = list(store.iter_raw(cursor=2))
+    assert [json.loads(line)["user"] for line in lines] == ["q2", "q3"]
+    assert all(line.endswith(b"\n") for line in lines)
+
+
+def test_segments_roll_over_and_reload(tmp_path):
+    directory = tmp_path / "memory"
+    store = SegmentLogStore(directory, segment_max_bytes=256)
+    _fill(store, 20, session_every=2)
+    store.close()
+    assert len(list(directory.glob("segment-*.jsonl"))) > 1
+
+    reopened = SegmentLogStore(directory, segment_max_bytes=256)
+    assert len(reopened) == 20
+    assert [r["user"] for r in reopened.session_tail("s1", 2)] == ["q17", "q19"]
+    record = reopened.append("next", "turn")
+    assert record["id"] == 21
+    assert reopened.query(cursor=20)[0][0]["user"] == "next"
+    reopened.close()
+
+
+def test_torn_last_line_is_truncated_on_load(tmp_path):
+    directory = tmp_path / "memory"
+    store = SegmentLogStore(directory)
+    _fill(store, 3)
+    store.close()
+    segment = next(directory.glob("segment-*.jsonl"))
+    with open(segment, "ab") as f:
+        f.write(b'{"id": 4, "ts": 10')
+
+    reopened = SegmentLogStore(directory)
+    assert len(reopened) == 3
+    reopened.append("q3", "a3")
+    assert [r["user"] for r in reopened.iter_records()] == ["q0", "q1", "q2", "q3"]
+    reopened.close()
+
+
+def test_concurrent_reads_while_appending(tmp_path):
+    store = SegmentLogStore(tmp_path / "memory", segment_max_bytes=512)
+    _fill(store, 50)
+    errors = []
+
+    def reader():
+        try:
+            for _ in range(20):
+                records = list(store.iter_records())
+                assert [r["id"] for r in records] == list(range(1, len(records) + 1))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for i in range(50):
+        store.append(f"w{i}", "x")
+    for t in threads:
+        t.join()
+    store.close()
+    assert errors == []
+
+
+def test_migrate_legacy_json(tmp_path, store):
+    legacy = tmp_path / "memory.json"
+    legacy.write_text(json.dumps({"history": [
+        {"user": "hi", "bot": "hello", "time": "09:30 01/02/24"},
+        {"user": "no time", "bot": "kept"},
+        "not a turn",
+        {"user": "later", "bot": {"rows": [1.5, float("nan")]}, "time": "10:00 01/02/24"},
+    ]}), encoding="utf-8")
+
+    assert migrate_legacy_json(store, legacy) == 3
+    records = list(store.iter_records())
+    assert [r["user"] for r in records] == ["hi", "no time", "later"]
+    assert records[1]["ts"] == records[0]["ts"]
+    assert records[2]["ts"] > records[1]["ts"]
+    assert records[2]["bot"] == {"rows": [1.5, None]}
+    assert migrate_legacy_json(store, tmp_path / "absent.json") == 0
+
+
+def test_session_range_limit_keeps_newest(store):
+    for i in range(10):
+        store.append(f"q{i}", f"a{i}", session_id="s" if i % 2 == 0 else "o")
+    # session "s" có id 1, 3, 5, 7, 9
+    assert [r["user"] for r in store.session_range("s", after_id=1, before_id=9, limit=2)] == ["q4", "q6"]
+    assert [r["user"] for r in store.session_range("s", limit=10)] == ["q0", "q2", "q4", "q6", "q8"]
+    assert store.session_range("s", after_id=9) == []
+
+
+def test_incomplete_backend_fails_at_instantiation():
+    class AppendOnly(MemoryStore):
+        def append(self, user_msg, bot_reply, ts=None, time_str=None, session_id=None):
+            pass
+
+    with pytest.raises(TypeError, match="session_range"):
+        AppendOnly()
+    with pytest.raises(TypeError):
+        MemoryStore()
@@ -0,0 +1,28 @@
+import os
+import sys
+import subprocess
+
+from app.utils import ocr
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_omp_limit_only_in_tesseract_env():
+    assert ocr.pytesseract.Output.DICT  # load pytesseract qua LazyModule (chạy _configure_tesseract)
+    env = ocr.pytesseract.pytesseract.subprocess_args()["env"]
+    assert env["OMP_THREAD_LIMIT"] == ocr.OCR_OMP_THREAD_LIMIT
+
+
+def test_ocr_import_keeps_process_env():
+    env = {k: v for k, v in os.environ.items() if k != "OMP_THREAD_LIMIT"}
+    code = ("import os; from app.utils import ocr; ocr.pytesseract.Output; "
+            "print(os.environ.get('OMP_THREAD_LIMIT'))")
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True)
+    assert out.stdout.strip() == "None", out.stderr
+
+
+def test_tile_bounds_overlap_and_cover():
+    assert ocr.tile_bounds(1000, tile_height=800, overlap=120, min_height=1600) == [(0, 1000)]
+    bounds = ocr.tile_bounds(3000, tile_height=800, overlap=120, min_height=1600)
+    assert bounds[0][0] == 0 and bounds[-1][1] == 3000
+    assert all(b[0] == a[1] - 120 for a, b in zip(bounds, bounds[1:]))
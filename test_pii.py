@@ -1,4 +1,97 @@
-from app.utils.pii_utils import mask_pii
+import numpy as np
+import pandas as pd
+import pytest
 
-result = mask_pii("Call me at 090-123-4567 or email john@example.com")
-print(result)
+from app.utils.pii_utils import PIIScanner, mask_dataframe, mask_pii, pii_scanner
+
+
+def test_mask_pii_text():
+    assert mask_pii("Call me at 090-123-4567 or email john@example.com") == \
+        "Call me at <PHONE> or email <EMAIL>"
+
+
+@pytest.mark.parametrize("text, expected, types", [
+    ("Mary Jane@x.com", "Mary <EMAIL>", ["email"]),
+    ("contact Mary Jane at mj@x.com", "contact <NAME> at <EMAIL>", ["email", "name"]),
+    ("John Smith 555.222.1234", "<NAME> <PHONE>", ["phone", "name"]),
+    ("call 5552221234 now", "call <PHONE> now", ["phone"]),
+    ("no pii here", "no pii here", []),
+    ("", "", []),
+])
+def test_mask(text, expected, types):
+    assert pii_scanner.mask(text) == (expected, types)
+
+
+def test_scan_spans_are_ordered_and_disjoint():
+    text = "Mary Jane@x.com, Bob Lee 090-123-4567"
+    spans = pii_scanner.scan(text)
+    assert [(key, text[start:end]) for key, start, end in spans] == [
+        ("email", "Jane@x.com"), ("name", "Bob Lee"), ("phone", "090-123-4567")]
+    assert all(a[2] <= b[1] for a, b in zip(spans, spans[1:]))
+
+
+def test_priority_follows_pattern_order():
+    scanner = PIIScanner({"email": r"\S+@\S+", "name": r"[A-Z][a-z]+ [A-Z][a-z]+"})
+    assert scanner.mask("Mary Jane@x.com") == ("Mary <EMAIL>", ["email"])
+    reversed_priority = PIIScanner({"name": r"[A-Z][a-z]+ [A-Z][a-z]+", "email": r"\S+@\S+"})
+    assert reversed_priority.mask("Mary Jane@x.com") == ("<NAME>@x.com", ["name"])
+
+
+def test_mask_batch_collects_types_in_pattern_order():
+    masked, types = pii_scanner.mask_batch(["Jane Doe", "a@b.io", "plain", "090.123.4567"])
+    assert masked == ["<NAME>", "<EMAIL>", "plain", "<PHONE>"]
+    assert types == ["phone", "email", "name"]
+
+
+def test_match_word():
+    assert pii_scanner.match_word("john@example.com") == "email"
+    assert pii_scanner.match_word("090-123-4567") == "phone"
+    assert pii_scanner.match_word("hello") is None
+
+
+def _frame():
+    return pd.DataFrame({
+        "contact": ["john@example.com", np.nan, "090-123-4567", None, "plain"],
+        "id": [1, 2, 3, 4, 5],
+        "note": pd.array(["Mary Jane", "x", pd.NA, "y", "z"], dtype="string"),
+        "mixed": ["a@b.io", 7, 1.5, "ok", np.nan],
+    })
+
+
+def test_mask_dataframe_keeps_missing_and_non_text_cells():
+    df = _frame()
+    masked, found = mask_dataframe(df, parallel=False)
+    assert found == {"email", "phone", "name"}
+    assert masked["contact"].tolist()[0::2] == ["<EMAIL>", "<PHONE>", "plain"]
+    assert masked["contact"].isna().tolist() == [False, True, False, True, False]
+    assert masked["id"].tolist() == [1, 2, 3, 4, 5]
+    assert masked["note"].dtype == df["note"].dtype
+    assert masked["note"].tolist()[:2] == ["<NAME>", "x"] and masked["note"].isna().sum() == 1
+    assert masked["mixed"].tolist()[:4] == ["<EMAIL>", 7, 1.5, "ok"]
+    # Frame gốc không bị sửa
+    assert df["contact"][0] == "john@example.com"
+
+
+def test_mask_categorical_merges_categories_that_mask_alike():
+    col = pd.Series(["a@x.com", "b@y.org", "keep", "a@x.com", None], dtype="category")
+    masked, found = mask_dataframe(pd.DataFrame({"c": col}))
+    assert found == {"email"}
+    assert masked["c"].dtype == "category"
+    assert sorted(masked["c"].cat.categories) == ["<EMAIL>", "keep"]
+    assert masked["c"].tolist()[:4] == ["<EMAIL>", "<EMAIL>", "keep", "<EMAIL>"]
+    assert pd.isna(masked["c"][4])
+
+
+def test_mask_categorical_without_pii_is_untouched():
+    col = pd.Series(["a", "b", "a"], dtype="category")
+    masked, found = mask_dataframe(pd.DataFrame({"c": col}))
+    assert found == set()
+    assert masked["c"].equals(col)
+
+
+def test_mask_dataframe_parallel_matches_serial():
+    df = pd.concat([_frame()] * 40, ignore_index=True)
+    serial, serial_found = mask_dataframe(df, parallel=False)
+    parallel, parallel_found = mask_dataframe(df, parallel=True)
+    assert parallel_found == serial_found
+    pd.testing.assert_frame_equal(parallel, serial)
@@ -0,0 +1,91 @@
+import numpy as np
+
+from app.utils.response_cache import ResponseCache
+
+
+class FakeEncoder:
+    """
+    Embedding = túi từ (mỗi từ 1 chiều) → câu chỉ khác dấu câu / thứ tự từ có cosine = 1.
+    """
+
+    def __init__(self):
+        self.vocab = {}
+        self.calls = 0
+
+    def encode(self, texts, convert_to_numpy=True):
+        self.calls += 1
+        vectors = np.zeros((len(texts), 32), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().replace("?", " ").split():
+                vectors[row, self.vocab.setdefault(word, len(self.vocab) % 32)] += 1
+        return vectors
+
+
+def test_exact_hit_normalizes_whitespace_and_case():
+    cache = ResponseCache()
+    cache.put("What is  PII?", "answer")
+    assert cache.get("what is pii?") == "answer"
+    assert cache.get("what is pii") is None
+    stats = cache.stats()
+    assert (stats["hits_exact"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_reply_is_masked_before_storing():
+    cache = ResponseCache()
+    cache.put("contact?", "mail john@example.com")
+    assert cache.get("contact?") == "mail <EMAIL>"
+    cache.put("table?", {"not": "text"})
+    assert cache.get("table?") is None
+
+
+def test_expired_entry_is_dropped():
+    cache = ResponseCache(ttl=-1)
+    cache.put("q", "a")
+    assert cache.get("q") is None
+    stats = cache.stats()
+    assert (stats["expired"], stats["entries"], stats["bytes"]) == (1, 0, 0)
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a") == "1"  # a mới dùng → b cũ nhất
+    cache.put("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1" and cache.get("c") == "3"
+    assert cache.stats()["evictions"] == 1
+
+    small = ResponseCache(max_bytes=400)
+    small.put("a", "x" * 100)
+    small.put("b", "y" * 100)
+    assert small.get("a") is None and small.get("b") == "y" * 100
+    small.put("huge", "z" * 1000)  # lớn hơn cả ngân sách → không lưu
+    assert small.get("huge") is None and small.get("b") == "y" * 100
+
+
+def test_semantic_tier_hits_similar_question_and_reuses_embedding():
+    encoder = FakeEncoder()
+    cache = ResponseCache(semantic=True, threshold=0.95, encoder=encoder)
+    assert cache.get("what is the refund policy?") is None
+    assert cache.get_similar("what is the refund policy?") is None
+    cache.put("what is the refund policy?", "30 days")
+    assert encoder.calls == 1  # put dùng lại embedding đã tính lúc get_similar
+
+    assert cache.get("refund policy, what is the?") is None
+    assert cache.get_similar("refund policy what is the") == "30 days"
+    assert cache.get_similar("how do I reset my password?") is None
+    stats = cache.stats()
+    assert (stats["hits_semantic"], stats["misses"]) == (1, 2)
+
+
+def test_semantic_slots_are_freed_on_eviction():
+    encoder = FakeEncoder()
+    cache = ResponseCache(max_entries=1, semantic=True, encoder=encoder)
+    for question, reply in [("alpha beta", "1"), ("gamma delta", "2")]:
+        cache.get_similar(question)
+        cache.put(question, reply)
+    # alpha beta đã bị evict → slot của nó không còn match
+    assert cache.get_similar("beta alpha") is None
+    assert cache.get_similar("delta gamma") == "2"
+    assert cache._free_slots == [0]  # slot cũ được tái sử dụng cho lần put sau
@@ -0,0 +1,35 @@
+import hashlib
+import tempfile
+
+from app.utils import uploads
+from app.utils.uploads import save_upload
+
+
+def _spooled(data, max_size=1024):
+    src = tempfile.SpooledTemporaryFile(max_size=max_size)
+    src.write(data)
+    src.seek(0)
+    return src
+
+
+def test_small_upload_is_read_once_without_rollover(tmp_path):
+    data = b"x" * 500
+    src = _spooled(data)
+    result = save_upload(src, tmp_path / "small.bin")
+    assert result["in_memory"] and result["bytes"] == len(data)
+    assert result["sha256"] == hashlib.sha256(data).hexdigest()
+    assert (tmp_path / "small.bin").read_bytes() == data
+    # Kích thước đọc qua seek/tell → file nhỏ vẫn nằm trong RAM
+    assert not src._rolled
+
+
+def test_large_upload_is_copied_in_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_DECODE_IN_MEMORY_BYTES", 1000)
+    monkeypatch.setattr(uploads, "UPLOAD_CHUNK_BYTES", 256)
+    data = bytes(range(256)) * 20
+    src = _spooled(data)
+    src.read(100)  # vị trí đọc bất kỳ → vẫn copy từ đầu file
+    result = save_upload(src, tmp_path / "large.bin")
+    assert not result["in_memory"] and result["bytes"] == len(data)
+    assert result["sha256"] == hashlib.sha256(data).hexdigest()
+    assert (tmp_path / "large.bin").read_bytes() == data